@@ -1,10 +1,8 @@
 import logging
 import os
 
-import jwt
 from flask import (
     Flask,
-    current_app,
     g,
     jsonify,
     make_response,
@@ -16,12 +14,18 @@ from flask_smorest import Api
 from jwt import ExpiredSignatureError, InvalidTokenError
 
 from app.base import drop_db, drop_everything, engine, session
+from app.commands import register_commands
 from app.events import register_events
 from app.finance.system_balance_accounts import create_system_balance_accounts
+from app.finance.ledger import create_ledger
+from app.finance.turnover import create_account_turnover
 from app.init_db import init_db
-from app.jobs import create_working_days_for_all_staff_task, scheduled_auto_charge_task
-from app.user.models import User
+from app.job.scheduler import catch_up_all, run_leader_job
+from app.jobs import SCHEDULED_CRON
+from app.user.auth import get_current_user
 from app.utils.exc import CustomError
+from app.utils.perf import init_perf
+from app.warehouse.utils import create_stock_balance
 
 scheduler = APScheduler()
 
@@ -31,30 +35,26 @@ def create_app():
 
     scheduler.init_app(app)
 
-    def sync_charge_job():
-        with app.app_context():
-            scheduled_auto_charge_task()
-
-    def sync_working_schedule():
-        with app.app_context():
-            create_working_days_for_all_staff_task()
-
-    if not scheduler.get_job("auto_charge_job"):
-        scheduler.add_job(
-            id="auto_charge_job",
-            func=sync_charge_job,
-            trigger="cron",
-            minute="0",
-            hour="0",
-        )
+    # задачи выполняет только процесс-лидер (pg_advisory_lock), каждая -
+    # не больше одного раза за дату, пропущенные дни догоняются
+    for job_id, name, hour, minute in SCHEDULED_CRON:
+        if not scheduler.get_job(job_id):
+            scheduler.add_job(
+                id=job_id,
+                func=run_leader_job,
+                args=(app, name),
+                trigger="cron",
+                minute=minute,
+                hour=hour,
+            )
 
-    if not scheduler.get_job("auto_create_working_schedule_job"):
+    if not scheduler.get_job("scheduled_catch_up_job"):
         scheduler.add_job(
-            id="auto_create_working_schedule_job",
-            func=sync_working_schedule,
-            trigger="cron",
-            minute="0",
-            hour="1",
+            id="scheduled_catch_up_job",
+            func=catch_up_all,
+            args=(app,),
+            trigger="interval",
+            minutes=10,
         )
 
     if not scheduler.running:
@@ -67,12 +67,17 @@ def create_app():
     init_db()
 
     create_system_balance_accounts(session)
+    create_stock_balance(session)
+    create_account_turnover(session)
+    create_ledger(session)
 
     from app.register_bps import reg_bps
 
     api = reg_bps(api)
 
     register_events()
+    register_commands(app)
+    init_perf(app)
 
     @app.after_request
     def after_request_func(response):
@@ -104,14 +109,9 @@ def create_app():
 
     @app.before_request
     def load_user():
-        token = request.headers.get("x-access-token")
-        if token:
+        if request.headers.get("x-access-token"):
             try:
-                data = jwt.decode(
-                    token, current_app.config.get("SECRET_KEY"), algorithms=["HS256"]
-                )
-                user_id = data["public_id"]
-                g.user = User.query.get(user_id)
+                g.user = get_current_user()
             except (ExpiredSignatureError, InvalidTokenError) as e:
                 app.logger.error(f"JWT Error: {e}")
                 g.user = None
@@ -1,6 +1,7 @@
+import os
 from contextlib import contextmanager
 
-from sqlalchemy import DateTime, create_engine
+from sqlalchemy import DateTime, Index, create_engine, event, text
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import (
     DeclarativeBase,
@@ -17,6 +18,8 @@ import enum
 from app.config.main import SQLALCHEMY_URI
 from app.utils.exc import ItemNotFoundError
 
+# SQLALCHEMY_URI окружения - другая база без правки config/main.py (тесты)
+SQLALCHEMY_URI = os.environ.get("SQLALCHEMY_URI", SQLALCHEMY_URI)
 engine = create_engine(SQLALCHEMY_URI, pool_recycle=1800, pool_size=20, max_overflow=0)
 session_factory = sessionmaker(bind=engine)
 session = scoped_session(session_factory)
@@ -108,7 +111,7 @@ class Base(DeclarativeBase):
         return updated_columns
 
     @classmethod
-    def get_by_id(cls, ident, _type=int):
+    def get_by_id(cls, ident, _type=int, options=()):
         if _type == int:
             try:
                 ident = int(ident)
@@ -116,14 +119,14 @@ class Base(DeclarativeBase):
                 raise ItemNotFoundError(
                     f"Not found {cls.__tablename__} with id: {ident}"
                 )
-        res = cls.query.get(ident)
+        res = cls.query.options(*options).get(ident)
         if not res:
             raise ItemNotFoundError(f"Not found {cls.__tablename__} with id: {ident}")
         return res
 
     @classmethod
-    def get_or_404(cls, pk):
-        instance = cls.query.get(pk)
+    def get_or_404(cls, pk, options=()):
+        instance = cls.query.options(*options).get(pk)
         if not instance:
             abort(404)
         else:
@@ -145,6 +148,34 @@ class Base(DeclarativeBase):
             session.commit()
 
 
+def _create_trgm_extension(target, connection, **kw):
+    """pg_trgm для индексов ilike '%...%', если расширение есть на сервере"""
+    available = connection.scalar(
+        text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    )
+    if available:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+
+event.listen(Base.metadata, "before_create", _create_trgm_extension)
+
+
+def _has_trgm(ddl, target, bind, **kw):
+    return bind is not None and bool(
+        bind.scalar(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+    )
+
+
+def trigram_index(name, expression):
+    """
+    GIN-индекс pg_trgm по выражению (колонка или, например, "number::text")
+    для поиска ilike '%...%'. Без расширения на сервере не создаётся.
+    """
+    return Index(
+        name, text(f"({expression}) gin_trgm_ops"), postgresql_using="gin"
+    ).ddl_if(callable_=_has_trgm)
+
+
 # for tbl in reversed(Base.metadata.sorted_tables):
 #     engine.execute(tbl.delete())
 
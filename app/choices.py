@@ -25,6 +25,12 @@ class DebtTypes(Enum):
     PART = "part"
 
 
+class StockItemTypes(Enum):
+    PRODUCT = "product"
+    CONTAINER = "container"
+    PART = "part"
+
+
 class Statuses(Enum):
     ON = "on"
     OFF = "off"
@@ -96,3 +102,10 @@ class UserTransactionAction(Enum):
 class ClientEntityType(Enum):
     INDIVIDUAL = "individual"
     LEGAL = "legal"
+
+
+class JobStatuses(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
@@ -4,12 +4,14 @@ from typing import TYPE_CHECKING, List
 
 from app.choices import ClientEntityType
 from app.utils.mixins import BalanceMixin, HistoryMixin
+from app.utils.references import register_content_type
 from app.base import Base, session
 
 if TYPE_CHECKING:
     from app.region.models import Region
 
 
+@register_content_type
 class Client(Base, BalanceMixin):
     """Клиент"""
 
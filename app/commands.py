@@ -0,0 +1,91 @@
+import click
+from flask import Flask
+
+from app.base import session
+
+
+def register_commands(app: Flask):
+    @app.cli.command("rebuild-stock")
+    def rebuild_stock():
+        """Пересчитать stock_balance по лотам опубликованных накладных"""
+        from app.warehouse.utils import refresh_stock_balance
+
+        refresh_stock_balance(session)
+        session.commit()
+        click.echo("stock_balance rebuilt")
+
+    @app.cli.command("rebuild-turnover")
+    def rebuild_turnover():
+        """Пересчитать account_turnover по опубликованным транзакциям"""
+        from app.finance.turnover import refresh_turnover
+
+        refresh_turnover(session)
+        session.commit()
+        click.echo("account_turnover rebuilt")
+
+    @app.cli.command("open-ledger")
+    def open_ledger_command():
+        """Перенести опубликованные транзакции и начальные остатки в журнал проводок"""
+        from app.finance.ledger import open_ledger
+
+        adjusted = open_ledger(session)
+        session.commit()
+        click.echo(f"ledger opened, {adjusted} opening balances")
+
+    @app.cli.command("reconcile-balances")
+    @click.option("--fix", is_flag=True, help="Исправить балансы по транзакциям")
+    def reconcile_balances_command(fix):
+        """Сверить балансы счетов с опубликованными транзакциями"""
+        from app.finance.ledger import reconcile_balances
+
+        rows = reconcile_balances(session, fix=fix)
+        for account_type, account_id, balance, expected in rows:
+            click.echo(f"{account_type} #{account_id}: {balance} != {expected}")
+        session.commit()
+        click.echo(f"{len(rows)} mismatches{' fixed' if fix and rows else ''}")
+
+    @app.cli.command("snapshot-balances")
+    @click.option("--date", "day", type=click.DateTime(["%Y-%m-%d"]), default=None)
+    def snapshot_balances_command(day):
+        """Снимок балансов на конец дня (по умолчанию - вчера)"""
+        from app.finance.ledger import snapshot_balances
+
+        snapshot_balances(session, day.date() if day else None)
+        session.commit()
+        click.echo("balances snapshot saved")
+
+    @app.cli.command("create-work-schedules")
+    @click.option("--from", "start", type=click.DateTime(["%Y-%m-%d"]), required=True)
+    @click.option("--to", "end", type=click.DateTime(["%Y-%m-%d"]), default=None)
+    def create_work_schedules_command(start, end):
+        """Рабочие дни сотрудников на период --from..--to (включительно)"""
+        from app.user.utils import create_work_schedules
+
+        rows = create_work_schedules(
+            session, start.date(), end.date() if end else None
+        )
+        session.commit()
+        click.echo(f"{rows} work schedules created")
+
+    @app.cli.command("run-scheduled")
+    @click.argument("name")
+    @click.option("--date", "day", type=click.DateTime(["%Y-%m-%d"]), default=None)
+    @click.option("--until", type=click.DateTime(["%Y-%m-%d"]), default=None)
+    def run_scheduled_command(name, day, until):
+        """
+        Выполнить задачу по расписанию за --date или догнать пропущенные
+        дни до --until (по умолчанию - сегодня); выполненные даты пропускаются
+        """
+        from app.job.scheduler import SCHEDULED_JOBS, catch_up, run_scheduled
+
+        if name not in SCHEDULED_JOBS:
+            raise click.BadParameter(f"one of {', '.join(SCHEDULED_JOBS)}")
+        if day:
+            run = run_scheduled(session, name, day.date())
+            runs = [run] if run else []
+        else:
+            runs = catch_up(session, name, until.date() if until else None)
+        for run in runs:
+            click.echo(f"{run.run_date}: {run.status.value}, {run.rows} rows")
+        if not runs:
+            click.echo("nothing to run")
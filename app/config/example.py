@@ -24,3 +24,8 @@ API_SPEC_OPTIONS = {
         }
     },
 }
+# В тестах: падать, если эндпоинт превысил бюджет SQL-запросов (query_budget)
+QUERY_BUDGET_CHECK = False
+# История: "sync" - в той же транзакции, "async" - фоновым потоком после коммита
+HISTORY_WRITER_MODE = "sync"
+HISTORY_QUEUE_SIZE = 1000
@@ -1,9 +1,6 @@
-from flask import current_app, g
 from sqlalchemy import event
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import sessionmaker
 
-from app.base import Base, engine, session
+from app.base import engine, session
 from app.choices import CrudOperations
 from app.finance.models import (
     CashRegister,
@@ -14,149 +11,113 @@ from app.finance.models import (
     TransactionHistory,
 )
 from app.user.models import Department, DepartmentHistory, User, UserHistory
-
-Session = sessionmaker(bind=engine)
-
-
-def create_history_data(model: Base, action, target, extra_fields):
-    res = {
-        "model": model,
-        "data": {
-            "user_id": g.user.id if hasattr(g, "user") else None,
-            "operation_status": action,
-            "data": target.get_temp_data("history_data"),
-            "user_full_name": g.user.full_name if hasattr(g, "user") else None,
-        },
-    }
-    target.clear_temp_data()
-    # merge two default history data with extra
-    res["data"] = {**res["data"], **extra_fields}
-    return res
-
-
-def register_events():  # noqa: C901
-    @event.listens_for(Transaction, "after_insert")
-    @event.listens_for(Transaction, "after_update")
-    def prepare_data_for_transaction(mapper, connection, target):
-        action = (
-            CrudOperations.CREATED if not target.histories else CrudOperations.UPDATED
-        )
-        if not hasattr(g, "history_to_commit"):
-            g.history_to_commit = []
-        g.history_to_commit.append(
-            create_history_data(
-                model=TransactionHistory,
-                action=action,
-                target=target,
-                extra_fields={"status": target.status, "transaction_id": target.id},
-            )
-        )
-
-    @event.listens_for(CashRegister, "after_insert")
-    @event.listens_for(CashRegister, "after_update")
-    def prepare_data_for_cash_register(mapper, connection, target):
-        action = (
-            CrudOperations.CREATED if not target.histories else CrudOperations.UPDATED
-        )
-        if not hasattr(g, "history_to_commit"):
-            g.history_to_commit = []
-        g.history_to_commit.append(
-            create_history_data(
-                model=CashRegisterHistory,
-                action=action,
-                target=target,
-                extra_fields={"cash_register_id": target.id},
-            )
-        )
-
-    @event.listens_for(Counterparty, "after_insert")
-    @event.listens_for(Counterparty, "after_update")
-    def prepare_data_for_counterparty(mapper, connection, target):
-        action = (
-            CrudOperations.CREATED if not target.histories else CrudOperations.UPDATED
-        )
-        if not hasattr(g, "history_to_commit"):
-            g.history_to_commit = []
-
-        g.history_to_commit.append(
-            create_history_data(
-                model=CounterpartyHistory,
-                action=action,
-                target=target,
-                extra_fields={"status": target.status, "counterparty_id": target.id},
-            )
-        )
-
-    @event.listens_for(User, "after_insert")
-    @event.listens_for(User, "after_update")
-    def prepare_data_for_user(mapper, connection, target):
-        action = (
-            CrudOperations.CREATED if not target.histories else CrudOperations.UPDATED
-        )
-        if not hasattr(g, "history_to_commit"):
-            g.history_to_commit = []
-
-        g.history_to_commit.append(
-            create_history_data(
-                model=UserHistory,
-                action=action,
-                target=target,
-                extra_fields={"user_id": target.id},
-            )
-        )
-
-    @event.listens_for(Department, "after_insert")
-    @event.listens_for(Department, "after_update")
-    def prepare_data_for_department(mapper, connection, target):
-        action = (
-            CrudOperations.CREATED if not target.histories else CrudOperations.UPDATED
-        )
-        if not hasattr(g, "history_to_commit"):
-            g.history_to_commit = []
-
-        g.history_to_commit.append(
-            create_history_data(
-                model=DepartmentHistory,
-                action=action,
-                target=target,
-                extra_fields={"department_id": target.id},
-            )
-        )
+from app.utils.history import (
+    add_history,
+    discard_history,
+    enqueue_history,
+    flush_history,
+    register_history_model,
+)
+from app.utils.references import clear_resolved
+
+
+def reg_history(model, history_model, extra_fields):
+    """История model: действие определяется типом события"""
+    register_history_model(model, history_model, extra_fields)
+
+    def listener(action):
+        def add_history_row(mapper, connection, target):
+            add_history(session, history_model, target, action, extra_fields(target))
+
+        return add_history_row
+
+    event.listen(model, "after_insert", listener(CrudOperations.CREATED))
+    event.listen(model, "after_update", listener(CrudOperations.UPDATED))
+
+
+def register_events():
+    reg_history(
+        Transaction,
+        TransactionHistory,
+        lambda target: {"status": target.status, "transaction_id": target.id},
+    )
+    reg_history(
+        CashRegister,
+        CashRegisterHistory,
+        lambda target: {"cash_register_id": target.id},
+    )
+    reg_history(
+        Counterparty,
+        CounterpartyHistory,
+        lambda target: {"status": target.status, "counterparty_id": target.id},
+    )
+    reg_history(User, UserHistory, lambda target: {"user_id": target.id})
+    reg_history(
+        Department,
+        DepartmentHistory,
+        lambda target: {"department_id": target.id},
+    )
+
+    # Строки истории пишутся одним INSERT на таблицу в той же транзакции
+    # (или после коммита фоновым потоком при HISTORY_WRITER_MODE = "async")
+    @event.listens_for(session, "after_flush_postexec")
+    def write_history_rows(session, flush_context):
+        flush_history(session)
+
+    # строки, добавленные вне flush (проводки), если перед коммитом нечего flush-ить
+    @event.listens_for(session, "before_commit")
+    def write_pending_history_rows(session):
+        flush_history(session)
 
     @event.listens_for(session, "after_commit")
-    def insert_additional_data(session):
-        # Проверяем наличие данных в g.history_to_commit
-        if hasattr(g, "history_to_commit") and g.history_to_commit:
-            try:
-                # Используем сессию вне слушателя для добавления данных после коммита
-                with Session() as new_session:
-                    for item in g.history_to_commit:
-                        if item["data"]["data"] is None:
-                            break
-                        model = item["model"]
-                        data = item["data"]
-                        instance = model(**data)
-                        new_session.add(instance)
-                    new_session.commit()  # Закоммитим данные после основного коммита
-            except (AttributeError, SQLAlchemyError) as e:
-                current_app.logger.error(str(e.args))
-                new_session.rollback()  # Откатываем транзакцию, если произошла ошибка
-            finally:
-                new_session.close()
+    def enqueue_history_rows(session):
+        enqueue_history(session)
 
+    @event.listens_for(session, "after_rollback")
+    def discard_history_rows(session):
+        discard_history(session)
+
+    # объекты по (content_type, object_id) запоминаются до конца транзакции
+    @event.listens_for(session, "after_transaction_end")
+    def clear_resolved_references(session, transaction):
+        if transaction.parent is None:
+            clear_resolved(session)
+
+    reg_ledger_events()
     reg_invoice_events()
+    reg_product_unit_events()
+    reg_stock_events()
+    reg_query_budget_events()
+    reg_auth_events()
+
+
+def reg_ledger_events():
+    from app.finance.ledger import record_adjustments
+
+    # Изменения balance через ORM попадают в журнал проводок корректировкой
+    @event.listens_for(session, "after_flush")
+    def record_balance_adjustments(session, flush_context):
+        record_adjustments(session)
 
 
 def reg_invoice_events():
-    from app.invoice.models import Invoice
+    from app.invoice.utils import collect_dirty_invoices, flush_dirty_invoices
+    from app.product.fifo import invalidate_lot_quotes
     from app.product.models import ContainerLot, PartLot, ProductLot
 
-    # Обработчик событий на изменение инвойсов
-    @event.listens_for(Invoice, "after_insert")
-    @event.listens_for(Invoice, "after_update")
-    def update_invoice_fields_self(mapper, connection, target):
-        if target:
-            target.update_fields()
+    # Количество и сумма накладных пересчитываются одним UPDATE перед коммитом
+    # по накладным, чьи лоты менялись в транзакции
+    @event.listens_for(session, "after_flush")
+    def mark_dirty_invoices(session, flush_context):
+        collect_dirty_invoices(session)
+
+    @event.listens_for(session, "before_commit")
+    def recalc_dirty_invoices(session):
+        flush_dirty_invoices(session)
+
+    @event.listens_for(session, "after_rollback")
+    def clear_dirty_invoices(session):
+        session.info.pop("dirty_invoices", None)
 
     # Обработчик событий на изменение лотов
     @event.listens_for(ProductLot, "after_insert")
@@ -168,9 +129,52 @@ def reg_invoice_events():
     @event.listens_for(PartLot, "after_insert")
     @event.listens_for(PartLot, "after_update")
     @event.listens_for(PartLot, "after_delete")
-    def update_invoice_fields(mapper, connection, target):
+    def invalidate_quotes(mapper, connection, target):
         # target — это объект лота (ProductLot, ContainerLot, или PartLot)
-        # Получаем связанный invoice и обновляем количество
-        invoice = target.invoice
-        if invoice:
-            invoice.update_fields()
+        invalidate_lot_quotes(target)
+
+
+def reg_product_unit_events():
+    from app.product.units import save_pending_units
+
+    # Единицы продукции новых лотов пишутся пачкой, а не объектом на маркировку
+    @event.listens_for(session, "after_flush")
+    def write_pending_units(session, flush_context):
+        save_pending_units(session)
+
+
+def reg_stock_events():
+    from app.warehouse.utils import collect_stock_changes, flush_stock_changes
+
+    # Остатки складов (stock_balance) обновляются в той же транзакции
+    @event.listens_for(session, "before_flush")
+    def collect_stock_balance(session, flush_context, instances):
+        collect_stock_changes(session)
+
+    @event.listens_for(session, "after_flush")
+    def update_stock_balance(session, flush_context):
+        flush_stock_changes(session)
+
+
+def reg_query_budget_events():
+    from app.utils.loading import count_query
+
+    # Подсчёт запросов для query_budget
+    event.listen(engine, "before_cursor_execute", count_query)
+
+
+def reg_auth_events():
+    from app.user.auth import invalidate_user
+    from app.user.models import Permission
+
+    # Кэш пользователей для авторизации сбрасывается при изменениях
+    @event.listens_for(User, "after_update")
+    @event.listens_for(User, "after_delete")
+    def invalidate_cached_user(mapper, connection, target):
+        invalidate_user(target.id)
+
+    @event.listens_for(Permission, "after_insert")
+    @event.listens_for(Permission, "after_update")
+    @event.listens_for(Permission, "after_delete")
+    def invalidate_cached_permission(mapper, connection, target):
+        invalidate_user(target.user_id)
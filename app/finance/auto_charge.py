@@ -0,0 +1,78 @@
+import random
+import string
+from datetime import date, datetime
+
+from sqlalchemy import Date, Interval, cast, func, select
+
+from app.choices import TransactionStatuses
+from app.finance.ledger import post_transactions
+from app.finance.models import BalanceAccount, Counterparty
+from app.utils.exc import ItemNotFoundError
+
+# счёт баланса, на который начисляются авто-транзакции
+AUTO_CHARGE_ACCOUNT = "Постоянные расходы"
+
+
+def _months(count):
+    return cast(func.concat(count, " months"), Interval)
+
+
+def create_auto_charges(db_session, run_date):
+    """
+    Ежедневное начисление контрагентам с auto_charge: сумма начисления,
+    делённая на число дней периода (charge_period_months с месяца создания).
+    Суммы считаются одним запросом, транзакции проводятся post_transactions;
+    ключ (контрагент, дата) - повторный запуск за дату ничего не создаёт.
+    Возвращает число созданных транзакций.
+    """
+    debit_object = db_session.scalars(
+        select(BalanceAccount).where(BalanceAccount.name == AUTO_CHARGE_ACCOUNT)
+    ).first()
+    if debit_object is None:
+        raise ItemNotFoundError(f"Balance account {AUTO_CHARGE_ACCOUNT} not found")
+
+    period_start = func.date_trunc("month", Counterparty.created_at)
+    period_days = cast(
+        period_start + _months(Counterparty.charge_period_months), Date
+    ) - cast(period_start, Date)
+    charges = db_session.execute(
+        select(
+            Counterparty.id,
+            Counterparty.name,
+            (Counterparty.charge_amount / period_days).label("amount"),
+        ).where(
+            Counterparty.auto_charge.is_(True),
+            Counterparty.charge_period_months > 0,
+            # дата начисления не позже даты создания + месяцы начисления
+            func.date(
+                Counterparty.created_at + _months(Counterparty.charge_period_months)
+            )
+            >= run_date,
+        )
+    ).all()
+
+    # догоняющий запуск за прошлый день проводит начисление датой run_date
+    published_date = datetime.now()
+    if run_date != date.today():
+        published_date = datetime.combine(run_date, published_date.time())
+    return len(
+        post_transactions(
+            db_session,
+            [
+                {
+                    "credit_content_type": "Counterparty",
+                    "credit_object_id": charge.id,
+                    "debit_content_type": "BalanceAccount",
+                    "debit_object_id": debit_object.id,
+                    "status": TransactionStatuses.PUBLISHED,
+                    "published_date": published_date,
+                    "amount": charge.amount,
+                    "credit_name": charge.name,
+                    "debit_name": debit_object.name,
+                    "number_transaction": "".join(random.choices(string.digits, k=6)),
+                    "idempotency_key": f"auto_charge:{charge.id}:{run_date}",
+                }
+                for charge in charges
+            ],
+        )
+    )
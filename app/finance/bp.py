@@ -1,7 +1,9 @@
+from datetime import datetime, time, timedelta
+
 from flask import jsonify, request
 from flask.views import MethodView
 from flask_smorest import Blueprint
-from sqlalchemy import Date, and_, cast, func, or_
+from sqlalchemy import and_, or_
 
 from app.base import session
 from app.choices import AccountCategories, Statuses
@@ -47,11 +49,20 @@ from app.finance.schema import (
     TransactionCommentCreateSchema,
     TransactionCreateUpdateSchema,
     TransactionRetrieveSchema,
+    TurnoverArgsSchema,
+    TurnoverSchema,
 )
+from app.finance.ledger import account_balance
+from app.finance.turnover import get_account_turnover, get_turnover_days
 from app.finance.utils import TRANSACTION_DEBIT_CREDIT_CATEGORIES
 from app.user.models import Salary
+from app.search.utils import search_filter
+from app.utils.filters import date_between
+from app.utils.exc import ItemNotFoundError
 from app.utils.func import hash_image_save, sql_exception_handler, token_required
+from app.utils.loading import eager_load_options, query_budget
 from app.utils.mixins import CustomMethodPaginationView
+from app.utils.references import resolve_many
 from app.utils.schema import ResponseSchema
 
 finance = Blueprint(
@@ -168,7 +179,7 @@ class CashRegisterByIdView(MethodView):
     def get(c, self, id):
         """Get cash_register by ID"""
 
-        item = CashRegister.get_or_404(id)
+        item = CashRegister.get_or_404(id, options=eager_load_options(CashRegisterRetrieveSchema))
         return item
 
     @token_required
@@ -324,7 +335,7 @@ class TransactionView(CustomMethodPaginationView):
             lst.append(self.model.category == category)
 
         if start_date and end_date:
-            lst.append(cast(self.model.created_at, Date).between(start_date, end_date))
+            lst.append(date_between(self.model.created_at, start_date, end_date))
 
         # если в качестве категории будет Юзер то нужно его поменять на Salary
         # потому что в ней баланс юзера
@@ -335,15 +346,10 @@ class TransactionView(CustomMethodPaginationView):
             )
 
         if search_term:
-            lst.append(
-                or_(
-                    Transaction.debit_name.ilike(f"%{search_term}%"),
-                    Transaction.credit_name.ilike(f"%{search_term}%"),
-                )
-            )
+            lst.append(search_filter("transaction", search_term))
 
         if created_date:
-            lst.append(func.date(self.model.created_at) == created_date)
+            lst.append(date_between(self.model.created_at, created_date))
         if status:
             lst.append(self.model.status == status)
         if category_name and category_object_id:
@@ -371,16 +377,16 @@ class TransactionView(CustomMethodPaginationView):
         """Add a new transaction"""
         new_data["credit_content_type"] = new_data.pop("credit_category")
         new_data["debit_content_type"] = new_data.pop("debit_category")
-        credit_name = (
-            session.query(globals()[new_data["credit_content_type"]])
-            .get(new_data["credit_object_id"])
-            .name
-        )
-        debit_name = (
-            session.query(globals()[new_data["debit_content_type"]])
-            .get(new_data["debit_object_id"])
-            .name
-        )
+        references = [
+            (new_data["credit_content_type"], new_data["credit_object_id"]),
+            (new_data["debit_content_type"], new_data["debit_object_id"]),
+        ]
+        resolved = resolve_many(session, references)
+        credit_object, debit_object = (resolved[key] for key in references)
+        if credit_object is None or debit_object is None:
+            raise ItemNotFoundError("Credit or debit object not found")
+        credit_name = credit_object.name
+        debit_name = debit_object.name
         transaction = Transaction(
             **new_data,
             category=AccountCategories.USER,
@@ -405,6 +411,37 @@ def get_counterparties_for_transaction():
     return schema.dump(counterparties, many=True)
 
 
+@finance.get("/turnover")
+@token_required
+@finance.arguments(TurnoverArgsSchema, location="query")
+@finance.response(200, TurnoverSchema)
+def get_turnover(c, args):
+    """Incomes and expenses of an account for a period, total and by days"""
+    account_type = args["account_type"]
+    account_id = args["account_id"]
+    start_date = args.get("start_date")
+    end_date = args.get("end_date")
+    # остатки на начало и конец периода - по снимкам балансов и журналу
+    opening = None
+    if start_date:
+        opening = account_balance(
+            session, account_type, account_id, datetime.combine(start_date, time())
+        )
+    closing_at = None
+    if end_date:
+        closing_at = datetime.combine(end_date + timedelta(days=1), time())
+    return {
+        "account_type": account_type,
+        "account_id": account_id,
+        "opening_balance": opening,
+        "closing_balance": account_balance(
+            session, account_type, account_id, closing_at
+        ),
+        **get_account_turnover(account_type, account_id, start_date, end_date),
+        "days": get_turnover_days(account_type, account_id, start_date, end_date),
+    }
+
+
 @finance.put("/cancel_transaction/<int:id>")
 @sql_exception_handler
 @token_required
@@ -428,11 +465,12 @@ def cancel_transaction(c, id):
 @finance.route("/transaction/<int:id>")
 class TransactionByIdView(MethodView):
     @token_required
+    @query_budget(6)
     @finance.response(200, TransactionRetrieveSchema)
     def get(c, self, id):
         """Get transaction by ID"""
 
-        item = Transaction.get_or_404(id)
+        item = Transaction.get_or_404(id, options=eager_load_options(TransactionRetrieveSchema))
 
         return item
 
@@ -505,7 +543,7 @@ class CounterpartyView(CustomMethodPaginationView):
         lst = []
 
         if created_date:
-            lst.append(func.date(self.model.created_at) == created_date)
+            lst.append(date_between(self.model.created_at, created_date))
         if category:
             lst.append(self.model.category == category)
         if status:
@@ -522,7 +560,9 @@ class CounterpartyView(CustomMethodPaginationView):
         """Add a new counterparty"""
         counterparty = Counterparty(**new_data, category=AccountCategories.USER)
         session.add(counterparty)
-        counterparty.add_temp_data("history_data", counterparty)
+        counterparty.add_temp_data(
+            "history_data", CounterpartySchema().dump(counterparty)
+        )
         session.commit()
         return counterparty
 
@@ -534,7 +574,7 @@ class CounterPartyByIdView(MethodView):
     def get(c, self, id):
         """Get counterparty by ID"""
 
-        item = Counterparty.get_or_404(id)
+        item = Counterparty.get_or_404(id, options=eager_load_options(CounterpartyRetrieveSchema))
         return item
 
     @token_required
@@ -0,0 +1,512 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import (
+    Date,
+    Float,
+    Integer,
+    and_,
+    cast,
+    column,
+    func,
+    insert,
+    inspect,
+    literal,
+    select,
+    union_all,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.choices import CrudOperations, TransactionStatuses
+from app.finance.models import BalanceSnapshot, LedgerEntry, Transaction
+from app.finance.turnover import add_turnover, add_turnovers
+from app.utils.history import add_model_history, add_row_history, has_history
+from app.utils.references import CONTENT_TYPES, content_type_model, resolve
+
+# расхождение баланса меньше этого - ошибка округления float
+RECONCILE_TOLERANCE = 0.01
+
+
+def post_transaction(db_session, transaction, reverse=False):
+    """
+    Проводки транзакции: расход с кредита, приход на дебет
+    (reverse=True - обратные проводки при отмене).
+    Баланс меняется атомарным UPDATE ... SET balance = balance + :x RETURNING,
+    без чтения в Python, поэтому параллельные проводки не теряются,
+    а строка счёта заблокирована только до конца транзакции БД.
+    Счета обновляются в порядке (тип, id) - встречные проводки не дают deadlock.
+    """
+    if transaction.id is None:
+        db_session.add(transaction)
+        db_session.flush()
+    amount = -transaction.amount if reverse else transaction.amount
+    postings = sorted(
+        [
+            (transaction.credit_content_type, transaction.credit_object_id, -amount),
+            (transaction.debit_content_type, transaction.debit_object_id, amount),
+        ]
+    )
+    now = datetime.now()
+    db_session.execute(
+        insert(LedgerEntry),
+        [
+            {
+                "transaction_id": transaction.id,
+                "account_type": account_type,
+                "account_id": account_id,
+                "amount": delta,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for account_type, account_id, delta in postings
+        ],
+    )
+    add_turnover(db_session, transaction, -1 if reverse else 1)
+    for account_type, account_id, delta in postings:
+        _change_balance(db_session, account_type, account_id, delta)
+
+
+def _change_balance(db_session, account_type, account_id, delta):
+    model = content_type_model(account_type)
+    balance = db_session.execute(
+        update(model)
+        .where(model.id == account_id)
+        .values(balance=func.coalesce(model.balance, 0) + delta)
+        .returning(model.balance),
+        execution_options={"synchronize_session": False},
+    ).scalar_one()
+
+    if has_history(model):
+        obj = resolve(db_session, account_type, account_id)
+    else:
+        obj = db_session.identity_map.get(db_session.identity_key(model, account_id))
+    if obj is None:
+        return
+    # баланс уже в БД: объект не должен записать его повторно при flush
+    set_committed_value(obj, "balance", balance)
+    if has_history(model):
+        obj.add_temp_data("history_data", {"balance": balance})
+        add_model_history(db_session, obj, CrudOperations.UPDATED)
+
+
+def post_transactions(db_session, rows):
+    """
+    Массовое создание опубликованных транзакций (rows - значения колонок).
+    Один INSERT транзакций, один - проводок, один upsert оборотов и один
+    UPDATE баланса на тип счёта с суммой изменений по каждому счёту.
+    Строки с уже существующим idempotency_key пропускаются, для созданных
+    пишется история CREATED. Возвращает созданные транзакции (строки RETURNING).
+    """
+    if not rows:
+        return []
+    transactions = db_session.execute(
+        pg_insert(Transaction)
+        .on_conflict_do_nothing(index_elements=["idempotency_key"])
+        .returning(
+            Transaction.id,
+            Transaction.status,
+            Transaction.amount,
+            Transaction.credit_name,
+            Transaction.debit_name,
+            Transaction.published_date,
+            Transaction.created_at,
+            Transaction.debit_content_type,
+            Transaction.debit_object_id,
+            Transaction.credit_content_type,
+            Transaction.credit_object_id,
+        ),
+        rows,
+    ).all()
+    if not transactions:
+        return []
+    now = datetime.now()
+    entries = []
+    deltas = {}
+    for transaction in transactions:
+        # те же данные, что Transaction.format() при создании через API
+        add_row_history(
+            db_session,
+            Transaction,
+            transaction,
+            CrudOperations.CREATED,
+            {
+                "credit_category": transaction.credit_content_type,
+                "debit_category": transaction.debit_content_type,
+                "credit_name": transaction.credit_name,
+                "debit_name": transaction.debit_name,
+                "amount": float(transaction.amount),
+            },
+        )
+        for account_type, account_id, delta in (
+            (
+                transaction.credit_content_type,
+                transaction.credit_object_id,
+                -transaction.amount,
+            ),
+            (
+                transaction.debit_content_type,
+                transaction.debit_object_id,
+                transaction.amount,
+            ),
+        ):
+            entries.append(
+                {
+                    "transaction_id": transaction.id,
+                    "account_type": account_type,
+                    "account_id": account_id,
+                    "amount": delta,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+            deltas.setdefault(account_type, {}).setdefault(account_id, 0)
+            deltas[account_type][account_id] += delta
+    db_session.execute(insert(LedgerEntry), entries)
+    add_turnovers(db_session, transactions)
+    for account_type in sorted(deltas):
+        _change_balances(db_session, account_type, deltas[account_type])
+    return transactions
+
+
+def _change_balances(db_session, account_type, deltas):
+    """balance += delta для {id: delta} счетов одного типа одним UPDATE"""
+    model = content_type_model(account_type)
+    # блокировка строк по порядку id - как у одиночных проводок, без deadlock
+    db_session.execute(
+        select(model.id)
+        .where(model.id.in_(deltas))
+        .order_by(model.id)
+        .with_for_update()
+    )
+    changes = values(
+        column("id", Integer), column("delta", Float), name="changes"
+    ).data(list(deltas.items()))
+    rows = db_session.execute(
+        update(model)
+        .where(model.id == changes.c.id)
+        .values(balance=func.coalesce(model.balance, 0) + changes.c.delta)
+        .returning(*model.__table__.c),
+        execution_options={"synchronize_session": False},
+    ).all()
+    for row in rows:
+        if has_history(model):
+            add_row_history(
+                db_session, model, row, CrudOperations.UPDATED, {"balance": row.balance}
+            )
+        obj = db_session.identity_map.get(db_session.identity_key(model, row.id))
+        if obj is not None:
+            set_committed_value(obj, "balance", row.balance)
+
+
+def record_adjustments(db_session):
+    """
+    after_flush: изменение balance через ORM (баланс при создании
+    контрагента, правка баланса) - проводка-корректировка без транзакции.
+    """
+    rows = []
+    now = datetime.now()
+    for obj in list(db_session.new) + list(db_session.dirty):
+        account_type = type(obj).__name__
+        if CONTENT_TYPES.get(account_type) is not type(obj):
+            continue
+        hist = inspect(obj).attrs.balance.history
+        if not hist.added:
+            continue
+        old = (hist.deleted[0] if hist.deleted else None) or 0
+        delta = (hist.added[0] or 0) - old
+        if delta:
+            rows.append(
+                {
+                    "account_type": account_type,
+                    "account_id": obj.id,
+                    "amount": delta,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+    if rows:
+        db_session.connection().execute(LedgerEntry.__table__.insert(), rows)
+
+
+def _transaction_movements():
+    """Движения по счетам из опубликованных транзакций"""
+    published = Transaction.status == TransactionStatuses.PUBLISHED
+    return union_all(
+        select(
+            Transaction.debit_content_type.label("account_type"),
+            Transaction.debit_object_id.label("account_id"),
+            Transaction.amount.label("amount"),
+        ).where(published),
+        select(
+            Transaction.credit_content_type,
+            Transaction.credit_object_id,
+            -Transaction.amount,
+        ).where(published),
+    )
+
+
+def reconcile_balances(db_session, fix=False):
+    """
+    Сверка balance с суммой опубликованных транзакций и корректировок,
+    одним запросом на вид счёта. fix=True - исправить расхождения
+    одним UPDATE на вид счёта.
+    Возвращает [(тип, id, balance, ожидаемый баланс)].
+    """
+    adjustments = select(
+        LedgerEntry.account_type, LedgerEntry.account_id, LedgerEntry.amount
+    ).where(LedgerEntry.transaction_id.is_(None))
+    movements = union_all(_transaction_movements(), adjustments).subquery()
+
+    res = []
+    for account_type, model in CONTENT_TYPES.items():
+        expected = (
+            select(movements.c.account_id, func.sum(movements.c.amount).label("balance"))
+            .where(movements.c.account_type == account_type)
+            .group_by(movements.c.account_id)
+            .subquery()
+        )
+        expected_balance = func.coalesce(expected.c.balance, 0)
+        rows = db_session.execute(
+            select(model.id, model.balance, expected_balance)
+            .outerjoin(expected, expected.c.account_id == model.id)
+            .where(
+                func.abs(func.coalesce(model.balance, 0) - expected_balance)
+                > RECONCILE_TOLERANCE
+            )
+            .order_by(model.id)
+        ).all()
+        res.extend((account_type, *row) for row in rows)
+        if fix and rows:
+            correct = (
+                select(func.coalesce(func.sum(movements.c.amount), 0))
+                .where(
+                    movements.c.account_type == account_type,
+                    movements.c.account_id == model.id,
+                )
+                .scalar_subquery()
+            )
+            db_session.execute(
+                update(model)
+                .where(model.id.in_([row[0] for row in rows]))
+                .values(balance=correct),
+                execution_options={"synchronize_session": False},
+            )
+    return res
+
+
+def open_ledger(db_session):
+    """
+    Перенос существующих данных в журнал: проводки опубликованных транзакций,
+    которых ещё нет в журнале, и корректировки на разницу между balance
+    и суммой транзакций (начальные остатки). После этого reconcile_balances
+    расхождений не находит.
+    """
+    now = datetime.now()
+    published = Transaction.status == TransactionStatuses.PUBLISHED
+    missing = ~select(LedgerEntry.id).where(
+        LedgerEntry.transaction_id == Transaction.id
+    ).exists()
+    posted_at = func.coalesce(Transaction.published_date, Transaction.created_at)
+    entries = union_all(
+        *(
+            select(
+                Transaction.id,
+                content_type,
+                object_id,
+                amount,
+                posted_at,
+                literal(now),
+            ).where(published, missing)
+            for content_type, object_id, amount in (
+                (
+                    Transaction.debit_content_type,
+                    Transaction.debit_object_id,
+                    Transaction.amount,
+                ),
+                (
+                    Transaction.credit_content_type,
+                    Transaction.credit_object_id,
+                    -Transaction.amount,
+                ),
+            )
+        )
+    )
+    db_session.execute(
+        insert(LedgerEntry).from_select(
+            [
+                "transaction_id",
+                "account_type",
+                "account_id",
+                "amount",
+                "created_at",
+                "updated_at",
+            ],
+            entries,
+        )
+    )
+    # проводки выше видны сверке, остаётся разница начальных остатков
+    rows = reconcile_balances(db_session)
+    if rows:
+        opened_at = _opened_at(db_session, rows)
+        db_session.execute(
+            insert(LedgerEntry),
+            [
+                {
+                    "account_type": account_type,
+                    "account_id": account_id,
+                    "amount": (balance or 0) - expected,
+                    "created_at": opened_at.get((account_type, account_id)) or now,
+                    "updated_at": now,
+                }
+                for account_type, account_id, balance, expected in rows
+            ],
+        )
+    return len(rows)
+
+
+def _opened_at(db_session, rows):
+    """
+    Дата начального остатка: создание счёта или его первая проводка, если
+    она раньше - баланс на прошлые даты (account_balance) включает остаток.
+    Возвращает {(тип, id): дата}.
+    """
+    ids = {}
+    for account_type, account_id, _, _ in rows:
+        ids.setdefault(account_type, []).append(account_id)
+    res = {}
+    for account_type, account_ids in ids.items():
+        model = content_type_model(account_type)
+        first_entry = (
+            select(func.min(LedgerEntry.created_at))
+            .where(
+                LedgerEntry.account_type == account_type,
+                LedgerEntry.account_id == model.id,
+            )
+            .scalar_subquery()
+        )
+        for account_id, opened_at in db_session.execute(
+            select(model.id, func.least(model.created_at, first_entry)).where(
+                model.id.in_(account_ids)
+            )
+        ):
+            res[(account_type, account_id)] = opened_at
+    return res
+
+
+def create_ledger(db_session):
+    """При старте: открыть журнал, если он пуст - снимки балансов строятся по нему"""
+    if db_session.query(LedgerEntry.id).first():
+        return
+    open_ledger(db_session)
+    db_session.commit()
+
+
+def snapshot_balances(db_session, day=None):
+    """
+    Балансы всех счетов на конец day (по умолчанию - вчера):
+    предыдущий снимок плюс проводки после него, одним INSERT ... SELECT.
+    Возвращает число строк снимка.
+    """
+    day = day or date.today() - timedelta(days=1)
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time())
+    now = datetime.now()
+
+    latest = (
+        select(
+            BalanceSnapshot.account_type,
+            BalanceSnapshot.account_id,
+            func.max(BalanceSnapshot.date).label("date"),
+        )
+        .where(BalanceSnapshot.date < day)
+        .group_by(BalanceSnapshot.account_type, BalanceSnapshot.account_id)
+        .subquery()
+    )
+    previous = (
+        select(
+            BalanceSnapshot.account_type,
+            BalanceSnapshot.account_id,
+            BalanceSnapshot.date,
+            BalanceSnapshot.balance,
+        )
+        .join(
+            latest,
+            and_(
+                BalanceSnapshot.account_type == latest.c.account_type,
+                BalanceSnapshot.account_id == latest.c.account_id,
+                BalanceSnapshot.date == latest.c.date,
+            ),
+        )
+        .subquery()
+    )
+    entries = (
+        select(LedgerEntry.account_type, LedgerEntry.account_id, LedgerEntry.amount)
+        .outerjoin(
+            previous,
+            and_(
+                previous.c.account_type == LedgerEntry.account_type,
+                previous.c.account_id == LedgerEntry.account_id,
+            ),
+        )
+        .where(
+            LedgerEntry.created_at < end,
+            (previous.c.date.is_(None))
+            | (cast(LedgerEntry.created_at, Date) > previous.c.date),
+        )
+    )
+    movements = union_all(
+        select(
+            previous.c.account_type,
+            previous.c.account_id,
+            previous.c.balance.label("amount"),
+        ),
+        entries,
+    ).subquery()
+    stmt = pg_insert(BalanceSnapshot).from_select(
+        ["account_type", "account_id", "date", "balance", "created_at", "updated_at"],
+        select(
+            movements.c.account_type,
+            movements.c.account_id,
+            literal(day, Date),
+            func.sum(movements.c.amount),
+            literal(now),
+            literal(now),
+        ).group_by(movements.c.account_type, movements.c.account_id),
+    )
+    return db_session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["account_type", "account_id", "date"],
+            set_={"balance": stmt.excluded.balance, "updated_at": stmt.excluded.updated_at},
+        )
+    ).rowcount
+
+
+def account_balance(db_session, account_type, account_id, at=None):
+    """
+    Баланс счёта по журналу на момент at (по умолчанию - сейчас):
+    последний снимок до at плюс проводки после него. Не читает и не
+    блокирует строку счёта.
+    """
+    at = at or datetime.now()
+    snapshot = db_session.execute(
+        select(BalanceSnapshot.date, BalanceSnapshot.balance)
+        .where(
+            BalanceSnapshot.account_type == account_type,
+            BalanceSnapshot.account_id == account_id,
+            BalanceSnapshot.date < at.date(),
+        )
+        .order_by(BalanceSnapshot.date.desc())
+        .limit(1)
+    ).first()
+    stmt = select(func.coalesce(func.sum(LedgerEntry.amount), 0)).where(
+        LedgerEntry.account_type == account_type,
+        LedgerEntry.account_id == account_id,
+        LedgerEntry.created_at < at,
+    )
+    if snapshot is None:
+        return db_session.scalar(stmt)
+    start = datetime.combine(snapshot.date + timedelta(days=1), datetime.min.time())
+    return snapshot.balance + db_session.scalar(
+        stmt.where(LedgerEntry.created_at >= start)
+    )
@@ -1,23 +1,23 @@
-import calendar
-import random
-import string
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
 from sqlalchemy import (
     Boolean,
     Column,
+    Date,
     DateTime,
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from app.base import Base, session
+from app.base import Base, session, trigram_index
 from app.choices import (
     AccountCategories,
     AccountTypes,
@@ -26,6 +26,7 @@ from app.choices import (
     TransactionStatuses,
 )
 from app.utils.mixins import BalanceMixin, HistoryMixin, TempDataMixin
+from app.utils.references import register_content_type, resolve
 
 
 class PaymentType(Base):
@@ -68,6 +69,7 @@ cash_register_payment_type = Table(
 )
 
 
+@register_content_type
 class CashRegister(TempDataMixin, Base, BalanceMixin):
     """
     Касса - место, которое хранит Баланс, а так же имеет принимаемые типы
@@ -107,6 +109,7 @@ class CashRegisterHistory(Base, HistoryMixin):
     cash_register: Mapped["CashRegister"] = relationship(back_populates="histories")
 
 
+@register_content_type
 class BalanceAccount(Base, BalanceMixin):
     """
     Счет баланса - полный аналог Кассы, только не содержит Типы оплаты
@@ -171,6 +174,24 @@ class Transaction(TempDataMixin, Base):
     """
 
     __tablename__ = "transaction"
+    __table_args__ = (
+        Index(
+            "ix_transaction_debit",
+            "debit_content_type",
+            "debit_object_id",
+            "status",
+        ),
+        Index(
+            "ix_transaction_credit",
+            "credit_content_type",
+            "credit_object_id",
+            "status",
+        ),
+        Index("ix_transaction_created_at", "created_at"),
+        Index("ix_transaction_idempotency_key", "idempotency_key", unique=True),
+        trigram_index("ix_transaction_debit_name_trgm", "debit_name"),
+        trigram_index("ix_transaction_credit_name_trgm", "credit_name"),
+    )
 
     number_transaction: Mapped[str] = mapped_column(String, nullable=False)
     published_date: Mapped[Optional[datetime]] = mapped_column(
@@ -190,6 +211,8 @@ class Transaction(TempDataMixin, Base):
     )
     credit_name = Column(String(50), nullable=False)
     debit_name = Column(String(50), nullable=False)
+    # ключ автоматических транзакций: повторный запуск не создаёт дубль
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(100))
     histories: Mapped[List["TransactionHistory"]] = relationship(
         back_populates="transaction"
     )
@@ -199,13 +222,11 @@ class Transaction(TempDataMixin, Base):
 
     @property
     def debit_object(self):
-        debit_class = globals()[self.debit_content_type]
-        return session.get(debit_class, self.debit_object_id)
+        return resolve(session, self.debit_content_type, self.debit_object_id)
 
     @property
     def credit_object(self):
-        credit_class = globals()[self.credit_content_type]
-        return session.get(credit_class, self.credit_object_id)
+        return resolve(session, self.credit_content_type, self.credit_object_id)
 
     def __repr__(self) -> str:
         return (
@@ -224,34 +245,18 @@ class Transaction(TempDataMixin, Base):
 
     def publish(self):
         """Опубликовать транзакцию, если возможно"""
+        from app.finance.ledger import post_transaction
+
         if self.status == TransactionStatuses.PUBLISHED:
             self.published_date = datetime.now()
-
-            amount = self.amount
-            self.credit_object.balance -= amount
-            if hasattr(self.credit_object, "_temp_data"):
-                self.credit_object.add_temp_data(
-                    "history_data", {"balance": self.credit_object.balance}
-                )
-            self.debit_object.balance += amount
-            if hasattr(self.debit_object, "_temp_data"):
-                self.debit_object.add_temp_data(
-                    "history_data", {"balance": self.debit_object.balance}
-                )
+            post_transaction(session, self)
 
     def cancel(self):
         """Отменить транзакцию, если возможно"""
+        from app.finance.ledger import post_transaction
+
         self.status = TransactionStatuses.CANCELLED
-        self.credit_object.balance += self.amount
-        if hasattr(self.credit_object, "_temp_data"):
-            self.credit_object.add_temp_data(
-                "history_data", {"balance": self.credit_object.balance}
-            )
-        self.debit_object.balance -= self.amount
-        if hasattr(self.debit_object, "_temp_data"):
-            self.debit_object.add_temp_data(
-                "history_data", {"balance": self.debit_object.balance}
-            )
+        post_transaction(session, self, reverse=True)
 
     def format(self):
         return {
@@ -263,6 +268,56 @@ class Transaction(TempDataMixin, Base):
         }
 
 
+class LedgerEntry(Base):
+    """
+    Проводка по счёту (касса, счёт баланса, контрагент, зарплата).
+    Записи только добавляются: публикация транзакции - две проводки,
+    отмена - две обратные. Без transaction_id - ручная корректировка баланса.
+    """
+
+    __tablename__ = "ledger_entry"
+    __table_args__ = (
+        Index("ix_ledger_entry_account", "account_type", "account_id", "created_at"),
+    )
+
+    transaction_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("transaction.id", ondelete="SET NULL"), nullable=True, index=True
+    )
+    account_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    account_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    # + приход на счёт (дебет), - расход (кредит)
+    amount: Mapped[float] = mapped_column(Float, nullable=False)
+
+
+class BalanceSnapshot(Base):
+    """Баланс счёта на конец дня, см. snapshot_balances"""
+
+    __tablename__ = "balance_snapshot"
+    __table_args__ = (UniqueConstraint("account_type", "account_id", "date"),)
+
+    account_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    account_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    date: Mapped[date] = mapped_column(Date, nullable=False)
+    balance: Mapped[float] = mapped_column(Float, nullable=False)
+
+
+class AccountTurnover(Base):
+    """
+    Обороты счёта за день по опубликованным транзакциям: приход (дебет)
+    и расход (кредит). День - дата публикации транзакции, отмена вычитает
+    из того же дня. Пересчитывается командой `flask rebuild-turnover`.
+    """
+
+    __tablename__ = "account_turnover"
+    __table_args__ = (UniqueConstraint("account_type", "account_id", "date"),)
+
+    account_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    account_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    date: Mapped[date] = mapped_column(Date, nullable=False)
+    incomes: Mapped[float] = mapped_column(Float, default=0)
+    expenses: Mapped[float] = mapped_column(Float, default=0)
+
+
 class CounterpartyHistory(Base, HistoryMixin):
     __tablename__ = "counterparty_history"
     counterparty_id: Mapped[int] = mapped_column(
@@ -272,6 +327,7 @@ class CounterpartyHistory(Base, HistoryMixin):
     status: Mapped[Statuses] = mapped_column(Enum(Statuses), nullable=False)
 
 
+@register_content_type
 class Counterparty(TempDataMixin, Base, BalanceMixin):
     """
     Контрагенты - аналог Кассы, только не содержит Типы оплаты
@@ -283,6 +339,7 @@ class Counterparty(TempDataMixin, Base, BalanceMixin):
     """
 
     __tablename__ = "counterparty"
+    __table_args__ = (trigram_index("ix_counterparty_name_trgm", "name"),)
 
     name: Mapped[str] = mapped_column(String(100), nullable=False, unique=True)
     code: Mapped[str] = mapped_column(String(4), nullable=False)
@@ -334,45 +391,6 @@ class Counterparty(TempDataMixin, Base, BalanceMixin):
     def can_delete_and_edit(self) -> bool:
         return self.category == AccountCategories.USER
 
-    def create_auto_charge_transaction(self, month, year, n):
-        days_in_months = self.__count_days_in_months(
-            start_month=month, start_year=year, n=n
-        )
-        debit_object = BalanceAccount.query.filter_by(name="Постоянные расходы").first()
-        transaction = Transaction(
-            credit_content_type="Counterparty",
-            credit_object_id=self.id,
-            debit_content_type="BalanceAccount",
-            debit_object_id=debit_object.id,
-            status=TransactionStatuses.PUBLISHED,
-            amount=self.charge_amount / days_in_months,
-            credit_name=self.name,
-            debit_name=debit_object.name,
-            number_transaction="".join(random.choices(string.digits, k=6)),
-        )
-        transaction.publish()
-        return transaction
-
-    def __count_days_in_months(self, start_year: int, start_month: int, n: int) -> int:
-        total_days = 0
-        current_year = start_year
-        current_month = start_month
-
-        for _ in range(n):
-            # Определяем количество дней в текущем месяце
-            days_in_month = calendar.monthrange(current_year, current_month)[1]
-            total_days += days_in_month
-
-            # Переход к следующему месяцу
-            current_month += 1
-            if (
-                current_month > 12
-            ):  # если месяц вышел за декабрь, переходим на следующий год
-                current_month = 1
-                current_year += 1
-
-        return total_days
-
     def __repr__(self):
         return (
             f"<Counterparty(name={self.name}, code={self.code}, status={self.status})>"
@@ -1,10 +1,8 @@
 import marshmallow as ma
 from marshmallow import ValidationError, validate
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
-from sqlalchemy import func
 from werkzeug.datastructures import FileStorage
 
-from app import session
 from app.choices import (
     AccountCategories,
     AccountTypes,
@@ -24,8 +22,18 @@ from app.finance.models import (
     TransactionComment,
     TransactionHistory,
 )
-from app.finance.utils import CATEGORY_COLLECTION, CATEGORY_LIST, check_all_strs_is_nums
-from app.utils.schema import DefaultDumpsSchema, PaginationSchema
+from app.finance.turnover import get_account_turnover
+from app.finance.utils import (
+    CATEGORY_COLLECTION,
+    CATEGORY_LIST,
+    TURNOVER_ACCOUNT_TYPES,
+    check_all_strs_is_nums,
+)
+from app.utils.schema import (
+    DefaultDumpsSchema,
+    PaginationQueryArgSchema,
+    PaginationSchema,
+)
 
 
 class RoundedFloat(ma.fields.Float):
@@ -35,24 +43,18 @@ class RoundedFloat(ma.fields.Float):
         return round(value, 2)
 
 
-class ByNameSearchSchema(ma.Schema):
+class ByNameSearchSchema(PaginationQueryArgSchema):
     name = ma.fields.String(required=False, description="Search by name")
-    page = ma.fields.Int()
-    limit = ma.fields.Int()
 
 
-class ByNameAndCategorySearchSchema(ma.Schema):
+class ByNameAndCategorySearchSchema(PaginationQueryArgSchema):
     name = ma.fields.String(required=False, description="Search by name")
     category = ma.fields.Enum(enum=AccountCategories, description="Filter by Category")
     type = ma.fields.Enum(enum=AccountTypes, description="Filter by Type")
-    page = ma.fields.Int()
-    limit = ma.fields.Int()
 
 
-class TransactionArgsSchema(ma.Schema):
+class TransactionArgsSchema(PaginationQueryArgSchema):
     search = ma.fields.String(required=False, description="Search")
-    page = ma.fields.Int()
-    limit = ma.fields.Int()
     created_date = ma.fields.Date()
     status = ma.fields.Enum(enum=TransactionStatuses)
     category_name = ma.fields.Str(
@@ -64,19 +66,25 @@ class TransactionArgsSchema(ma.Schema):
     end_date = ma.fields.Date()
 
 
-class CounterpartyArgsSchema(ma.Schema):
+class TurnoverArgsSchema(ma.Schema):
+    account_type = ma.fields.Str(
+        required=True,
+        validate=validate.OneOf(TURNOVER_ACCOUNT_TYPES, error="Invalid account type"),
+    )
+    account_id = ma.fields.Int(required=True)
+    start_date = ma.fields.Date()
+    end_date = ma.fields.Date()
+
+
+class CounterpartyArgsSchema(PaginationQueryArgSchema):
     name = ma.fields.String(required=False, description="Search")
-    page = ma.fields.Int()
-    limit = ma.fields.Int()
     created_date = ma.fields.Date()
     category = ma.fields.Enum(enum=AccountCategories)
     status = ma.fields.Enum(enum=Statuses)
 
 
-class TaxRateArgsSchema(ma.Schema):
+class TaxRateArgsSchema(PaginationQueryArgSchema):
     name = ma.fields.String(required=False, description="Search")
-    page = ma.fields.Int()
-    limit = ma.fields.Int()
     category = ma.fields.Enum(enum=TaxRateCategories)
     status = ma.fields.Enum(enum=Statuses)
     payment_type_name = ma.fields.Str(required=False)
@@ -188,28 +196,10 @@ class CashRegisterRetrieveSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
         ]
 
     def get_incomes(self, obj):
-        total_amount = (
-            session.query(func.sum(Transaction.amount))
-            .filter_by(
-                debit_content_type="CashRegister",
-                debit_object_id=obj.id,
-                status=TransactionStatuses.PUBLISHED,
-            )
-            .scalar()
-        )
-        return total_amount if total_amount else 0
+        return get_account_turnover("CashRegister", obj.id)["incomes"]
 
     def get_expenses(self, obj):
-        total_amount = (
-            session.query(func.sum(Transaction.amount))
-            .filter_by(
-                credit_content_type="CashRegister",
-                credit_object_id=obj.id,
-                status=TransactionStatuses.PUBLISHED,
-            )
-            .scalar()
-        )
-        return total_amount if total_amount else 0
+        return get_account_turnover("CashRegister", obj.id)["expenses"]
 
 
 class CashRegisterUpdateSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
@@ -404,6 +394,7 @@ class TransactionRetrieveSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
             "histories",
             "comments",
         ]
+        eager_load = ["histories"]
 
     def get_sorted_histories(self, obj):
         # Сортируем связанные объекты histories по created_at (в порядке убывания)
@@ -661,3 +652,19 @@ class CounterpartyIdSchema(ma.Schema):
         required=True,
         description="for attaching to Counterparty",
     )
+
+
+class TurnoverDaySchema(ma.Schema):
+    date = ma.fields.Date()
+    incomes = RoundedFloat()
+    expenses = RoundedFloat()
+
+
+class TurnoverSchema(ma.Schema):
+    account_type = ma.fields.Str()
+    account_id = ma.fields.Int()
+    opening_balance = RoundedFloat(allow_none=True)
+    closing_balance = RoundedFloat()
+    incomes = RoundedFloat()
+    expenses = RoundedFloat()
+    days = ma.fields.Nested(TurnoverDaySchema, many=True)
@@ -0,0 +1,175 @@
+from datetime import datetime
+
+from sqlalchemy import Date, cast, delete, func, literal, select, union_all
+from sqlalchemy.dialects.postgresql import insert
+
+from app.base import session
+from app.choices import TransactionStatuses
+from app.finance.models import AccountTurnover, Transaction
+
+TURNOVER_COLUMNS = [
+    "account_type",
+    "account_id",
+    "date",
+    "incomes",
+    "expenses",
+    "created_at",
+    "updated_at",
+]
+
+
+def _upsert_turnover(stmt):
+    return stmt.on_conflict_do_update(
+        index_elements=["account_type", "account_id", "date"],
+        set_={
+            "incomes": AccountTurnover.incomes + stmt.excluded.incomes,
+            "expenses": AccountTurnover.expenses + stmt.excluded.expenses,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+def add_turnover(db_session, transaction, sign=1):
+    """
+    Обороты транзакции: приход дебету, расход кредиту за день публикации.
+    sign=-1 - вычесть при отмене.
+    """
+    add_turnovers(db_session, [transaction], sign)
+
+
+def add_turnovers(db_session, transactions, sign=1):
+    """Обороты нескольких транзакций одним upsert"""
+    # {(тип, id, день): [приход, расход]}, кредит и дебет могут совпадать
+    rows = {}
+    for transaction in transactions:
+        day = (
+            transaction.published_date or transaction.created_at or datetime.now()
+        ).date()
+        amount = sign * transaction.amount
+        rows.setdefault(
+            (transaction.debit_content_type, transaction.debit_object_id, day), [0, 0]
+        )[0] += amount
+        rows.setdefault(
+            (transaction.credit_content_type, transaction.credit_object_id, day), [0, 0]
+        )[1] += amount
+    if not rows:
+        return
+    now = datetime.now()
+    db_session.execute(
+        _upsert_turnover(insert(AccountTurnover)),
+        [
+            {
+                "account_type": account_type,
+                "account_id": account_id,
+                "date": day,
+                "incomes": incomes,
+                "expenses": expenses,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for (account_type, account_id, day), (incomes, expenses) in rows.items()
+        ],
+    )
+
+
+def refresh_turnover(db_session):
+    """Пересчитать обороты по всем опубликованным транзакциям"""
+    db_session.execute(delete(AccountTurnover))
+    published = Transaction.status == TransactionStatuses.PUBLISHED
+    day = cast(
+        func.coalesce(Transaction.published_date, Transaction.created_at), Date
+    ).label("date")
+    movements = union_all(
+        select(
+            Transaction.debit_content_type.label("account_type"),
+            Transaction.debit_object_id.label("account_id"),
+            day,
+            Transaction.amount.label("incomes"),
+            literal(0.0).label("expenses"),
+        ).where(published),
+        select(
+            Transaction.credit_content_type,
+            Transaction.credit_object_id,
+            day,
+            literal(0.0),
+            Transaction.amount,
+        ).where(published),
+    ).subquery()
+    now = datetime.now()
+    db_session.execute(
+        insert(AccountTurnover).from_select(
+            TURNOVER_COLUMNS,
+            select(
+                movements.c.account_type,
+                movements.c.account_id,
+                movements.c.date,
+                func.sum(movements.c.incomes),
+                func.sum(movements.c.expenses),
+                literal(now),
+                literal(now),
+            ).group_by(
+                movements.c.account_type, movements.c.account_id, movements.c.date
+            ),
+        )
+    )
+
+
+def create_account_turnover(db_session):
+    if db_session.query(AccountTurnover.id).first():
+        return
+    refresh_turnover(db_session)
+    db_session.commit()
+
+
+def _turnover_filter(account_type, account_ids, start_date=None, end_date=None):
+    filters = [
+        AccountTurnover.account_type == account_type,
+        AccountTurnover.account_id.in_(account_ids),
+    ]
+    if start_date:
+        filters.append(AccountTurnover.date >= start_date)
+    if end_date:
+        filters.append(AccountTurnover.date <= end_date)
+    return filters
+
+
+def get_accounts_turnover(account_type, account_ids, start_date=None, end_date=None):
+    """
+    Приход и расход счетов за период (границы включительно, None - без границы).
+    Возвращает {account_id: {"incomes": .., "expenses": ..}}, без оборотов - нули.
+    """
+    account_ids = list(set(account_ids))
+    res = {
+        account_id: {"incomes": 0, "expenses": 0} for account_id in account_ids
+    }
+    if not account_ids:
+        return res
+    stmt = (
+        select(
+            AccountTurnover.account_id,
+            func.sum(AccountTurnover.incomes),
+            func.sum(AccountTurnover.expenses),
+        )
+        .where(*_turnover_filter(account_type, account_ids, start_date, end_date))
+        .group_by(AccountTurnover.account_id)
+    )
+    for account_id, incomes, expenses in session.execute(stmt):
+        res[account_id] = {"incomes": incomes or 0, "expenses": expenses or 0}
+    return res
+
+
+def get_account_turnover(account_type, account_id, start_date=None, end_date=None):
+    return get_accounts_turnover(account_type, [account_id], start_date, end_date)[
+        account_id
+    ]
+
+
+def get_turnover_days(account_type, account_id, start_date=None, end_date=None):
+    """Обороты счёта по дням периода, дни без оборотов не возвращаются"""
+    return session.execute(
+        select(
+            AccountTurnover.date, AccountTurnover.incomes, AccountTurnover.expenses
+        )
+        .where(*_turnover_filter(account_type, [account_id], start_date, end_date))
+        .order_by(AccountTurnover.date)
+    ).all()
@@ -20,6 +20,15 @@ CATEGORY_LIST = [
     "User",
 ]
 
+# счета, по которым ведутся обороты (account_turnover)
+TURNOVER_ACCOUNT_TYPES = [
+    "CashRegister",
+    "BalanceAccount",
+    "Counterparty",
+    "Client",
+    "Salary",
+]
+
 
 def check_all_strs_is_nums(data: str):
     return data.isdigit()
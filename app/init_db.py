@@ -3,6 +3,7 @@ from app.user.models import User
 from app.invoice.models import Invoice
 from app.product.models import Product
 from app.finance.models import PaymentType
+from app.job.models import Job
 from app.base import Base, engine, session
 
 
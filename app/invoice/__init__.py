@@ -1,17 +1,20 @@
 from sqlalchemy.exc import SQLAlchemyError
 from flask import current_app
 import os
-from app.choices import InvoiceStatuses
+from app.choices import InvoiceStatuses, InvoiceTypes
 from app.invoice.models import File, Invoice, InvoiceLog
 from app.invoice.schema import (
     ExpenseSchema,
     FileWebSchema,
+    InvoiceBatchResultSchema,
+    InvoiceBatchSchema,
     InvoiceCommentSchema,
     InvoiceLogSchema,
     InvoiceSchema,
     ProductionSchema,
     TransferSchema,
 )
+from app.invoice.utils import publish_invoices
 from app.utils.exc import ItemNotFoundError
 from app.utils.func import cancel_invoice, hash_image_save, msg_response, sql_exception_handler, token_required
 from app.utils.schema import ResponseSchema
@@ -124,6 +127,27 @@ def register_publish_invoice_route(bp, route):
         return msg_response("ok")
 
 
+def register_publish_batch_route(bp, route, invoice_type):
+    @bp.post(route)
+    @token_required
+    @bp.arguments(InvoiceBatchSchema)
+    @bp.response(400, ResponseSchema)
+    @bp.response(200, InvoiceBatchResultSchema(many=True))
+    def publish_batch(cur_user, data):
+        """Publish draft invoices in one transaction, result per id"""
+        try:
+            results = publish_invoices(session, data["ids"], invoice_type, cur_user.id)
+            session.commit()
+        except SQLAlchemyError as e:
+            current_app.logger.error(str(e.args))
+            session.rollback()
+            return msg_response("Something went wrong", False), 400
+        return [
+            {"id": invoice_id, "ok": error is None, "error": error}
+            for invoice_id, error in results.items()
+        ]
+
+
 def register_get_logs_route(bp, route):
     @bp.get(route)
     @token_required
@@ -173,10 +197,17 @@ def reg_invoice_routes():
         TransferSchema,
         ProductionSchema,
     ]
-    for bp, label, schema in zip(bps, id_labels, schemas):
+    types = [
+        InvoiceTypes.INVOICE,
+        InvoiceTypes.EXPENSE,
+        InvoiceTypes.TRANSFER,
+        InvoiceTypes.PRODUCTION,
+    ]
+    for bp, label, schema, invoice_type in zip(bps, id_labels, schemas, types):
         register_update_photos_route(bp, "/<invoice_id>/update_photos/", schema)
         register_add_comment_route(bp, "/<invoice_id>/add_comment/")
         register_publish_invoice_route(bp, "/<invoice_id>/publish/")
+        register_publish_batch_route(bp, "/publish_batch/", invoice_type)
         register_get_logs_route(bp, "/<invoice_id>/logs/")
         register_get_comments_route(bp, "/<invoice_id>/comments/")
         register_cancel_invoice_route(bp, "/<invoice_id>/cancel/")
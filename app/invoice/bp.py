@@ -1,5 +1,6 @@
-from sqlalchemy import func
 from app.choices import InvoiceStatuses, InvoiceTypes
+from app.search.utils import search_filter
+from app.utils.filters import date_between
 from app.utils.func import msg_response, sql_exception_handler, token_required
 from sqlalchemy.exc import SQLAlchemyError
 from flask import current_app
@@ -17,6 +18,8 @@ from app.invoice.schema import (
 from app.base import session
 from app.utils.exc import ItemNotFoundError
 from app.utils.schema import ResponseSchema
+from app.utils.loading import eager_load_options, query_budget
+from app.utils.pagination import paginate, pop_pagination
 
 
 invoice = Blueprint(
@@ -27,43 +30,26 @@ invoice = Blueprint(
 @invoice.route("/")
 class InvoiceAllView(MethodView):
     @token_required
+    @query_budget(8)
     @sql_exception_handler
     @invoice.arguments(InvoiceQueryArgSchema, location="query")
     @invoice.response(400, ResponseSchema)
     @invoice.response(200, PagInvoiceSchema)
     def get(c, self, args):
         """List invoices"""
-        page = args.pop("page", 1)
+        pagination = pop_pagination(args)
         created_at = args.pop("created_at", None)
-        try:
-            limit = int(args.pop("limit", 10))
-            if limit <= 0:
-                limit = 10
-        except ValueError:
-            limit = 10
-        if limit <= 0:
-            limit = 10
         number = args.pop("number", None)
-        query = Invoice.query.filter_by(type=InvoiceTypes.INVOICE, **args).order_by(
-            Invoice.created_at.desc()
+        query = (
+            Invoice.query.options(*eager_load_options(InvoiceSchema))
+            .filter_by(type=InvoiceTypes.INVOICE, **args)
+            .order_by(Invoice.created_at.desc())
         )
         if created_at:
-            query = query.where(func.date(Invoice.created_at) == created_at)
+            query = query.where(date_between(Invoice.created_at, created_at))
         if number:
-            query = query.filter(Invoice.number.ilike(f"%{number}%"))
-        total_count = query.count()
-        total_pages = (total_count + limit - 1) // limit
-        data = query.limit(limit).offset((page - 1) * limit).all()
-        response = {
-            "data": data,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total_pages": total_pages,
-                "total_count": total_count,
-            },
-        }
-        return response
+            query = query.filter(search_filter("invoice", number))
+        return paginate(query, pagination, Invoice)
 
     @token_required
     @sql_exception_handler
@@ -88,12 +74,15 @@ class InvoiceAllView(MethodView):
 @invoice.route("/<invoice_id>/")
 class InvoiceById(MethodView):
     @token_required
+    @query_budget(10)
     @sql_exception_handler
     @invoice.response(200, InvoiceDetailSchema)
     def get(c, self, invoice_id):
         """Get invoice by ID"""
         try:
-            item = Invoice.get_by_id(invoice_id)
+            item = Invoice.get_by_id(
+                invoice_id, options=eager_load_options(InvoiceDetailSchema)
+            )
         except ItemNotFoundError:
             abort(404, message="Item not found.")
         return item
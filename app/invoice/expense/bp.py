@@ -1,5 +1,6 @@
-from sqlalchemy import func
 from app.choices import InvoiceStatuses, InvoiceTypes
+from app.search.utils import search_filter
+from app.utils.filters import date_between
 from app.utils.func import msg_response, token_required
 from sqlalchemy.exc import SQLAlchemyError
 from flask import current_app
@@ -17,6 +18,8 @@ from app.invoice.schema import (
 from app.base import session
 from app.utils.exc import ItemNotFoundError
 from app.utils.schema import ResponseSchema
+from app.utils.loading import eager_load_options, query_budget
+from app.utils.pagination import paginate, pop_pagination
 
 
 expense = Blueprint(
@@ -27,46 +30,29 @@ expense = Blueprint(
 @expense.route("/")
 class InvoiceAllView(MethodView):
     @token_required
+    @query_budget(8)
     @expense.arguments(InvoiceQueryArgSchema, location="query")
     @expense.response(200, PagExpenseSchema)
     def get(c, self, args):
         """List expenses"""
-        page = args.pop("page", 1)
+        pagination = pop_pagination(args)
         created_at = args.pop("created_at", None)
-        try:
-            limit = int(args.pop("limit", 10))
-            if limit <= 0:
-                limit = 10
-        except ValueError:
-            limit = 10
-        if limit <= 0:
-            limit = 10
         try:
             number = args.pop("number", None)
-            query = Invoice.query.filter_by(type=InvoiceTypes.EXPENSE, **args).order_by(
-                Invoice.created_at.desc()
+            query = (
+                Invoice.query.options(*eager_load_options(ExpenseSchema))
+                .filter_by(type=InvoiceTypes.EXPENSE, **args)
+                .order_by(Invoice.created_at.desc())
             )
             if created_at:
-                query = query.where(func.date(Invoice.created_at) == created_at)
+                query = query.where(date_between(Invoice.created_at, created_at))
             if number:
-                query = query.filter(Invoice.number.ilike(f"%{number}%"))
-            total_count = query.count()
-            total_pages = (total_count + limit - 1) // limit
-            data = query.limit(limit).offset((page - 1) * limit).all()
+                query = query.filter(search_filter("invoice", number))
+            response = paginate(query, pagination, Invoice)
         except SQLAlchemyError as e:
             current_app.logger.error(str(e.args))
             session.rollback()
             return msg_response("Something went wrong", False), 400
-        response = {
-            "data": data,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total_pages": total_pages,
-                "total_count": total_count,
-            },
-        }
-
         return response
 
     @token_required
@@ -96,11 +82,14 @@ class InvoiceAllView(MethodView):
 @expense.route("/<expense_id>/")
 class InvoiceById(MethodView):
     @token_required
+    @query_budget(10)
     @expense.response(200, InvoiceDetailSchema)
     def get(c, self, expense_id):
         """Get expense by ID"""
         try:
-            item = Invoice.get_by_id(expense_id)
+            item = Invoice.get_by_id(
+                expense_id, options=eager_load_options(InvoiceDetailSchema)
+            )
         except ItemNotFoundError:
             abort(404, message="Item not found.")
         return item
@@ -1,11 +1,11 @@
-from sqlalchemy import Float, ForeignKey, Enum, String
+from sqlalchemy import Float, ForeignKey, Enum, Index, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 
 from typing import List, Optional, TYPE_CHECKING
 import enum
 from app.choices import InvoiceTypes, InvoiceStatuses
-from app.base import Base, session
+from app.base import Base, session, trigram_index
 from app.utils.types import JSONEncodedDict, MutableDict
 
 if TYPE_CHECKING:
@@ -78,6 +78,12 @@ class InvoiceBase:
 
 class Invoice(Base, InvoiceBase):
     __tablename__ = "invoice"
+    __table_args__ = (
+        Index("ix_invoice_type_status_created_at", "type", "status", "created_at"),
+        Index("ix_invoice_receiver_status", "warehouse_receiver_id", "status"),
+        Index("ix_invoice_sender_status", "warehouse_sender_id", "status"),
+        trigram_index("ix_invoice_number_trgm", "number::text"),
+    )
 
     type: Mapped[enum.Enum] = mapped_column(
         Enum(InvoiceTypes), default=InvoiceTypes.INVOICE
@@ -114,50 +120,6 @@ class Invoice(Base, InvoiceBase):
         MutableDict.as_mutable(JSONEncodedDict)
     )
 
-    def update_fields(self):
-        self.quantity = self.available_quantity()
-        self.price = self.available_price()
-
-    def available_quantity(self):
-        total_quantity = 0
-
-        # Суммируем количество в product_lots
-        for product_lot in self.product_lots:
-            if product_lot.quantity:
-                total_quantity += product_lot.quantity
-
-        # Суммируем количество в container_lots
-        for container_lot in self.container_lots:
-            if container_lot.quantity:
-                total_quantity += container_lot.quantity
-
-        # Суммируем количество в part_lots
-        for part_lot in self.part_lots:
-            if part_lot.quantity:
-                total_quantity += part_lot.quantity
-
-        return total_quantity
-
-    def available_price(self):
-        total_price = 0
-
-        # Суммируем количество в product_lots
-        for product_lot in self.product_lots:
-            if product_lot.total_sum:
-                total_price += product_lot.total_sum
-
-        # Суммируем количество в container_lots
-        for container_lot in self.container_lots:
-            if container_lot.total_sum:
-                total_price += container_lot.total_sum
-
-        # Суммируем количество в part_lots
-        for part_lot in self.part_lots:
-            if part_lot.total_sum:
-                total_price += part_lot.total_sum
-
-        return total_price
-
 
 class InvoiceComment(Base):
     __tablename__ = "invoice_comment"
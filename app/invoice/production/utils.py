@@ -0,0 +1,123 @@
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import selectinload
+
+from app.base import session
+from app.choices import DebtTypes
+from app.product.fifo import consume_fifo
+from app.product.models import (
+    ContainerLot,
+    Debt,
+    Markup,
+    PartLot,
+    Product,
+)
+from app.product.units import any_markup
+from app.utils.exc import ItemNotFoundError, NotRightQuantity, ValidateError
+
+# лот -> (колонка позиции, тип долга)
+BOM_LOTS = {
+    ContainerLot: ("container_id", DebtTypes.CONTAINER),
+    PartLot: ("part_id", DebtTypes.PART),
+}
+
+
+def get_products_with_bom(product_ids):
+    products = session.scalars(
+        select(Product)
+        .where(Product.id.in_(set(product_ids)))
+        .options(selectinload(Product.containers_r), selectinload(Product.parts_r))
+    ).all()
+    return {product.id: product for product in products}
+
+
+def take_cost(slices, quantity):
+    """Стоимость quantity штук из начала списка [[кол-во, цена], ...]"""
+    cost = 0.0
+    while quantity > 0 and slices:
+        taken = min(slices[0][0], quantity)
+        cost += taken * slices[0][1]
+        quantity -= taken
+        slices[0][0] -= taken
+        if slices[0][0] == 0:
+            slices.pop(0)
+    return cost
+
+
+def calc_production_costs(lines):
+    """
+    Себестоимость строк акта производства. Потребность по BOM всех строк
+    суммируется по каждому контейнеру/части, списывается по FIFO один раз,
+    затем распределяется по строкам в их порядке.
+    """
+    products = get_products_with_bom(line.get("product_id") for line in lines)
+
+    demand = {}
+    for index, line in enumerate(lines):
+        product = products.get(line.get("product_id"))
+        if not product:
+            raise ItemNotFoundError("Product not found")
+        quantity = line.get("quantity") or 0
+        bom = [(ContainerLot, r.container_id, r.quantity) for r in product.containers_r]
+        bom += [(PartLot, r.part_id, r.quantity) for r in product.parts_r]
+        for LotModel, item_id, item_quantity in bom:
+            demand.setdefault((LotModel, item_id), []).append(
+                (index, item_quantity * quantity)
+            )
+
+    costs = [0.0] * len(lines)
+    for (LotModel, item_id), needs in demand.items():
+        item_column, debt_type = BOM_LOTS[LotModel]
+        consumed, remaining = consume_fifo(
+            LotModel,
+            [getattr(LotModel, item_column) == item_id],
+            sum(required for _, required in needs),
+        )
+        if remaining > 0:
+            session.add(Debt(type=debt_type, type_id=item_id, quantity=remaining))
+        slices = [[taken, lot.price] for lot, taken in consumed]
+        for index, required in needs:
+            costs[index] += take_cost(slices, required)
+
+    for line, total_cost in zip(lines, costs):
+        quantity = line.get("quantity")
+        line["price"] = total_cost / quantity if quantity else 0.0
+        line["total_sum"] = total_cost
+    return lines
+
+
+def check_markups(lines):
+    """Маркировки всех строк акта: количество, повторы и занятость - до списания"""
+    markups = []
+    for line in lines:
+        if len(line["markups"]) != line.get("quantity"):
+            raise NotRightQuantity("Not right quantity and markups list of array")
+        markups.extend(line["markups"])
+    if len(set(markups)) != len(markups):
+        raise ValidateError("Markup is already used")
+    if markups:
+        is_used = session.scalars(
+            select(Markup.is_used)
+            .where(Markup.id == any_markup(markups))
+            .with_for_update()
+        ).all()
+        if any(is_used):
+            raise ValidateError("Markup is already used")
+    return markups
+
+
+def use_markups(lines, markups):
+    """
+    Отметка маркировок одним UPDATE; единицы продукции строк вставляются
+    одним INSERT после flush лотов (save_pending_units)
+    """
+    if markups:
+        session.execute(
+            update(Markup)
+            .where(Markup.id == any_markup(markups))
+            .values(is_used=True, date_of_use=datetime.now())
+        )
+    for line in lines:
+        line["pending_markups"] = line["markups"]
+    return lines
@@ -1,6 +1,4 @@
 from collections import defaultdict
-from datetime import datetime
-from typing import List
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema, auto_field
 import marshmallow as ma
 from sqlalchemy.orm import joinedload
@@ -16,16 +14,25 @@ from app.invoice.models import (
 )
 from app.product.models import (
     ContainerLot,
-    Markup,
     Part,
     PartLot,
-    Product,
     ProductLot,
     ProductUnit,
     Container,
 )
-from app.utils.exc import ItemNotFoundError, NotRightQuantity, ValidateError
-from app.utils.schema import BaseInvoiceSchema, DefaultDumpsSchema, PaginationSchema
+from app.product.units import take_units
+from app.invoice.production.utils import (
+    calc_production_costs,
+    check_markups,
+    use_markups,
+)
+from app.utils.exc import ItemNotFoundError
+from app.utils.schema import (
+    BaseInvoiceSchema,
+    DefaultDumpsSchema,
+    PaginationQueryArgSchema,
+    PaginationSchema,
+)
 
 
 class ProductUnitSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
@@ -39,6 +46,7 @@ class ProductLotSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
         include_fk = True
         load_instance = True
         sqla_session = session
+        eager_load = ["product"]
 
     invoice_id = auto_field(dump_only=True)
     total_sum = auto_field(dump_only=True)
@@ -51,51 +59,12 @@ class ProductLotSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
     def get_product_name(obj):
         return obj.product.name
 
-    @ma.post_load
-    def calc_price(self, data, **kwargs):
-        quantity = data.get("quantity")
-        product_id = data.get("product_id")
-        product = (
-            session.query(Product)
-            .options(joinedload(Product.containers_r), joinedload(Product.parts_r))
-            .get(product_id)
-        )
-        if not product:
-            raise ItemNotFoundError("Product not found")
-        total_cost = 0.0
-
-        # Calculate cost for containers
-        for product_container in product.containers_r:
-            required_quantity = product_container.quantity * quantity
-            cost = ContainerLot.calculate_fifo_cost(
-                ContainerLot.container_id == product_container.container_id,
-                required_quantity,
-                product_container.container_id,
-            )
-            total_cost += cost
-
-        # Calculate cost for parts
-        for product_part in product.parts_r:
-            required_quantity = product_part.quantity * quantity
-            cost = PartLot.calculate_fifo_cost(
-                PartLot.part_id == product_part.part_id,
-                required_quantity,
-                product_part.part_id,
-            )
-            total_cost += cost
-
-        data["price"] = total_cost / quantity if quantity else 0.0
-        data["total_sum"] = total_cost
-        if len(data["markups"]) != quantity:
-            raise NotRightQuantity("Not right quantity and markups list of array")
-        exist_markups = Markup.query.where(Markup.id.in_(data["markups"])).all()
-        for ex_m in exist_markups:
-            if ex_m.is_used:
-                raise ValidateError("Markup is already used")
-            ex_m.is_used = True
-            ex_m.date_of_use = datetime.now()
-        units_arr = [ProductUnit(id=markup) for markup in data["markups"]]
-        data["units"] = units_arr
+    @ma.post_load(pass_many=True)
+    def calc_price(self, data, many, **kwargs):
+        lines = data if many else [data]
+        markups = check_markups(lines)
+        calc_production_costs(lines)
+        use_markups(lines, markups)
         return data
 
 
@@ -105,6 +74,7 @@ class ContainerLotSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
         include_fk = True
         load_instance = True
         sqla_session = session
+        eager_load = ["container"]
 
     invoice_id = auto_field(dump_only=True)
     total_sum = auto_field(dump_only=True)
@@ -150,6 +120,7 @@ class PartLotSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
         include_fk = True
         load_instance = True
         sqla_session = session
+        eager_load = ["part"]
 
     invoice_id = auto_field(dump_only=True)
     total_sum = auto_field(dump_only=True)
@@ -167,9 +138,7 @@ class PartLotSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
         return data
 
 
-class InvoiceQueryArgSchema(ma.Schema):
-    page = ma.fields.Int(default=1)
-    limit = ma.fields.Int(default=1)
+class InvoiceQueryArgSchema(PaginationQueryArgSchema):
     number = ma.fields.Str(required=False)
     status = ma.fields.Enum(InvoiceStatuses, by_value=True, required=False)
     warehouse_sender_id = ma.fields.Int(required=False)
@@ -200,6 +169,7 @@ class InvoiceSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema, BaseInvoiceSchema)
         load_instance = True
         exclude = ["warehouse_sender_id"]
         sqla_session = session
+        eager_load = ["user", "warehouse_receiver"]
 
     container_lots = ma.fields.Nested(ContainerLotSchema, many=True)
     part_lots = ma.fields.Nested(PartLotSchema, many=True)
@@ -214,6 +184,7 @@ class ProductionSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema, BaseInvoiceSche
         load_instance = True
         exclude = ["warehouse_sender_id"]
         sqla_session = session
+        eager_load = ["user", "warehouse_receiver"]
 
     product_lots = ma.fields.Nested(ProductLotSchema, many=True)
     container_lots = ma.fields.Nested(ContainerLotSchema, many=True)
@@ -229,6 +200,7 @@ class ExpenseSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema, BaseInvoiceSchema)
         exclude = ["warehouse_receiver_id"]
         sqla_session = session
         unknown = ma.INCLUDE  # Add this line to include unknown fields
+        eager_load = ["user", "warehouse_sender"]
 
     product_unit_markups = ma.fields.Nested(
         ProductUnitMoveWebSchema(many=True), required=False, load_only=True
@@ -247,42 +219,39 @@ class ExpenseSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema, BaseInvoiceSchema)
         product_unit_markups = data.pop("product_unit_markups", [])
         with session.no_autoflush:
             if product_unit_markups:
+                markups = [obj.get("markup") for obj in product_unit_markups]
+                without_container = {
+                    obj.get("markup")
+                    for obj in product_unit_markups
+                    if obj["with_container"] is False
+                }
                 expended_products = {}
-                for obj in product_unit_markups:
-                    unit: ProductUnit | None = ProductUnit.query.get(obj.get("markup"))
-                    if unit:
-                        old_lot = unit.product_lot
-                        old_lot.quantity -= 1
-                        old_lot.calc_total_sum()
-                        old_lot.invoice.quantity = old_lot.invoice.available_quantity()
-                        if not expended_products.get(old_lot.product_id):
-                            expended_products[old_lot.product_id] = {}
-                            expended_products[old_lot.product_id]["quantity"] = 1
-                            expended_products[old_lot.product_id][
-                                "price"
-                            ] = old_lot.price
-                            expended_products[old_lot.product_id]["units"] = [unit]
-                        else:
-                            expended_products[old_lot.product_id]["quantity"] += 1
-                            expended_products[old_lot.product_id]["units"].append(unit)
-                        if obj["with_container"] is False:
-                            for container_r in old_lot.product.containers_r:
-                                c_lot = (
-                                    ContainerLot.query.join(
-                                        Invoice, Invoice.id == ContainerLot.invoice_id
-                                    )
-                                    .filter(
-                                        ContainerLot.container_id
-                                        == container_r.container_id,
-                                        # Invoice.warehouse_receiver_id
-                                        # == data["warehouse_sender_id"],
-                                        Invoice.type != InvoiceTypes.EXPENSE,
-                                    )
-                                    .order_by(ContainerLot.created_at.desc())
-                                    .first()
-                                )
-                                if c_lot:
-                                    c_lot.quantity += container_r.quantity
+                for old_lot, unit_ids in take_units(session, markups).items():
+                    product = expended_products.setdefault(
+                        old_lot.product_id,
+                        {"quantity": 0, "price": old_lot.price, "units": []},
+                    )
+                    product["quantity"] += len(unit_ids)
+                    product["units"].extend(unit_ids)
+                    returned = len(without_container.intersection(unit_ids))
+                    if not returned:
+                        continue
+                    for container_r in old_lot.product.containers_r:
+                        c_lot = (
+                            ContainerLot.query.join(
+                                Invoice, Invoice.id == ContainerLot.invoice_id
+                            )
+                            .filter(
+                                ContainerLot.container_id == container_r.container_id,
+                                # Invoice.warehouse_receiver_id
+                                # == data["warehouse_sender_id"],
+                                Invoice.type != InvoiceTypes.EXPENSE,
+                            )
+                            .order_by(ContainerLot.created_at.desc())
+                            .first()
+                        )
+                        if c_lot:
+                            c_lot.quantity += container_r.quantity * returned
                 if expended_products:
                     product_lots = []
                     for product_id, obj in expended_products.items():
@@ -290,7 +259,7 @@ class ExpenseSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema, BaseInvoiceSchema)
                             product_id=product_id,
                             quantity=obj.get("quantity"),
                             price=obj.get("price"),
-                            units=obj.get("units"),
+                            moved_units=obj.get("units"),
                         )
                         lot.calc_total_sum()
                         product_lots.append(lot)
@@ -333,6 +302,7 @@ class TransferSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema, BaseInvoiceSchema
         load_instance = True
         sqla_session = session
         unknown = ma.INCLUDE  # Add this line to include unknown fields
+        eager_load = ["user", "warehouse_receiver", "warehouse_sender"]
 
     product_unit_markups = ma.fields.List(
         ma.fields.Str(), required=False, load_only=True
@@ -356,37 +326,22 @@ class TransferSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema, BaseInvoiceSchema
         data.pop("additionalProp1", [])
         product_unit_markups = data.pop("product_unit_markups", [])
         with session.no_autoflush:
-            units: List[ProductUnit] = ProductUnit.query.filter(
-                ProductUnit.id.in_(product_unit_markups)
-            ).all()
             # Group units by product_id and price
             grouped_units = defaultdict(list)
-            for unit in units:
-                key = (unit.product_lot.product_id, unit.product_lot.price)
-                grouped_units[key].append(unit)
+            for old_lot, unit_ids in take_units(session, product_unit_markups).items():
+                grouped_units[(old_lot.product_id, old_lot.price)].extend(unit_ids)
 
             new_lots = []
-            for (product_id, price), units in grouped_units.items():
-                # Calculate the total quantity for the new lot
-                total_quantity = sum(unit.product_lot.quantity for unit in units)
-
-                # Create a new ProductLot
+            for (product_id, price), unit_ids in grouped_units.items():
+                # единицы переносятся в новый лот после его flush
                 new_lot = ProductLot(
-                    quantity=total_quantity,
+                    quantity=len(unit_ids),
                     price=price,
                     product_id=product_id,
-                    units=units,
+                    moved_units=unit_ids,
                 )
                 new_lot.calc_total_sum()
                 new_lots.append(new_lot)
-
-                # Update units to reference the new lot
-                for unit in units:
-                    old_lot = unit.product_lot
-                    old_lot.quantity -= 1
-                    old_lot.calc_total_sum()
-                    old_lot.invoice.quantity = old_lot.invoice.available_quantity()
-                    unit.product_lot = new_lot
             data["product_lots"] = new_lots
 
             # container SECTION
@@ -419,12 +374,25 @@ class TransferSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema, BaseInvoiceSchema
         return data
 
 
+class InvoiceBatchSchema(ma.Schema):
+    ids = ma.fields.List(
+        ma.fields.Int(), required=True, validate=[ma.validate.Length(min=1, max=500)]
+    )
+
+
+class InvoiceBatchResultSchema(ma.Schema):
+    id = ma.fields.Int()
+    ok = ma.fields.Bool()
+    error = ma.fields.Str(allow_none=True)
+
+
 class InvoiceCommentSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
     class Meta:
         model = InvoiceComment
         include_fk = True
         load_instance = True
         sqla_session = session
+        eager_load = ["user"]
 
     invoice_id = auto_field(dump_only=True)
     user_id = auto_field(dump_only=True)
@@ -441,6 +409,7 @@ class InvoiceLogSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
         include_fk = True
         load_instance = True
         sqla_session = session
+        eager_load = ["user"]
 
     curr_status = ma.fields.Enum(InvoiceStatuses, by_value=True)
     prev_status = ma.fields.Enum(InvoiceStatuses, by_value=True)
@@ -487,6 +456,7 @@ class InvoiceHistorySchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
     class Meta:
         model = Invoice
         include_fk = True
+        eager_load = ["user"]
 
     user_id = auto_field(dump_only=True)
     price = auto_field(dump_only=True)
@@ -509,6 +479,15 @@ class InvoiceDetailSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema, BaseInvoiceS
     class Meta:
         model = Invoice
         include_fk = True
+        eager_load = [
+            "user",
+            "warehouse_receiver",
+            "warehouse_sender",
+            "product_lots.product",
+            "product_lots.units",
+            "container_lots.container",
+            "part_lots.part",
+        ]
 
     warehouse_receiver_address = ma.fields.Method("get_warehouse_receiver_address")
     warehouse_sender_address = ma.fields.Method("get_warehouse_sender_address")
@@ -0,0 +1,120 @@
+from datetime import datetime
+
+from sqlalchemy import func, insert, inspect, select, update
+
+from app.choices import InvoiceStatuses
+from app.invoice.models import Invoice, InvoiceLog
+
+
+def mark_invoices_dirty(db_session, invoice_ids):
+    """Количество и сумма накладных пересчитаются одним UPDATE перед коммитом"""
+    dirty = db_session.info.setdefault("dirty_invoices", set())
+    dirty.update(i for i in invoice_ids if i is not None)
+
+
+def collect_dirty_invoices(db_session):
+    """
+    После flush: накладные новых, изменённых и удалённых лотов (и прежние
+    накладные перенесённых лотов), а также новые накладные - в dirty_invoices
+    """
+    from app.product.models import ContainerLot, PartLot, ProductLot
+
+    invoice_ids = []
+    for obj in (*db_session.new, *db_session.dirty, *db_session.deleted):
+        if isinstance(obj, Invoice):
+            invoice_ids.append(obj.id)
+        elif isinstance(obj, (ProductLot, ContainerLot, PartLot)):
+            invoice_ids.append(obj.invoice_id)
+            invoice_ids.extend(inspect(obj).attrs.invoice_id.history.deleted)
+    if invoice_ids:
+        mark_invoices_dirty(db_session, invoice_ids)
+
+
+def _lots_total(LotModel, column):
+    return (
+        select(func.coalesce(func.sum(column), 0))
+        .where(LotModel.invoice_id == Invoice.id)
+        .scalar_subquery()
+    )
+
+
+def recalc_invoices(db_session, invoice_ids):
+    """Invoice.quantity/price = суммы по всем лотам накладной"""
+    from app.product.models import ContainerLot, PartLot, ProductLot
+
+    if not invoice_ids:
+        return
+    lot_models = (ProductLot, ContainerLot, PartLot)
+    db_session.execute(
+        update(Invoice)
+        .where(Invoice.id.in_(list(invoice_ids)))
+        .values(
+            quantity=sum(_lots_total(Lot, Lot.quantity) for Lot in lot_models),
+            price=sum(_lots_total(Lot, Lot.total_sum) for Lot in lot_models),
+        )
+        .execution_options(synchronize_session="fetch")
+    )
+
+
+def flush_dirty_invoices(db_session):
+    # before_commit вызывается до flush коммита - лоты отмечаются при этом flush
+    db_session.flush()
+    if not db_session.info.get("dirty_invoices"):
+        return
+    recalc_invoices(db_session, db_session.info.pop("dirty_invoices", set()))
+
+
+def publish_invoices(db_session, invoice_ids, invoice_type, user_id):
+    """
+    Опубликовать черновики invoice_type одной транзакцией: строки блокируются
+    по порядку id, статус меняется одним UPDATE, журнал - одним INSERT,
+    остатки складов - одним INSERT ... SELECT. Коммит - на стороне вызывающего.
+    Возвращает {id: None | текст ошибки}.
+    """
+    from app.warehouse.utils import apply_invoices_to_stock
+
+    invoice_ids = sorted(set(invoice_ids))
+    statuses = dict(
+        db_session.execute(
+            select(Invoice.id, Invoice.status)
+            .where(Invoice.id.in_(invoice_ids), Invoice.type == invoice_type)
+            .order_by(Invoice.id)
+            .with_for_update()
+        ).all()
+    )
+    results = {}
+    for invoice_id in invoice_ids:
+        status = statuses.get(invoice_id)
+        if status is None:
+            results[invoice_id] = f"Not found by this id {invoice_id}"
+        elif status != InvoiceStatuses.DRAFT:
+            results[invoice_id] = "Invoice should be in draft status to publish"
+        else:
+            results[invoice_id] = None
+    published = [invoice_id for invoice_id, error in results.items() if not error]
+    if not published:
+        return results
+
+    now = datetime.now()
+    db_session.execute(
+        update(Invoice)
+        .where(Invoice.id.in_(published))
+        .values(status=InvoiceStatuses.PUBLISHED, updated_at=now)
+    )
+    db_session.execute(
+        insert(InvoiceLog),
+        [
+            {
+                "invoice_id": invoice_id,
+                "curr_status": InvoiceStatuses.PUBLISHED,
+                "prev_status": InvoiceStatuses.DRAFT,
+                "user_id": user_id,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for invoice_id in published
+        ],
+    )
+    # статус изменён в обход ORM - остатки пересчитываются явно
+    apply_invoices_to_stock(db_session, published)
+    return results
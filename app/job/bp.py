@@ -0,0 +1,53 @@
+from flask.views import MethodView
+from flask_smorest import Blueprint
+
+from app.job.models import Job, JobRun
+from app.job.schema import (
+    JobQueryArgSchema,
+    JobRunQueryArgSchema,
+    JobSchema,
+    PagJobRunSchema,
+    PagJobSchema,
+)
+from app.utils.func import sql_exception_handler, token_required
+from app.utils.pagination import paginate, pop_pagination
+from app.utils.schema import ResponseSchema
+
+job = Blueprint("job", __name__, url_prefix="/job", description="Фоновые задачи")
+
+
+@job.route("/")
+class JobAllView(MethodView):
+    @token_required
+    @sql_exception_handler
+    @job.arguments(JobQueryArgSchema, location="query")
+    @job.response(200, PagJobSchema)
+    def get(c, self, args):
+        """List background jobs"""
+        pagination = pop_pagination(args)
+        query = Job.query.filter_by(**args).order_by(Job.created_at.desc())
+        return paginate(query, pagination, Job)
+
+
+@job.route("/<int:job_id>/")
+class JobByIdView(MethodView):
+    @token_required
+    @sql_exception_handler
+    @job.response(400, ResponseSchema)
+    @job.response(200, JobSchema)
+    def get(c, self, job_id):
+        """Get job status, progress and result"""
+        return Job.get_by_id(job_id)
+
+
+@job.route("/runs/")
+class JobRunAllView(MethodView):
+    @token_required
+    @sql_exception_handler
+    @job.arguments(JobRunQueryArgSchema, location="query")
+    @job.response(200, PagJobRunSchema)
+    def get(c, self, args):
+        """List scheduled job runs"""
+        pagination = pop_pagination(args)
+        query = JobRun.query.filter_by(**args).order_by(JobRun.created_at.desc())
+        return paginate(query, pagination, JobRun)
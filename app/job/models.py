@@ -0,0 +1,53 @@
+import datetime as dt
+from typing import Optional
+
+from sqlalchemy import JSON, Enum, ForeignKey, Index, String, Text, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.base import Base
+from app.choices import JobStatuses
+
+
+class Job(Base):
+    """Фоновая задача в очереди, выполняется воркером (worker.py)"""
+
+    __tablename__ = "job"
+    __table_args__ = (Index("ix_job_status_run_at", "status", "run_at"),)
+
+    name: Mapped[str] = mapped_column(String(100))
+    status: Mapped[JobStatuses] = mapped_column(
+        Enum(JobStatuses), default=JobStatuses.PENDING
+    )
+    payload: Mapped[Optional[dict]] = mapped_column(JSON)
+    progress: Mapped[Optional[dict]] = mapped_column(JSON)
+    result: Mapped[Optional[dict]] = mapped_column(JSON)
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    attempts: Mapped[int] = mapped_column(default=0)
+    max_attempts: Mapped[int] = mapped_column(default=1)
+    # не раньше этого времени
+    run_at: Mapped[dt.datetime] = mapped_column(default=dt.datetime.now)
+    started_at: Mapped[Optional[dt.datetime]]
+    # воркер жив, пока обновляет; по нему задача считается зависшей
+    heartbeat_at: Mapped[Optional[dt.datetime]]
+    finished_at: Mapped[Optional[dt.datetime]]
+    # host:pid воркера, взявшего задачу
+    worker: Mapped[Optional[str]] = mapped_column(String(100))
+    user_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("user.id", ondelete="SET NULL")
+    )
+
+
+class JobRun(Base):
+    """Запуск задачи по расписанию: не больше одного успешного на дату"""
+
+    __tablename__ = "job_run"
+    __table_args__ = (UniqueConstraint("job_name", "run_date"),)
+
+    job_name: Mapped[str] = mapped_column(String(100))
+    run_date: Mapped[dt.date]
+    status: Mapped[JobStatuses] = mapped_column(Enum(JobStatuses))
+    started_at: Mapped[Optional[dt.datetime]]
+    finished_at: Mapped[Optional[dt.datetime]]
+    duration: Mapped[Optional[float]] = mapped_column(comment="секунды")
+    rows: Mapped[Optional[int]] = mapped_column(comment="затронуто строк")
+    error: Mapped[Optional[str]] = mapped_column(Text)
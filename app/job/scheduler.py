@@ -0,0 +1,206 @@
+import datetime
+import logging
+import threading
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+
+from app.base import engine, session
+from app.choices import JobStatuses
+from app.job.models import JobRun
+
+logger = logging.getLogger(__name__)
+
+# ключ pg_advisory_lock лидера планировщика
+SCHEDULER_LOCK_ID = 7301
+# пропущенные запуски догоняются не дальше этого числа дней
+CATCHUP_DAYS = 7
+
+# имя -> task(db_session, run_date) -> число затронутых строк
+SCHEDULED_JOBS = {}
+
+
+def register_scheduled(name):
+    """
+    Декоратор задачи по расписанию. Задача не коммитит сама и должна быть
+    идемпотентна для даты: пропущенные дни выполняются позже той же задачей.
+    """
+
+    def decorator(task):
+        SCHEDULED_JOBS[name] = task
+        return task
+
+    return decorator
+
+
+class LeaderLock:
+    """
+    Лидер среди процессов (gunicorn, воркеры): сессионный advisory lock
+    на отдельном соединении. Держится, пока жив процесс; при его падении
+    лидером становится следующий процесс, вызвавший acquire.
+    """
+
+    def __init__(self, lock_id=SCHEDULER_LOCK_ID):
+        self.lock_id = lock_id
+        self.connection = None
+        self._mutex = threading.Lock()
+
+    def acquire(self):
+        with self._mutex:
+            if self.connection is not None:
+                try:
+                    self.connection.scalar(text("SELECT 1"))
+                    return True
+                except DBAPIError:
+                    self._close()
+            connection = engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT"
+            )
+            if connection.scalar(select(func.pg_try_advisory_lock(self.lock_id))):
+                self.connection = connection
+                logger.info(f"Scheduler leader lock {self.lock_id} acquired")
+                return True
+            connection.close()
+            return False
+
+    def _close(self):
+        try:
+            self.connection.invalidate()
+        finally:
+            self.connection = None
+
+
+leader = LeaderLock()
+
+
+def _save_failure(db_session, name, run_date, started, error):
+    stmt = insert(JobRun).values(
+        job_name=name,
+        run_date=run_date,
+        status=JobStatuses.FAILED,
+        started_at=started,
+        finished_at=datetime.datetime.now(),
+        error=error,
+    )
+    run_id = db_session.scalar(
+        stmt.on_conflict_do_update(
+            index_elements=["job_name", "run_date"],
+            set_={
+                "status": stmt.excluded.status,
+                "finished_at": stmt.excluded.finished_at,
+                "error": stmt.excluded.error,
+            },
+        ).returning(JobRun.id)
+    )
+    db_session.commit()
+    return run_id
+
+
+def run_scheduled(db_session, name, run_date):
+    """
+    Выполнить задачу за run_date, если она ещё не выполнена (или упала).
+    Строка job_run вставляется в транзакции задачи: параллельный запуск
+    ждёт на уникальном индексе и после коммита первого ничего не делает.
+    Возвращает JobRun или None, если запуск уже был.
+    """
+    task = SCHEDULED_JOBS[name]
+    started = datetime.datetime.now()
+    stmt = insert(JobRun).values(
+        job_name=name,
+        run_date=run_date,
+        status=JobStatuses.RUNNING,
+        started_at=started,
+    )
+    run_id = db_session.scalar(
+        stmt.on_conflict_do_update(
+            index_elements=["job_name", "run_date"],
+            set_={"status": stmt.excluded.status, "started_at": started, "error": None},
+            where=JobRun.status == JobStatuses.FAILED,
+        ).returning(JobRun.id)
+    )
+    if run_id is None:
+        db_session.rollback()
+        return None
+    try:
+        rows = task(db_session, run_date)
+        finished = datetime.datetime.now()
+        db_session.execute(
+            update(JobRun)
+            .where(JobRun.id == run_id)
+            .values(
+                status=JobStatuses.DONE,
+                finished_at=finished,
+                duration=(finished - started).total_seconds(),
+                rows=rows,
+            )
+        )
+        db_session.commit()
+    except Exception as e:
+        db_session.rollback()
+        logger.exception(f"Scheduled job {name} for {run_date} failed")
+        run_id = _save_failure(db_session, name, run_date, started, str(e))
+    return db_session.get(JobRun, run_id)
+
+
+def missed_dates(db_session, name, until, start_new=True):
+    """
+    Даты до until включительно без успешного запуска: с первого запуска
+    задачи, но не больше CATCHUP_DAYS. Задача без запусков - только until
+    (start_new=False - ничего).
+    """
+    first = db_session.scalar(
+        select(func.min(JobRun.run_date)).where(JobRun.job_name == name)
+    )
+    if first is None:
+        return [until] if start_new else []
+    start = max(first, until - datetime.timedelta(days=CATCHUP_DAYS - 1))
+    done = set(
+        db_session.scalars(
+            select(JobRun.run_date).where(
+                JobRun.job_name == name,
+                JobRun.status == JobStatuses.DONE,
+                JobRun.run_date.between(start, until),
+            )
+        )
+    )
+    days = (until - start).days + 1
+    return [
+        day
+        for day in (start + datetime.timedelta(days=n) for n in range(days))
+        if day not in done
+    ]
+
+
+def catch_up(db_session, name, until=None, start_new=True):
+    """Выполнить пропущенные запуски задачи по порядку дат"""
+    until = until or datetime.date.today()
+    return [
+        run
+        for run_date in missed_dates(db_session, name, until, start_new)
+        if (run := run_scheduled(db_session, name, run_date)) is not None
+    ]
+
+
+def run_leader_job(app, name):
+    """Запуск по расписанию: выполняет только процесс-лидер"""
+    with app.app_context():
+        if not leader.acquire():
+            return
+        try:
+            catch_up(session, name)
+        finally:
+            session.remove()
+
+
+def catch_up_all(app):
+    """Периодически: догнать прошлые дни всех задач (сегодня - по расписанию)"""
+    with app.app_context():
+        if not leader.acquire():
+            return
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        try:
+            for name in SCHEDULED_JOBS:
+                catch_up(session, name, yesterday, start_new=False)
+        finally:
+            session.remove()
@@ -0,0 +1,41 @@
+import marshmallow as ma
+from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
+
+from app.choices import JobStatuses
+from app.job.models import Job, JobRun
+from app.utils.schema import PaginationQueryArgSchema, PaginationSchema
+
+
+class JobSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = Job
+        include_fk = True
+
+    status = ma.fields.Enum(JobStatuses, by_value=True)
+
+
+class JobQueryArgSchema(PaginationQueryArgSchema):
+    name = ma.fields.Str(required=False)
+    status = ma.fields.Enum(JobStatuses, by_value=True, required=False)
+
+
+class PagJobSchema(ma.Schema):
+    data = ma.fields.Nested(JobSchema(many=True))
+    pagination = ma.fields.Nested(PaginationSchema)
+
+
+class JobRunSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = JobRun
+
+    status = ma.fields.Enum(JobStatuses, by_value=True)
+
+
+class JobRunQueryArgSchema(PaginationQueryArgSchema):
+    job_name = ma.fields.Str(required=False)
+    status = ma.fields.Enum(JobStatuses, by_value=True, required=False)
+
+
+class PagJobRunSchema(ma.Schema):
+    data = ma.fields.Nested(JobRunSchema(many=True))
+    pagination = ma.fields.Nested(PaginationSchema)
@@ -0,0 +1,221 @@
+import datetime
+import logging
+import os
+import signal
+import socket
+import threading
+
+from sqlalchemy import select, update
+
+from app.base import engine, session
+from app.choices import JobStatuses
+from app.job.models import Job
+from app.utils.exc import ValidateError
+
+logger = logging.getLogger(__name__)
+
+# секунд между опросами очереди, когда задач нет
+JOB_POLL_INTERVAL = 2
+# секунд между отметками heartbeat_at выполняющейся задачи
+JOB_HEARTBEAT_INTERVAL = 30
+# RUNNING без heartbeat дольше - воркер считается упавшим,
+# задача возвращается в очередь
+JOB_TIMEOUT = datetime.timedelta(minutes=5)
+
+# имя задачи -> handler(db_session, payload, progress) -> result
+JOB_HANDLERS = {}
+
+
+def register_job(name):
+    """
+    Декоратор обработчика задачи. progress(dict) сохраняет прогресс сразу,
+    вне транзакции задачи; результат должен сериализоваться в JSON.
+    """
+
+    def decorator(handler):
+        JOB_HANDLERS[name] = handler
+        return handler
+
+    return decorator
+
+
+def enqueue(db_session, name, payload=None, user=None, run_at=None, max_attempts=1):
+    """Поставить задачу в очередь; коммит - на стороне вызывающего"""
+    if name not in JOB_HANDLERS:
+        raise ValidateError(f"Unknown job: {name}")
+    job = Job(
+        name=name,
+        payload=payload,
+        user_id=user.id if user else None,
+        run_at=run_at or datetime.datetime.now(),
+        max_attempts=max_attempts,
+    )
+    db_session.add(job)
+    db_session.flush()
+    return job
+
+
+def set_progress(job_id, progress):
+    """Прогресс отдельным соединением - виден до коммита задачи"""
+    with engine.begin() as connection:
+        connection.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(progress=progress, heartbeat_at=datetime.datetime.now())
+        )
+
+
+def heartbeat(job_id):
+    with engine.begin() as connection:
+        connection.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == JobStatuses.RUNNING)
+            .values(heartbeat_at=datetime.datetime.now())
+        )
+
+
+def _heartbeat_loop(job_id, done):
+    """Отметки живости, пока задача выполняется (даже без прогресса)"""
+    while not done.wait(JOB_HEARTBEAT_INTERVAL):
+        try:
+            heartbeat(job_id)
+        except Exception:
+            logger.exception(f"Job #{job_id} heartbeat failed")
+
+
+def claim_job(db_session, worker_name):
+    """
+    Взять следующую задачу: SKIP LOCKED - параллельные воркеры
+    не ждут друг друга и не берут одну задачу дважды.
+    """
+    job = db_session.scalars(
+        select(Job)
+        .where(
+            Job.status == JobStatuses.PENDING,
+            Job.run_at <= datetime.datetime.now(),
+        )
+        .order_by(Job.run_at, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+    if job is None:
+        db_session.rollback()
+        return None
+    job.status = JobStatuses.RUNNING
+    job.attempts += 1
+    job.started_at = job.heartbeat_at = datetime.datetime.now()
+    job.worker = worker_name
+    db_session.commit()
+    return job
+
+
+def _finish(job, status, result=None, error=None):
+    job.status = status
+    job.result = result
+    job.error = error
+    job.finished_at = datetime.datetime.now()
+
+
+def run_job(db_session, job):
+    """
+    Выполнить задачу; результат и статус DONE коммитятся вместе с работой
+    обработчика. При ошибке - повтор, пока есть попытки, иначе FAILED.
+    """
+    job_id = job.id
+    try:
+        handler = JOB_HANDLERS.get(job.name)
+        if handler is None:
+            raise ValidateError(f"Unknown job: {job.name}")
+        result = handler(
+            db_session,
+            job.payload or {},
+            lambda progress: set_progress(job_id, progress),
+        )
+        _finish(job, JobStatuses.DONE, result=result)
+        db_session.commit()
+    except Exception as e:
+        db_session.rollback()
+        logger.exception(f"Job #{job_id} failed")
+        job = db_session.get(Job, job_id)
+        if job.attempts < job.max_attempts:
+            job.status = JobStatuses.PENDING
+            job.error = str(e)
+        else:
+            _finish(job, JobStatuses.FAILED, error=str(e))
+        db_session.commit()
+
+
+def release_stale_jobs(db_session):
+    """Задачи упавших воркеров (нет heartbeat) - снова в очередь или FAILED"""
+    stale = (
+        Job.status == JobStatuses.RUNNING,
+        Job.heartbeat_at < datetime.datetime.now() - JOB_TIMEOUT,
+    )
+    db_session.execute(
+        update(Job)
+        .where(*stale, Job.attempts < Job.max_attempts)
+        .values(status=JobStatuses.PENDING)
+    )
+    db_session.execute(
+        update(Job)
+        .where(*stale)
+        .values(
+            status=JobStatuses.FAILED,
+            error="Job timed out",
+            finished_at=datetime.datetime.now(),
+        )
+    )
+    db_session.commit()
+
+
+def _worker_loop(app, worker_name, stop, release_stale):
+    with app.app_context():
+        db_session = session()
+        try:
+            while not stop.is_set():
+                job = claim_job(db_session, worker_name)
+                if job is None:
+                    if release_stale:
+                        release_stale_jobs(db_session)
+                    stop.wait(JOB_POLL_INTERVAL)
+                    continue
+                logger.info(f"{worker_name}: job #{job.id} {job.name}")
+                done = threading.Event()
+                beat = threading.Thread(
+                    target=_heartbeat_loop,
+                    args=(job.id, done),
+                    name=f"{threading.current_thread().name}-heartbeat",
+                    daemon=True,
+                )
+                beat.start()
+                try:
+                    run_job(db_session, job)
+                finally:
+                    done.set()
+                    beat.join()
+        finally:
+            session.remove()
+
+
+def run_worker(app, concurrency=1):
+    """
+    Воркер очереди: concurrency потоков, каждый со своей сессией.
+    SIGTERM/SIGINT - дождаться текущих задач и выйти.
+    """
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(
+            target=_worker_loop,
+            args=(app, f"{prefix}:{n}", stop, n == 0),
+            name=f"job-worker-{n}",
+        )
+        for n in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info(f"Job worker {prefix} started, concurrency {concurrency}")
+    for thread in threads:
+        thread.join()
@@ -1,90 +1,58 @@
 import datetime
 import logging
 
-from sqlalchemy import func, types
-
-from app.base import session
-from app.choices import DaysOfWeekShort, WorkScheduleStatus
-from app.finance.models import Counterparty
-from app.user.models import User, WorkingDay, WorkSchedule
-from app.utils.func import sql_exception_handler
+from app.finance.auto_charge import create_auto_charges
+from app.job.scheduler import register_scheduled
+from app.job.utils import enqueue, register_job
+from app.user.utils import create_work_schedules
 
 logger = logging.getLogger(__name__)
 
-
-@sql_exception_handler
-def scheduled_auto_charge_task():
-    current_date = datetime.datetime.now().date()
-    logger.info("Starts scheduled_auto_charge_task!")
-    counterparties = Counterparty.query.filter(
-        Counterparty.auto_charge == True,
-        # Проверяем, что текущая дата меньше или равна дате создания + месяцы начисления
-        func.date(
-            Counterparty.created_at
-            + func.cast(
-                func.concat(Counterparty.charge_period_months, " months"),
-                types.Interval,
-            )
-        )
-        >= current_date,
-    ).all()
-
-    for counterparty in counterparties:
-        transaction = counterparty.create_auto_charge_transaction(
-            month=counterparty.created_at.month,
-            year=counterparty.created_at.year,
-            n=counterparty.charge_period_months,
-        )
-        session.add(transaction)
-    session.commit()
+# (id задачи APScheduler, имя задачи, час, минута)
+SCHEDULED_CRON = [
+    ("auto_charge_job", "auto_charge", "0", "0"),
+    ("auto_create_working_schedule_job", "working_schedule", "1", "0"),
+    ("balance_snapshot_job", "balance_snapshot", "0", "30"),
+]
 
 
-@sql_exception_handler
-def create_working_days_for_all_staff_task():
-    all_staff = session.query(User).all()
+@register_scheduled("auto_charge")
+def scheduled_auto_charge_task(db_session, run_date):
+    logger.info(f"Starts scheduled_auto_charge_task for {run_date}!")
+    return create_auto_charges(db_session, run_date)
 
-    # Получаем текущее строковое представление дня недели в формате 'MONDAY', 'TUESDAY' и т.д.
-    today_string = datetime.datetime.today().strftime("%a").upper()
 
-    today_date = datetime.date.today()
+@register_scheduled("working_schedule")
+def create_working_days_for_all_staff_task(db_session, run_date):
+    return create_work_schedules(db_session, run_date)
 
-    # Преобразуем строку в элемент перечисления DaysOfWeekShort
-    today_enum = DaysOfWeekShort[today_string]
 
-    for user in all_staff:
-        # Получаем график работы из DaysOfWeekShort для каждого сотрудника
-        working_day = (
-            session.query(WorkingDay)
-            .filter(WorkingDay.user == user, WorkingDay.day_of_week == today_enum)
-            .first()
-        )
+@register_scheduled("balance_snapshot")
+def snapshot_balances_task(db_session, run_date):
+    """
+    Снимок балансов на конец предыдущего дня. Полная сверка с транзакциями
+    уходит фоновому воркеру, а не процессу планировщика.
+    """
+    from app.finance.ledger import snapshot_balances
 
-        existing_schedule = (
-            session.query(WorkSchedule)
-            .filter(
-                WorkSchedule.user == user,
-                WorkSchedule.date == today_date,
-            )
-            .first()
-        )
-        data = {}
-        if not existing_schedule:
-            if working_day:
-                # Создаем рабочий день на основе графика
-                data["working_day_id"] = working_day.id
-                data["status"] = (
-                    WorkScheduleStatus.DAY_OFF
-                    if not working_day.is_working_day
-                    else None
-                )
+    rows = snapshot_balances(db_session, run_date - datetime.timedelta(days=1))
+    enqueue(db_session, "reconcile_balances")
+    return rows
 
-            working_schedule = WorkSchedule(
-                user=user,
-                date=today_date,
-                working_day_id=data.get("working_day_id"),
-                status=data.get("status"),
-            )
 
-            session.add(working_schedule)
+@register_job("reconcile_balances")
+def reconcile_balances_job(db_session, payload, progress):
+    """Сверка balance с транзакциями; расхождения - в лог и в результат задачи"""
+    from app.finance.ledger import reconcile_balances
 
-    session.commit()
+    mismatches = reconcile_balances(db_session)
+    for account_type, account_id, balance, expected in mismatches:
+        logger.warning(
+            f"Balance mismatch {account_type} #{account_id}: {balance} != {expected}"
+        )
+    return {
+        "mismatches": [
+            [account_type, account_id, float(balance or 0), float(expected)]
+            for account_type, account_id, balance, expected in mismatches
+        ]
+    }
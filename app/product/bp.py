@@ -5,12 +5,14 @@ from flask import current_app
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
 
-from app.choices import InvoiceStatuses, InvoiceTypes
+from app.choices import StockItemTypes
 from app.invoice.models import Invoice
 from app.invoice.schema import ProductUnitSchema
-from app.product.models import Container, ContainerPart, Part, Product, ProductLot, ProductPart, ProductUnit
+from app.product.models import ContainerPart, Product, ProductLot, ProductPart, ProductUnit
+from app.product.utils import get_all_stats
 from app.product.schema import (
     AllProductsStats,
+    AllProductsStatsQuerySchema,
     MarkupsArray,
     OneProductInvoiceStatsQuery,
     PagProductSchema,
@@ -21,11 +23,14 @@ from app.product.schema import (
     StandaloneProductWarehouseStats,
 )
 from app.base import session
+from app.search.utils import search_filter
 from app.user.models import User
+from app.utils.filters import date_between
 from app.utils.exc import ItemNotFoundError
 from app.utils.func import hash_image_save, msg_response, sql_exception_handler, token_required
 from app.utils.schema import ResponseSchema
-from app.warehouse.models import Warehouse
+from app.warehouse.models import StockBalance, Warehouse
+from app.utils.pagination import paginate, pop_pagination
 
 
 product = Blueprint(
@@ -41,37 +46,19 @@ class ProductAllView(MethodView):
     @product.response(200, PagProductSchema)
     def get(c, self, args):
         """List products"""
-        page = args.pop("page", 1)
+        pagination = pop_pagination(args)
         warehouse_id = args.pop("warehouse_id", None)
-        try:
-            limit = int(args.pop("limit", 10))
-            if limit <= 0:
-                limit = 10
-        except ValueError:
-            limit = 10
-        if limit <= 0:
-            limit = 10
+        name = args.pop("name", None)
         query = Product.query.filter_by(**args).order_by(Product.created_at.desc())
+        if name:
+            query = query.filter(search_filter("product", name))
         if warehouse_id:
             query = (
                 query.join(ProductLot, ProductLot.product_id == Product.id)
                 .join(Invoice, Invoice.id == ProductLot.invoice_id)
                 .where(Invoice.warehouse_receiver_id == warehouse_id)
             )
-        total_count = query.count()
-        total_pages = (total_count + limit - 1) // limit
-        data = query.limit(limit).offset((page - 1) * limit).all()
-        response = {
-            "data": data,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total_pages": total_pages,
-                "total_count": total_count,
-            },
-        }
-
-        return response
+        return paginate(query, pagination, Product)
 
     @token_required
     @sql_exception_handler
@@ -184,13 +171,10 @@ def get_product_units(cur_user, product_id, warehouse_id):
 @product.get("/stats/")
 @token_required
 @sql_exception_handler
+@product.arguments(AllProductsStatsQuerySchema, location="query")
 @product.response(200, AllProductsStats)
-def all_product_stats(cur_user):
-    return {
-        "products": Product.query.all(),
-        "containers": Container.query.all(),
-        "parts": Part.query.all(),
-    }
+def all_product_stats(cur_user, args):
+    return get_all_stats(**args)
 
 
 @product.post("/check_markups/")
@@ -218,38 +202,25 @@ def check_markup(c, data):
 @product.response(200, StandaloneProductWarehouseStats)
 def standalone_product_warehouse_stats(c, product_id):
     Product.get_by_id(product_id)
-    total_quantity_sum = (
-        session.query(func.sum(ProductLot.quantity), func.sum(ProductLot.total_sum))
-        .join(Invoice, ProductLot.invoice_id == Invoice.id)
-        .filter(
-            Invoice.warehouse_receiver_id.isnot(None),
-            Invoice.status == InvoiceStatuses.PUBLISHED,
-            Invoice.type != InvoiceTypes.EXPENSE,
-            ProductLot.quantity != 0,
-            ProductLot.product_id == product_id,
-        )
-        .all()
-    )
-    total_quantity, total_sum = total_quantity_sum[0]
     warehouse_data = (
         session.query(
             Warehouse.id.label("warehouse_id"),
             Warehouse.name.label("warehouse_name"),
-            func.sum(ProductLot.quantity).label("total_quantity"),
-            func.sum(ProductLot.total_sum).label("total_sum"),
+            StockBalance.quantity.label("total_quantity"),
+            StockBalance.total_sum.label("total_sum"),
         )
-        .join(Invoice, ProductLot.invoice_id == Invoice.id)
-        .join(Warehouse, Invoice.warehouse_receiver_id == Warehouse.id)
+        .join(Warehouse, StockBalance.warehouse_id == Warehouse.id)
         .filter(
-            Invoice.warehouse_receiver_id.isnot(None),
-            Invoice.status == InvoiceStatuses.PUBLISHED,
-            Invoice.type != InvoiceTypes.EXPENSE,
-            ProductLot.quantity != 0,
-            ProductLot.product_id == product_id,
+            StockBalance.item_type == StockItemTypes.PRODUCT,
+            StockBalance.item_id == product_id,
+            StockBalance.quantity != 0,
         )
-        .group_by(Warehouse.id, Warehouse.name)
         .all()
     )
+    total_quantity = total_sum = None
+    if warehouse_data:
+        total_quantity = sum(row.total_quantity for row in warehouse_data)
+        total_sum = sum(row.total_sum for row in warehouse_data)
     response = {
         "total_quantity": total_quantity,
         "total_sum": total_sum,
@@ -292,7 +263,7 @@ def standalone_product_invoice_stats(c, args, product_id):
     if user_id_filter:
         query = query.filter(Invoice.user_id == user_id_filter)
     if date_filter:
-        query = query.filter(func.date(Invoice.created_at) == date_filter)
+        query = query.filter(date_between(Invoice.created_at, date_filter))
 
     invoices_with_product = query.group_by(
         Invoice.id,
@@ -19,7 +19,9 @@ from app.product.schema import (
     StandaloneProductWarehouseStats,
 )
 from app.base import session
+from app.search.utils import search_filter
 from app.user.models import User
+from app.utils.filters import date_between
 from app.utils.exc import ItemNotFoundError
 from app.utils.func import (
     hash_image_save,
@@ -29,6 +31,7 @@ from app.utils.func import (
 )
 from app.utils.schema import ResponseSchema
 from app.warehouse.models import Warehouse
+from app.utils.pagination import paginate, pop_pagination
 
 
 container = Blueprint(
@@ -44,37 +47,19 @@ class ContainerAllView(MethodView):
     @container.response(200, PagContainerSchema)
     def get(c, self, args):
         """List containers"""
-        page = args.pop("page", 1)
+        pagination = pop_pagination(args)
         warehouse_id = args.pop("warehouse_id", None)
-        try:
-            limit = int(args.pop("limit", 10))
-            if limit <= 0:
-                limit = 10
-        except ValueError:
-            limit = 10
-        if limit <= 0:
-            limit = 10
+        name = args.pop("name", None)
         query = Container.query.filter_by(**args).order_by(Container.created_at.desc())
+        if name:
+            query = query.filter(search_filter("container", name))
         if warehouse_id:
             query = (
                 query.join(ContainerLot, ContainerLot.container_id == Container.id)
                 .join(Invoice, Invoice.id == ContainerLot.invoice_id)
                 .where(Invoice.warehouse_receiver_id == warehouse_id)
             )
-        total_count = query.count()
-        total_pages = (total_count + limit - 1) // limit
-        data = query.limit(limit).offset((page - 1) * limit).all()
-        response = {
-            "data": data,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total_pages": total_pages,
-                "total_count": total_count,
-            },
-        }
-
-        return response
+        return paginate(query, pagination, Container)
 
     @token_required
     @sql_exception_handler
@@ -235,7 +220,7 @@ def standalone_container_invoice_stats(c, args, container_id):
     if user_id_filter:
         query = query.filter(Invoice.user_id == user_id_filter)
     if date_filter:
-        query = query.filter(func.date(Invoice.created_at) == date_filter)
+        query = query.filter(date_between(Invoice.created_at, date_filter))
 
     invoices_with_container = query.group_by(
         Invoice.id,
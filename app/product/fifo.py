@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import contains_eager
+
+from app.base import session
+from app.invoice.models import Invoice
+from app.invoice.utils import mark_invoices_dirty
+
+FIFO_BATCH_SIZE = 50
+# секунды; другие воркеры видят изменения лотов не позже чем через TTL
+QUOTE_CACHE_TTL = 60
+
+# позиций в кэше (вытесняются давно не читавшиеся) и количеств на позицию
+QUOTE_CACHE_SIZE = 1000
+QUOTE_CACHE_QUANTITIES = 20
+
+# (таблица лота, id позиции) -> {количество: (истекает, стоимость)}, LRU
+_quote_cache = OrderedDict()
+_quote_lock = threading.Lock()
+
+
+def iter_fifo_lots(LotModel, filters, lock=True, batch_size=FIFO_BATCH_SIZE):
+    """
+    Лоты с остатком в порядке поступления (created_at, id), пачками по batch_size.
+    lock=True - строки блокируются (FOR UPDATE): списание другого воркера
+    дожидается, порядок FIFO не нарушается и занятые лоты не считаются
+    недостачей.
+    """
+    last = None
+    while True:
+        query = (
+            session.query(LotModel)
+            .join(Invoice, Invoice.id == LotModel.invoice_id)
+            .filter(*filters, LotModel.quantity > 0)
+            # накладная лота нужна учёту остатков при flush - без отдельных SELECT
+            .options(contains_eager(LotModel.invoice))
+        )
+        if last is not None:
+            query = query.filter(tuple_(LotModel.created_at, LotModel.id) > last)
+        query = query.order_by(LotModel.created_at, LotModel.id).limit(batch_size)
+        if lock:
+            query = query.with_for_update(of=LotModel)
+            query = query.populate_existing()
+        lots = query.all()
+        for lot in lots:
+            yield lot
+        # после ожидания блокировки строка, списанная до нуля, выпадает из
+        # пачки - короткая пачка ещё не значит, что лотов больше нет
+        if not lots or (not lock and len(lots) < batch_size):
+            return
+        last = (lots[-1].created_at, lots[-1].id)
+
+
+def consume_fifo(LotModel, filters, quantity, consume=True):
+    """
+    Списание quantity по FIFO. Возвращает ([(lot, списано), ...], не хватило).
+    consume=False - только расчёт, без блокировок и изменений лотов.
+    Пересчёт количества/суммы затронутых накладных откладывается до коммита.
+    """
+    consumed = []
+    remaining = quantity
+    if remaining <= 0:
+        return consumed, 0
+    for lot in iter_fifo_lots(LotModel, filters, lock=consume):
+        taken = min(lot.quantity, remaining)
+        consumed.append((lot, taken))
+        remaining -= taken
+        if remaining == 0:
+            break
+    if consume:
+        for lot, taken in consumed:
+            lot.quantity -= taken
+            lot.calc_total_sum()
+        mark_invoices_dirty(session, [lot.invoice_id for lot, _ in consumed])
+    return consumed, remaining
+
+
+def _cached_quote(key, quantity, now):
+    """Стоимость из кэша или None; просроченная запись удаляется"""
+    with _quote_lock:
+        quotes = _quote_cache.get(key)
+        cached = quotes.get(quantity) if quotes else None
+        if cached is None:
+            return None
+        if cached[0] <= now:
+            del quotes[quantity]
+            if not quotes:
+                del _quote_cache[key]
+            return None
+        _quote_cache.move_to_end(key)
+        return cached[1]
+
+
+def _cache_quote(key, quantity, cost, now):
+    """Запомнить стоимость, убрав просроченные записи позиции и лишние позиции"""
+    with _quote_lock:
+        quotes = {
+            cached_quantity: cached
+            for cached_quantity, cached in _quote_cache.pop(key, {}).items()
+            if cached[0] > now
+        }
+        quotes[quantity] = (now + QUOTE_CACHE_TTL, cost)
+        while len(quotes) > QUOTE_CACHE_QUANTITIES:
+            del quotes[next(iter(quotes))]
+        _quote_cache[key] = quotes
+        while len(_quote_cache) > QUOTE_CACHE_SIZE:
+            _quote_cache.popitem(last=False)
+
+
+def _item_column(LotModel):
+    return getattr(LotModel, LotModel.__tablename__.replace("_lot", "_id"))
+
+
+def quote_fifo_costs(LotModel, pairs):
+    """
+    Стоимость по FIFO без списания для пар (id позиции, количество).
+    Недостающие в кэше пары считаются одним запросом на вид лота.
+    Возвращает {(item_id, quantity): стоимость}.
+    """
+    now = time.monotonic()
+    res = {}
+    missing = set()
+    for item_id, quantity in pairs:
+        cost = _cached_quote((LotModel.__tablename__, item_id), quantity, now)
+        if cost is None:
+            missing.add((item_id, quantity))
+        else:
+            res[(item_id, quantity)] = cost
+    if not missing:
+        return res
+
+    item_column = _item_column(LotModel)
+    running = (
+        func.sum(LotModel.quantity)
+        .over(
+            partition_by=item_column,
+            order_by=(LotModel.created_at, LotModel.id),
+        )
+        .label("running")
+    )
+    lots = (
+        select(
+            item_column.label("item_id"),
+            LotModel.quantity,
+            LotModel.price,
+            running,
+        )
+        .join(Invoice, Invoice.id == LotModel.invoice_id)
+        .where(
+            item_column.in_({item_id for item_id, _ in missing}),
+            LotModel.quantity > 0,
+        )
+        .subquery()
+    )
+    # только лоты, нужные для самого большого запрошенного количества
+    stmt = (
+        select(lots.c.item_id, lots.c.quantity, lots.c.price)
+        .where(
+            lots.c.running - lots.c.quantity
+            < max(quantity for _, quantity in missing)
+        )
+        .order_by(lots.c.item_id, lots.c.running)
+    )
+    item_lots = {}
+    for item_id, quantity, price in session.execute(stmt):
+        item_lots.setdefault(item_id, []).append((quantity, price))
+
+    for item_id, quantity in missing:
+        cost = 0.0
+        remaining = quantity
+        for lot_quantity, price in item_lots.get(item_id, []):
+            if remaining <= 0:
+                break
+            taken = min(lot_quantity, remaining)
+            cost += taken * price
+            remaining -= taken
+        res[(item_id, quantity)] = cost
+        _cache_quote((LotModel.__tablename__, item_id), quantity, cost, now)
+    return res
+
+
+def quote_fifo_cost(LotModel, item_id, quantity):
+    return quote_fifo_costs(LotModel, [(item_id, quantity)])[(item_id, quantity)]
+
+
+def invalidate_quotes(LotModel, item_id):
+    with _quote_lock:
+        _quote_cache.pop((LotModel.__tablename__, item_id), None)
+
+
+def invalidate_lot_quotes(lot):
+    invalidate_quotes(type(lot), getattr(lot, _item_column(type(lot)).key))
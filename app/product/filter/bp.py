@@ -1,27 +1,32 @@
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import joinedload
 from flask import current_app, jsonify
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
 from werkzeug.utils import secure_filename
-import pandas as pd
 
 from app.base import session
-from app.choices import InvoiceStatuses, InvoiceTypes
-from app.invoice.models import Invoice
 from app.product.filter.schema import (
     FileMarkupFilter,
     FilterQueryArgSchema,
     MarkupFilterDetailSchema,
     MarkupFilterLoadSchema,
     MarkupFilterUpdateSchema,
+    MarkupImportQueryArgSchema,
     MarkupSchema,
     PagMarkupFilterSchema,
 )
-from app.product.models import Markup, MarkupFilter, ProductLot, ProductUnit
+from app.job.utils import enqueue
+from app.product.filter.utils import (
+    MARKUP_FILE_EXTENSIONS,
+    import_markups,
+    read_markups,
+    save_import_file,
+)
+from app.product.models import MarkupFilter
 from app.utils.func import msg_response, sql_exception_handler, token_required
-from app.utils.exc import ItemNotFoundError
+from app.utils.exc import ItemNotFoundError, ValidateError
 from app.utils.schema import ResponseSchema
+from app.utils.pagination import paginate, pop_pagination
 
 filter = Blueprint(
     "filter", __name__, url_prefix="/filter", description="Операции на Фильтрах"
@@ -36,32 +41,11 @@ class MarkupFilterAllView(MethodView):
     @filter.response(200, PagMarkupFilterSchema)
     def get(c, self, args):
         """List filters"""
-        page = args.pop("page", 1)
-        try:
-            limit = int(args.pop("limit", 10))
-            if limit <= 0:
-                limit = 10
-        except ValueError:
-            limit = 10
-        if limit <= 0:
-            limit = 10
+        pagination = pop_pagination(args)
         query = MarkupFilter.query.filter_by(**args).order_by(
             MarkupFilter.created_at.desc()
         )
-        total_count = query.count()
-        total_pages = (total_count + limit - 1) // limit
-        data = query.limit(limit).offset((page - 1) * limit).all()
-        response = {
-            "data": data,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total_pages": total_pages,
-                "total_count": total_count,
-            },
-        }
-
-        return response
+        return paginate(query, pagination, MarkupFilter)
 
     @token_required
     @sql_exception_handler
@@ -118,78 +102,57 @@ class MarkupFilterById(MethodView):
 @token_required
 @sql_exception_handler
 @filter.arguments(FileMarkupFilter, location="files")
+@filter.arguments(MarkupImportQueryArgSchema, location="query")
 @filter.response(400, ResponseSchema)
+@filter.response(202, ResponseSchema)
 @filter.response(200, MarkupFilterDetailSchema)
-def add_markups_from_excel(c, data, filter_id):
-    # Check if the filter_id is valid
+def add_markups_from_excel(c, data, args, filter_id):
+    """Add markups to filter from csv/xlsx file (first column)"""
     markup_filter = MarkupFilter.get_by_id(filter_id)
-    if not markup_filter:
-        return msg_response("Invalid filter ID", 0), 400
 
-    # Extract file from data
     file = data.get("file")
     if not file:
         return msg_response("Invalid file input", 0), 400
 
-    # Read file based on its extension
     filename = secure_filename(file.filename)
-    if filename.endswith(".csv"):
-        df = pd.read_csv(
-            file, usecols=[0], names=["id"], encoding="utf-8", sep="\s+|;|:|,"
-        )
-    elif filename.endswith(".xls") or filename.endswith(".xlsx"):
-        df = pd.read_excel(file, usecols=[0], names=["id"], engine="openpyxl")
-    else:
+    if not filename.endswith(MARKUP_FILE_EXTENSIONS):
         return msg_response("Unsupported file format", 0), 400
 
-    # Clean up data
-    df = df.drop_duplicates().dropna()
-    markup_ids = df["id"].astype(str).tolist()
-
-    # Batch query to check existing markups
-    existing_markups = Markup.query.filter(Markup.id.in_(markup_ids)).all()
-    existing_markup_ids = {markup.id for markup in existing_markups}
-
-    # Batch query to check ProductUnit existence
-    existing_units = (
-        ProductUnit.query.join(ProductLot, ProductLot.id == ProductUnit.product_lot_id)
-        .join(Invoice, Invoice.id == ProductLot.invoice_id)
-        .filter(
-            Invoice.type == InvoiceTypes.PRODUCTION,
-            Invoice.status == InvoiceStatuses.PUBLISHED,
-            ProductUnit.id.in_(markup_ids),
+    if args["background"]:
+        job = enqueue(
+            session,
+            "markup_import",
+            {
+                "filter_id": markup_filter.id,
+                "path": save_import_file(file, filename),
+                "filename": filename,
+            },
+            user=c,
+            # файл удаляется после попытки - повтор был бы без файла
+            max_attempts=1,
         )
-        .options(joinedload(ProductUnit.product_lot).joinedload(ProductLot.invoice))
-        .all()
-    )
-    existing_units_ids = {unit.id: unit for unit in existing_units}
-
-    # Collect new markups to add
-    new_markups = []
-    for markup_id in markup_ids:
-        if markup_id in existing_markup_ids:
-            if markup_id not in [markup.id for markup in markup_filter.markups]:
-                markup_filter.markups.append(Markup(id=markup_id))
-        else:
-            unit = existing_units_ids.get(markup_id)
-            if unit:
-                new_markups.append(
-                    Markup(id=markup_id, is_used=True, date_of_use=unit.created_at)
-                )
-            else:
-                new_markups.append(Markup(id=markup_id, is_used=False))
-
-    # Add new markups in bulk
-    markup_filter.markups.extend(new_markups)
-
-    # Commit the transaction
+        session.commit()
+        return msg_response({"job_id": job.id}), 202
+
+    def log_progress(stats):
+        current_app.logger.info(f"filter {filter_id} markups import: {stats}")
+
     try:
+        stats = import_markups(
+            session,
+            markup_filter.id,
+            read_markups(file.stream, filename),
+            on_progress=log_progress,
+        )
         session.commit()
+    except ValidateError as e:
+        session.rollback()
+        return msg_response(str(e), 0), 400
     except Exception as e:
         session.rollback()
         return msg_response(str(e), 0), 500
 
-    return msg_response(markup_filter.to_dict()), 200
+    return msg_response({**markup_filter.to_dict(), "imported": stats}), 200
 
 
 @filter.get("/<filter_id>/unused-markups/")
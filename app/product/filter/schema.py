@@ -4,12 +4,10 @@ from sqlalchemy import func
 
 from app.product.models import Markup, MarkupFilter
 from app.base import session
-from app.utils.schema import PaginationSchema
+from app.utils.schema import PaginationQueryArgSchema, PaginationSchema
 
 
-class FilterQueryArgSchema(ma.Schema):
-    page = ma.fields.Int(default=1)
-    limit = ma.fields.Int(default=1)
+class FilterQueryArgSchema(PaginationQueryArgSchema):
     is_active = ma.fields.Bool(required=False)
     product_id = ma.fields.Int(required=False)
 
@@ -93,6 +91,12 @@ class FileMarkupFilter(ma.Schema):
     file = ma.fields.Raw(type="string", format="binary")
 
 
+class MarkupImportQueryArgSchema(ma.Schema):
+    background = ma.fields.Bool(
+        load_default=False, description="Импорт фоновой задачей, ответ - id задачи"
+    )
+
+
 class MarkupFilterListSchema(SQLAlchemyAutoSchema, BaseMarkupFilterSchema):
     class Meta:
         model = MarkupFilter
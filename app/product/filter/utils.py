@@ -0,0 +1,156 @@
+import io
+import os
+import re
+import uuid
+from itertools import islice
+from zipfile import BadZipFile
+
+from flask import current_app
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.choices import InvoiceStatuses, InvoiceTypes
+from app.invoice.models import Invoice
+from app.job.utils import register_job
+from app.product.models import Markup, ProductLot, ProductUnit, markup_markup_filter
+from app.utils.exc import ValidateError
+
+# маркировок на один запрос к базе
+IMPORT_CHUNK_SIZE = 5000
+MARKUP_FILE_EXTENSIONS = (".csv", ".xls", ".xlsx")
+
+CSV_SEPARATOR = re.compile(r"\s+|;|:|,")
+
+
+def _markup_value(value):
+    """Код из ячейки: excel хранит цифровые коды числами"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def _read_csv(file):
+    # разделитель - пробел, ; : или ,  нужна только первая колонка
+    for line in io.TextIOWrapper(file, encoding="utf-8-sig"):
+        yield CSV_SEPARATOR.split(line.strip(), maxsplit=1)[0].strip('"')
+
+
+def _read_xlsx(file):
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (InvalidFileException, BadZipFile, KeyError, OSError) as e:
+        raise ValidateError(f"Invalid file input: {e}")
+    try:
+        sheet = workbook.worksheets[0]
+        for (value,) in sheet.iter_rows(max_col=1, values_only=True):
+            yield value
+    finally:
+        workbook.close()
+
+
+def read_markups(file, filename, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Коды маркировок из первой колонки csv/xlsx частями по chunk_size,
+    файл не загружается в память целиком.
+    """
+    if not filename.endswith(MARKUP_FILE_EXTENSIONS):
+        raise ValidateError("Unsupported file format")
+    values = _read_csv(file) if filename.endswith(".csv") else _read_xlsx(file)
+    values = filter(None, map(_markup_value, values))
+    while chunk := list(dict.fromkeys(islice(values, chunk_size))):
+        yield chunk
+
+
+def _import_chunk(db_session, filter_id, markup_ids):
+    # маркировки, уже выпущенные опубликованным производством
+    used = dict(
+        db_session.execute(
+            select(ProductUnit.id, ProductUnit.created_at)
+            .join(ProductLot, ProductLot.id == ProductUnit.product_lot_id)
+            .join(Invoice, Invoice.id == ProductLot.invoice_id)
+            .where(
+                Invoice.type == InvoiceTypes.PRODUCTION,
+                Invoice.status == InvoiceStatuses.PUBLISHED,
+                ProductUnit.id.in_(markup_ids),
+            )
+        ).all()
+    )
+    created = db_session.execute(
+        insert(Markup).on_conflict_do_nothing(index_elements=["id"]).returning(Markup.id),
+        [
+            {
+                "id": markup_id,
+                "is_used": markup_id in used,
+                "date_of_use": used.get(markup_id),
+            }
+            for markup_id in markup_ids
+        ],
+    )
+    created = len(created.all())
+    linked = db_session.execute(
+        insert(markup_markup_filter)
+        .on_conflict_do_nothing()
+        .returning(markup_markup_filter.c.markup_id),
+        [
+            {"markup_id": markup_id, "markup_filter_id": filter_id}
+            for markup_id in markup_ids
+        ],
+    )
+    linked = len(linked.all())
+    return created, linked
+
+
+def import_markups(db_session, filter_id, chunks, on_progress=None):
+    """
+    Добавить маркировки в фильтр: новые создаются (is_used - если код уже
+    выпущен производством), существующие только привязываются.
+    Повторный импорт того же файла ничего не меняет.
+    on_progress(stats) вызывается после каждой части.
+    Возвращает {"processed", "created", "linked"}.
+    """
+    stats = {"processed": 0, "created": 0, "linked": 0}
+    for markup_ids in chunks:
+        created, linked = _import_chunk(db_session, filter_id, markup_ids)
+        stats["processed"] += len(markup_ids)
+        stats["created"] += created
+        stats["linked"] += linked
+        if on_progress:
+            on_progress(stats)
+    return stats
+
+
+def save_import_file(file, filename):
+    """Сохранить загруженный файл для фоновой задачи, возвращает путь"""
+    # абсолютный путь - воркер может быть запущен из другого каталога
+    folder = os.path.abspath(
+        os.path.join(current_app.config["UPLOAD_FOLDER"], "imports")
+    )
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{uuid.uuid4().hex}_{filename}")
+    file.save(path)
+    return path
+
+
+@register_job("markup_import")
+def markup_import_job(db_session, payload, progress):
+    """
+    Импорт файла, сохранённого save_import_file. Задача ставится с одной
+    попыткой - файл удаляется и при ошибке.
+    """
+    path = payload["path"]
+    try:
+        with open(path, "rb") as file:
+            return import_markups(
+                db_session,
+                payload["filter_id"],
+                read_markups(file, payload["filename"]),
+                on_progress=progress,
+            )
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
@@ -1,14 +1,22 @@
-from sqlalchemy import Column, Float, ForeignKey, Enum, Table
+from sqlalchemy import Column, Float, ForeignKey, Enum, Index, Table
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from typing import List, Optional
 import enum
 import datetime as dt
-from app.choices import DebtTypes, InvoiceStatuses, InvoiceTypes, MeasumentTypes
-from app.base import Base, session
+from app.choices import (
+    DebtTypes,
+    InvoiceStatuses,
+    InvoiceTypes,
+    MeasumentTypes,
+    StockItemTypes,
+)
+from app.base import Base, session, trigram_index
 from app.utils.exc import NotAvailableQuantity
 
 from app.invoice.models import Invoice
+from app.product.fifo import consume_fifo
+from app.warehouse.models import StockBalance
 
 # if TYPE_CHECKING:
 
@@ -26,31 +34,10 @@ class LotBase:
         item_id,
         expense=True,
     ):
-        total_cost = 0.0
-        remaining_quantity = required_quantity
-
-        # Query lots ordered by creation date (FIFO)
-        lots = (
-            session.query(LotModel)
-            .filter(statement, LotModel.quantity > 0)
-            .order_by(LotModel.created_at)
-            .all()
+        consumed, remaining_quantity = consume_fifo(
+            LotModel, [statement], required_quantity, consume=expense
         )
-
-        for lot in lots:
-            if lot.quantity >= remaining_quantity:
-                total_cost += remaining_quantity * lot.price
-                if expense:
-                    lot.quantity -= remaining_quantity
-                    lot.invoice.quantity = lot.invoice.available_quantity()
-                remaining_quantity = 0
-                break
-            else:
-                total_cost += lot.quantity * lot.price
-                remaining_quantity -= lot.quantity
-                if expense:
-                    lot.quantity = 0
-                    lot.invoice.quantity = lot.invoice.available_quantity()
+        total_cost = float(sum(taken * lot.price for lot, taken in consumed))
         if remaining_quantity > 0 and expense:
             model_name = str(LotModel.__tablename__).split("_")[0]
             debt = Debt(
@@ -70,6 +57,7 @@ class Debt(Base):
 
 class Product(Base):
     __tablename__ = "product"
+    __table_args__ = (trigram_index("ix_product_name_trgm", "name"),)
 
     name: Mapped[str]
     measurement: Mapped[enum.Enum] = mapped_column(
@@ -85,6 +73,7 @@ class Product(Base):
 
 class Container(Base):
     __tablename__ = "container"
+    __table_args__ = (trigram_index("ix_container_name_trgm", "name"),)
 
     name: Mapped[str]
     measurement: Mapped[enum.Enum] = mapped_column(
@@ -98,41 +87,42 @@ class Container(Base):
     def decrease(container_id, decrease_quantity, warehouse_id, transfer=False):
         if decrease_quantity <= 0:
             return []
-        lots = (
-            ContainerLot.query.join(Invoice, Invoice.id == ContainerLot.invoice_id)
-            .where(
-                ContainerLot.container_id == container_id,
-                Invoice.status == InvoiceStatuses.PUBLISHED,
-                Invoice.type != InvoiceTypes.EXPENSE,
-                Invoice.warehouse_receiver_id == warehouse_id,
+        in_stock = (
+            session.query(StockBalance.quantity)
+            .filter_by(
+                warehouse_id=warehouse_id,
+                item_type=StockItemTypes.CONTAINER,
+                item_id=container_id,
             )
-            .order_by(ContainerLot.created_at.asc())
-            .all()
+            .scalar()
+            or 0
         )
+        if in_stock < decrease_quantity and transfer:
+            raise NotAvailableQuantity("Quantity is more than expected")
+        consumed = []
+        if in_stock > 0:
+            consumed, decrease_quantity = consume_fifo(
+                ContainerLot,
+                [
+                    ContainerLot.container_id == container_id,
+                    Invoice.status == InvoiceStatuses.PUBLISHED,
+                    Invoice.type != InvoiceTypes.EXPENSE,
+                    Invoice.warehouse_receiver_id == warehouse_id,
+                ],
+                decrease_quantity,
+            )
         res_lots = []
-        for lot in lots:
-            if lot.quantity >= decrease_quantity:
-                lot.quantity -= decrease_quantity
-                lot.calc_total_sum()
-                new_lot = ContainerLot(
-                    quantity=decrease_quantity,
-                    price=lot.price,
-                    container_id=container_id,
-                )
-                new_lot.calc_total_sum()
-                return [new_lot]
-            elif lot.quantity < decrease_quantity:
-                decrease_quantity -= lot.quantity
-                new_lot = ContainerLot(
-                    quantity=lot.quantity,
-                    price=lot.price,
-                    container_id=container_id,
-                )
-                new_lot.calc_total_sum()
-                lot.quantity = 0
-                lot.calc_total_sum()
-                res_lots.append(new_lot)
-        if decrease_quantity > 0 and not transfer:
+        for lot, taken in consumed:
+            new_lot = ContainerLot(
+                quantity=taken,
+                price=lot.price,
+                container_id=container_id,
+            )
+            new_lot.calc_total_sum()
+            res_lots.append(new_lot)
+        if decrease_quantity == 0:
+            return res_lots
+        if not transfer:
             debt = Debt(
                 quantity=decrease_quantity,
                 type=DebtTypes.CONTAINER,
@@ -162,6 +152,7 @@ class Container(Base):
 
 class Part(Base):
     __tablename__ = "part"
+    __table_args__ = (trigram_index("ix_part_name_trgm", "name"),)
 
     name: Mapped[str]
     measurement: Mapped[enum.Enum] = mapped_column(Enum(MeasumentTypes))
@@ -172,41 +163,26 @@ class Part(Base):
     def decrease(part_id, decrease_quantity, warehouse_id, transfer=False):
         if decrease_quantity <= 0:
             return []
-        lots = (
-            PartLot.query.join(Invoice, PartLot.invoice_id == Invoice.id)
-            .where(
+        consumed, decrease_quantity = consume_fifo(
+            PartLot,
+            [
                 PartLot.part_id == part_id,
                 Invoice.warehouse_receiver_id == warehouse_id,
-            )
-            .order_by(PartLot.created_at.asc())
-            .all()
+            ],
+            decrease_quantity,
         )
         res_lots = []
-        for lot in lots:
-            if lot.quantity >= decrease_quantity:
-                lot.calc_total_sum()
-                lot.quantity -= decrease_quantity
-                lot.invoice.quantity = lot.invoice.available_quantity()
-                new_lot = PartLot(
-                    quantity=decrease_quantity,
-                    price=lot.price,
-                    part_id=lot.part_id,
-                )
-                new_lot.calc_total_sum()
-                return [new_lot]
-            elif lot.quantity < decrease_quantity:
-                decrease_quantity -= lot.quantity
-                new_lot = PartLot(
-                    quantity=lot.quantity,
-                    price=lot.price,
-                    part_id=lot.part_id,
-                )
-                new_lot.calc_total_sum()
-                res_lots.append(new_lot)
-                lot.quantity = 0
-                lot.calc_total_sum()
-                lot.invoice.quantity = lot.invoice.available_quantity()
-        if decrease_quantity > 0 and not transfer:
+        for lot, taken in consumed:
+            new_lot = PartLot(
+                quantity=taken,
+                price=lot.price,
+                part_id=part_id,
+            )
+            new_lot.calc_total_sum()
+            res_lots.append(new_lot)
+        if decrease_quantity == 0:
+            return res_lots
+        if not transfer:
             debt = Debt(
                 quantity=decrease_quantity,
                 type=DebtTypes.PART,
@@ -239,13 +215,16 @@ class ProductUnit(Base):
 
     id: Mapped[str] = mapped_column(primary_key=True)
     product_lot_id: Mapped[int] = mapped_column(
-        ForeignKey("product_lot.id", ondelete="CASCADE")
+        ForeignKey("product_lot.id", ondelete="CASCADE"), index=True
     )
     product_lot: Mapped["ProductLot"] = relationship(back_populates="units")
 
 
 class ProductLot(Base, LotBase):
     __tablename__ = "product_lot"
+    __table_args__ = (
+        Index("ix_product_lot_product_created_at", "product_id", "created_at"),
+    )
 
     const_quantity: Mapped[Optional[int]] = mapped_column(default=1)
     quantity: Mapped[int] = mapped_column(default=1)
@@ -256,16 +235,24 @@ class ProductLot(Base, LotBase):
     )
     product: Mapped["Product"] = relationship()
     invoice_id: Mapped[int] = mapped_column(
-        ForeignKey("invoice.id", ondelete="CASCADE")
+        ForeignKey("invoice.id", ondelete="CASCADE"), index=True
     )
     invoice: Mapped["Invoice"] = relationship(back_populates="product_lots")
     units: Mapped[List["ProductUnit"]] = relationship(
         back_populates="product_lot", cascade="all, delete-orphan"
     )
 
+    # маркировки, которые save_pending_units запишет после flush нового лота:
+    # новые единицы и перенесённые из других лотов
+    pending_markups = None
+    moved_units = None
+
 
 class ContainerLot(Base, LotBase):
     __tablename__ = "container_lot"
+    __table_args__ = (
+        Index("ix_container_lot_container_created_at", "container_id", "created_at"),
+    )
 
     const_quantity: Mapped[Optional[int]] = mapped_column(default=1)
     quantity: Mapped[int] = mapped_column(default=1)
@@ -276,13 +263,14 @@ class ContainerLot(Base, LotBase):
     )
     container: Mapped["Container"] = relationship()
     invoice_id: Mapped[int] = mapped_column(
-        ForeignKey("invoice.id", ondelete="CASCADE")
+        ForeignKey("invoice.id", ondelete="CASCADE"), index=True
     )
     invoice: Mapped["Invoice"] = relationship(back_populates="container_lots")
 
 
 class PartLot(Base, LotBase):
     __tablename__ = "part_lot"
+    __table_args__ = (Index("ix_part_lot_part_created_at", "part_id", "created_at"),)
 
     const_quantity: Mapped[Optional[int]] = mapped_column(default=1)
     quantity: Mapped[int] = mapped_column(default=1)
@@ -291,7 +279,7 @@ class PartLot(Base, LotBase):
     part_id: Mapped[int] = mapped_column(ForeignKey("part.id", ondelete="CASCADE"))
     part: Mapped["Part"] = relationship()
     invoice_id: Mapped[int] = mapped_column(
-        ForeignKey("invoice.id", ondelete="CASCADE")
+        ForeignKey("invoice.id", ondelete="CASCADE"), index=True
     )
     invoice: Mapped["Invoice"] = relationship(back_populates="part_lots")
 
@@ -18,11 +18,14 @@ from app.product.schema import (
     StandaloneProductWarehouseStats,
 )
 from app.base import session
+from app.search.utils import search_filter
 from app.user.models import User
+from app.utils.filters import date_between
 from app.utils.exc import ItemNotFoundError
 from app.utils.func import hash_image_save, msg_response, sql_exception_handler, token_required
 from app.utils.schema import ResponseSchema
 from app.warehouse.models import Warehouse
+from app.utils.pagination import paginate, pop_pagination
 
 
 part = Blueprint(
@@ -38,37 +41,19 @@ class PartAllView(MethodView):
     @part.response(200, PagPartSchema)
     def get(c, self, args):
         """List parts"""
-        page = args.pop("page", 1)
+        pagination = pop_pagination(args)
         warehouse_id = args.pop("warehouse_id", None)
-        try:
-            limit = int(args.pop("limit", 10))
-            if limit <= 0:
-                limit = 10
-        except ValueError:
-            limit = 10
-        if limit <= 0:
-            limit = 10
+        name = args.pop("name", None)
         query = Part.query.filter_by(**args).order_by(Part.created_at.desc())
+        if name:
+            query = query.filter(search_filter("part", name))
         if warehouse_id:
             query = (
                 query.join(PartLot, PartLot.part_id == Part.id)
                 .join(Invoice, Invoice.id == PartLot.invoice_id)
                 .where(Invoice.warehouse_receiver_id == warehouse_id)
             )
-        total_count = query.count()
-        total_pages = (total_count + limit - 1) // limit
-        data = query.limit(limit).offset((page - 1) * limit).all()
-        response = {
-            "data": data,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total_pages": total_pages,
-                "total_count": total_count,
-            },
-        }
-
-        return response
+        return paginate(query, pagination, Part)
 
     @token_required
     @sql_exception_handler
@@ -223,7 +208,7 @@ def standalone_part_invoice_stats(c, args, part_id):
     if user_id_filter:
         query = query.filter(Invoice.user_id == user_id_filter)
     if date_filter:
-        query = query.filter(func.date(Invoice.created_at) == date_filter)
+        query = query.filter(date_between(Invoice.created_at, date_filter))
 
     invoices_with_part = query.group_by(
         Invoice.id,
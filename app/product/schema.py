@@ -1,9 +1,7 @@
 import marshmallow as ma
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema, SQLAlchemySchema, auto_field
-from sqlalchemy import func, select
 
 from app.choices import InvoiceStatuses, InvoiceTypes, MeasumentTypes
-from app.invoice.models import Invoice
 from app.product.models import (
     Container,
     ContainerLot,
@@ -12,11 +10,15 @@ from app.product.models import (
     PartLot,
     Product,
     ProductContainer,
-    ProductLot,
     ProductPart,
 )
 from app.base import session
-from app.utils.schema import DefaultDumpsSchema, PaginationSchema
+from app.product.fifo import quote_fifo_cost, quote_fifo_costs
+from app.utils.schema import (
+    DefaultDumpsSchema,
+    PaginationQueryArgSchema,
+    PaginationSchema,
+)
 
 
 class ProductContainerSchema(SQLAlchemyAutoSchema):
@@ -37,12 +39,7 @@ class ProductContainerSchema(SQLAlchemyAutoSchema):
 
     @staticmethod
     def get_price(obj: ProductContainer):
-        return ContainerLot.calculate_fifo_cost(
-            ContainerLot.container_id == obj.container_id,
-            obj.quantity,
-            obj.container_id,
-            False,
-        )
+        return quote_fifo_cost(ContainerLot, obj.container_id, obj.quantity)
 
 
 class ProductPartSchema(SQLAlchemyAutoSchema):
@@ -63,12 +60,7 @@ class ProductPartSchema(SQLAlchemyAutoSchema):
 
     @staticmethod
     def get_price(obj: ProductPart):
-        return PartLot.calculate_fifo_cost(
-            PartLot.part_id == obj.part_id,
-            obj.quantity,
-            obj.part_id,
-            False,
-        )
+        return quote_fifo_cost(PartLot, obj.part_id, obj.quantity)
 
 
 class ContainerPartSchema(SQLAlchemyAutoSchema):
@@ -89,12 +81,7 @@ class ContainerPartSchema(SQLAlchemyAutoSchema):
 
     @staticmethod
     def get_price(obj: ContainerPart):
-        return PartLot.calculate_fifo_cost(
-            PartLot.part_id == obj.part_id,
-            obj.quantity,
-            obj.part_id,
-            False,
-        )
+        return quote_fifo_cost(PartLot, obj.part_id, obj.quantity)
 
 
 class ProductSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
@@ -110,6 +97,18 @@ class ProductSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
     containers_r = ma.fields.Nested(ProductContainerSchema, many=True)
     parts_r = ma.fields.Nested(ProductPartSchema, many=True)
 
+    @ma.pre_dump(pass_many=True)
+    def prefetch_prices(self, data, many, **kwargs):
+        products = [p for p in (data if many else [data]) if isinstance(p, Product)]
+        quote_fifo_costs(
+            ContainerLot,
+            [(r.container_id, r.quantity) for p in products for r in p.containers_r],
+        )
+        quote_fifo_costs(
+            PartLot, [(r.part_id, r.quantity) for p in products for r in p.parts_r]
+        )
+        return data
+
 
 class ContainerSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
     class Meta:
@@ -122,6 +121,16 @@ class ContainerSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
     measurement = ma.fields.Enum(MeasumentTypes, by_value=True)
     parts_r = ma.fields.Nested(ContainerPartSchema, many=True)
 
+    @ma.pre_dump(pass_many=True)
+    def prefetch_prices(self, data, many, **kwargs):
+        containers = [
+            c for c in (data if many else [data]) if isinstance(c, Container)
+        ]
+        quote_fifo_costs(
+            PartLot, [(r.part_id, r.quantity) for c in containers for r in c.parts_r]
+        )
+        return data
+
 
 class ContainerPartUpdateSchema(SQLAlchemySchema):
     class Meta:
@@ -154,9 +163,7 @@ class PartSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
     measurement = ma.fields.Enum(MeasumentTypes, by_value=True)
 
 
-class ProductQueryArgSchema(ma.Schema):
-    page = ma.fields.Int(default=1)
-    limit = ma.fields.Int(default=1)
+class ProductQueryArgSchema(PaginationQueryArgSchema):
     measurement = ma.fields.Enum(MeasumentTypes, by_value=True, required=False)
     name = ma.fields.Str(required=False)
     warehouse_id = ma.fields.Str(required=False)
@@ -190,34 +197,8 @@ class ProductStatSchema(SQLAlchemySchema):
     measurement = ma.fields.Enum(MeasumentTypes, by_value=True)
     photo = auto_field()
     name = auto_field()
-    total_quantity = ma.fields.Method("get_product_total_quantity")
-    total_sum = ma.fields.Method("get_product_total_sum")
-
-    @staticmethod
-    def get_product_total_quantity(obj):
-        res = session.execute(
-            select(func.sum(ProductLot.quantity))
-            .join(Invoice, Invoice.id == ProductLot.invoice_id)
-            .where(
-                ProductLot.product_id == obj.id,
-                Invoice.type.in_([InvoiceTypes.TRANSFER, InvoiceTypes.PRODUCTION]),
-                Invoice.status == InvoiceStatuses.PUBLISHED,
-            )
-        ).scalar()
-        return res
-
-    @staticmethod
-    def get_product_total_sum(obj):
-        res = session.execute(
-            select(func.sum(ProductLot.price))
-            .join(Invoice, Invoice.id == ProductLot.invoice_id)
-            .where(
-                ProductLot.product_id == obj.id,
-                Invoice.type.in_([InvoiceTypes.TRANSFER, InvoiceTypes.PRODUCTION]),
-                Invoice.status == InvoiceStatuses.PUBLISHED,
-            )
-        ).scalar()
-        return res
+    total_quantity = ma.fields.Int()
+    total_sum = ma.fields.Float()
 
 
 class ContainerStatSchema(SQLAlchemySchema):
@@ -229,34 +210,8 @@ class ContainerStatSchema(SQLAlchemySchema):
     measurement = ma.fields.Enum(MeasumentTypes, by_value=True)
     photo = auto_field()
     name = auto_field()
-    total_quantity = ma.fields.Method("get_container_total_quantity")
-    total_sum = ma.fields.Method("get_container_total_sum")
-
-    @staticmethod
-    def get_container_total_quantity(obj):
-        res = session.execute(
-            select(func.sum(ContainerLot.quantity))
-            .join(Invoice, Invoice.id == ContainerLot.invoice_id)
-            .where(
-                ContainerLot.container_id == obj.id,
-                Invoice.type != InvoiceTypes.EXPENSE,
-                Invoice.status == InvoiceStatuses.PUBLISHED,
-            )
-        ).scalar()
-        return res
-
-    @staticmethod
-    def get_container_total_sum(obj):
-        res = session.execute(
-            select(func.sum(ContainerLot.price))
-            .join(Invoice, Invoice.id == ContainerLot.invoice_id)
-            .where(
-                ContainerLot.container_id == obj.id,
-                Invoice.type != InvoiceTypes.EXPENSE,
-                Invoice.status == InvoiceStatuses.PUBLISHED,
-            )
-        ).scalar()
-        return res
+    total_quantity = ma.fields.Int()
+    total_sum = ma.fields.Float()
 
 
 class PartStatSchema(SQLAlchemySchema):
@@ -268,34 +223,14 @@ class PartStatSchema(SQLAlchemySchema):
     measurement = ma.fields.Enum(MeasumentTypes, by_value=True)
     photo = auto_field()
     name = auto_field()
-    total_quantity = ma.fields.Method("get_part_total_quantity")
-    total_sum = ma.fields.Method("get_part_total_sum")
+    total_quantity = ma.fields.Int()
+    total_sum = ma.fields.Float()
 
-    @staticmethod
-    def get_part_total_quantity(obj):
-        res = session.execute(
-            select(func.sum(PartLot.quantity))
-            .join(Invoice, Invoice.id == PartLot.invoice_id)
-            .where(
-                PartLot.part_id == obj.id,
-                Invoice.type.in_([InvoiceTypes.TRANSFER, InvoiceTypes.INVOICE]),
-                Invoice.status == InvoiceStatuses.PUBLISHED,
-            )
-        ).scalar()
-        return res
 
-    @staticmethod
-    def get_part_total_sum(obj):
-        res = session.execute(
-            select(func.sum(PartLot.price))
-            .join(Invoice, Invoice.id == PartLot.invoice_id)
-            .where(
-                PartLot.part_id == obj.id,
-                Invoice.type.in_([InvoiceTypes.TRANSFER, InvoiceTypes.INVOICE]),
-                Invoice.status == InvoiceStatuses.PUBLISHED,
-            )
-        ).scalar()
-        return res
+class AllProductsStatsQuerySchema(ma.Schema):
+    page = ma.fields.Int(required=False)
+    limit = ma.fields.Int(required=False)
+    warehouse_id = ma.fields.Int(required=False)
 
 
 class AllProductsStats(ma.Schema):
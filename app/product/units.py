@@ -0,0 +1,67 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import String, any_, bindparam, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from app.product.models import ProductLot, ProductUnit
+
+
+def any_markup(markups):
+    """column == any_markup(...): список маркировок одним параметром-массивом"""
+    return any_(bindparam("markups", list(markups), type_=ARRAY(String)))
+
+
+def take_units(db_session, markups):
+    """
+    Единицы продукции по маркировкам одним запросом: {лот: [маркировки]}.
+    Количество и сумма прежних лотов уменьшаются один раз на лот.
+    Неизвестные маркировки пропускаются.
+    """
+    lots = defaultdict(list)
+    if not markups:
+        return lots
+    for unit_id, lot in db_session.execute(
+        select(ProductUnit.id, ProductLot)
+        .join(ProductLot, ProductLot.id == ProductUnit.product_lot_id)
+        .where(ProductUnit.id == any_markup(set(markups)))
+        .order_by(ProductLot.id)
+    ):
+        lots[lot].append(unit_id)
+    for lot, unit_ids in lots.items():
+        lot.quantity -= len(unit_ids)
+        lot.calc_total_sum()
+    return lots
+
+
+def save_pending_units(db_session):
+    """
+    after_flush: единицы новых лотов продукции, когда у лотов уже есть id.
+    pending_markups - новые единицы (одним INSERT), moved_units - перенос
+    существующих единиц в лот (одним UPDATE на лот).
+    """
+    now = datetime.now()
+    rows = []
+    for obj in db_session.new:
+        if not isinstance(obj, ProductLot):
+            continue
+        rows.extend(
+            {
+                "id": markup,
+                "product_lot_id": obj.id,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for markup in obj.pending_markups or ()
+        )
+        obj.pending_markups = None
+        if obj.moved_units:
+            db_session.execute(
+                update(ProductUnit)
+                .where(ProductUnit.id == any_markup(obj.moved_units))
+                .values(product_lot_id=obj.id, updated_at=now),
+                execution_options={"synchronize_session": False},
+            )
+            obj.moved_units = None
+    if rows:
+        db_session.execute(insert(ProductUnit), rows)
@@ -0,0 +1,85 @@
+from sqlalchemy import func, select
+
+from app.base import session
+from app.choices import InvoiceStatuses, InvoiceTypes
+from app.invoice.models import Invoice
+from app.product.models import (
+    Container,
+    ContainerLot,
+    Part,
+    PartLot,
+    Product,
+    ProductLot,
+)
+
+# модель -> (лот, колонка позиции в лоте, фильтр по типу накладной)
+STATS_CATALOGS = {
+    "products": (
+        Product,
+        ProductLot,
+        "product_id",
+        Invoice.type.in_([InvoiceTypes.TRANSFER, InvoiceTypes.PRODUCTION]),
+    ),
+    "containers": (
+        Container,
+        ContainerLot,
+        "container_id",
+        Invoice.type != InvoiceTypes.EXPENSE,
+    ),
+    "parts": (
+        Part,
+        PartLot,
+        "part_id",
+        Invoice.type.in_([InvoiceTypes.TRANSFER, InvoiceTypes.INVOICE]),
+    ),
+}
+
+
+def get_catalog_stats(Model, LotModel, item_column, type_filter, **kwargs):
+    """
+    Количество и сумма по опубликованным лотам для каждой позиции каталога
+    одним групповым запросом.
+    warehouse_id - только позиции, поступившие на этот склад.
+    page/limit - постраничная выдача по id.
+    """
+    warehouse_id = kwargs.get("warehouse_id")
+    page = kwargs.get("page")
+    limit = kwargs.get("limit")
+
+    item_id = getattr(LotModel, item_column)
+    lot_filter = [Invoice.status == InvoiceStatuses.PUBLISHED, type_filter]
+    if warehouse_id:
+        lot_filter.append(Invoice.warehouse_receiver_id == warehouse_id)
+    totals = (
+        select(
+            item_id.label("item_id"),
+            func.sum(LotModel.quantity).label("total_quantity"),
+            func.sum(LotModel.price).label("total_sum"),
+        )
+        .join(Invoice, Invoice.id == LotModel.invoice_id)
+        .where(*lot_filter)
+        .group_by(item_id)
+        .subquery()
+    )
+    stmt = (
+        select(
+            Model.id,
+            Model.measurement,
+            Model.photo,
+            Model.name,
+            totals.c.total_quantity,
+            totals.c.total_sum,
+        )
+        .join(totals, totals.c.item_id == Model.id, isouter=not warehouse_id)
+        .order_by(Model.id)
+    )
+    if page and limit and limit > 0:
+        stmt = stmt.limit(limit).offset((page - 1) * limit)
+    return session.execute(stmt).all()
+
+
+def get_all_stats(**kwargs):
+    return {
+        name: get_catalog_stats(*catalog, **kwargs)
+        for name, catalog in STATS_CATALOGS.items()
+    }
@@ -9,6 +9,8 @@ from app.invoice.expense.bp import expense
 from app.invoice.production.bp import production
 from app.invoice.transfer.bp import transfer
 from app.product.filter.bp import filter
+from app.search.bp import search_bp
+from app.job.bp import job
 
 
 def reg_bps(app):
@@ -23,4 +25,6 @@ def reg_bps(app):
     app.register_blueprint(transfer)
     app.register_blueprint(filter)
     app.register_blueprint(finance)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(job)
     return app
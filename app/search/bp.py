@@ -0,0 +1,21 @@
+from flask_smorest import Blueprint
+
+from app.search.schema import SearchArgsSchema, SearchResultSchema
+from app.search.utils import search
+from app.utils.func import token_required
+
+search_bp = Blueprint(
+    "search", __name__, url_prefix="/search", description="Поиск по всем сущностям"
+)
+
+
+@search_bp.get("/")
+@token_required
+@search_bp.arguments(SearchArgsSchema, location="query")
+@search_bp.response(200, SearchResultSchema)
+def search_view(c, args):
+    """Search transactions, invoices, counterparties, users and items"""
+    return {
+        "query": args["q"],
+        "hits": search(args["q"], args.get("types"), args["limit"]),
+    }
@@ -0,0 +1,29 @@
+import marshmallow as ma
+from marshmallow import validate
+
+from app.search.utils import SEARCH_ENTITIES, SEARCH_LIMIT, SEARCH_MAX_LIMIT
+
+
+class SearchArgsSchema(ma.Schema):
+    q = ma.fields.Str(required=True, validate=validate.Length(min=2))
+    types = ma.fields.List(
+        ma.fields.Str(validate=validate.OneOf(list(SEARCH_ENTITIES))),
+        description="Типы сущностей, по умолчанию все",
+    )
+    limit = ma.fields.Int(
+        load_default=SEARCH_LIMIT,
+        validate=validate.Range(min=1, max=SEARCH_MAX_LIMIT),
+        description="Записей каждого типа",
+    )
+
+
+class SearchHitSchema(ma.Schema):
+    type = ma.fields.Str()
+    id = ma.fields.Int()
+    title = ma.fields.Str()
+    rank = ma.fields.Float()
+
+
+class SearchResultSchema(ma.Schema):
+    query = ma.fields.Str()
+    hits = ma.fields.Nested(SearchHitSchema, many=True)
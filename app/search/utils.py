@@ -0,0 +1,109 @@
+from sqlalchemy import Text, case, cast, func, literal, or_, select, text, union_all
+
+from app.base import session
+from app.finance.models import Counterparty, Transaction
+from app.invoice.models import Invoice
+from app.product.models import Container, Part, Product
+from app.user.models import User
+from app.utils.filters import contains, like_pattern
+
+# найденных записей каждого типа по умолчанию
+SEARCH_LIMIT = 5
+SEARCH_MAX_LIMIT = 50
+
+# тип -> (модель, колонки поиска); по колонкам есть GIN-индексы pg_trgm
+SEARCH_ENTITIES = {
+    "transaction": (Transaction, ["debit_name", "credit_name"]),
+    "invoice": (Invoice, ["number"]),
+    "counterparty": (Counterparty, ["name"]),
+    "user": (User, ["last_name", "first_name"]),
+    "product": (Product, ["name"]),
+    "container": (Container, ["name"]),
+    "part": (Part, ["name"]),
+}
+
+_has_trgm = None
+
+
+def has_trgm():
+    """Установлен ли pg_trgm (проверяется один раз за процесс)"""
+    global _has_trgm
+    if _has_trgm is None:
+        _has_trgm = bool(
+            session.scalar(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            )
+        )
+    return _has_trgm
+
+
+def _entity(target):
+    """Модель и колонки по типу или модели; прочие модели ищутся по name"""
+    if isinstance(target, str):
+        return SEARCH_ENTITIES[target]
+    for model, columns in SEARCH_ENTITIES.values():
+        if model is target:
+            return model, columns
+    return target, ["name"]
+
+
+def search_filter(target, term):
+    """
+    Условие поиска term для списков: тип из SEARCH_ENTITIES или модель.
+    ilike '%term%' по колонкам, которые покрыты trigram-индексами.
+    """
+    model, columns = _entity(target)
+    return or_(*(contains(getattr(model, column), term) for column in columns))
+
+
+def _as_text(column):
+    return column if isinstance(column.type, Text) else cast(column, Text)
+
+
+def _rank(columns, term):
+    """
+    Релевантность 0..1: word_similarity pg_trgm, без расширения -
+    точное совпадение, затем совпадение начала, затем вхождение.
+    """
+    if has_trgm():
+        ranks = [func.coalesce(func.word_similarity(term, column), 0) for column in columns]
+    else:
+        ranks = [
+            case(
+                (func.lower(column) == term.lower(), 1.0),
+                (column.ilike(like_pattern(term, prefix=True), escape="\\"), 0.5),
+                else_=0.1,
+            )
+            for column in columns
+        ]
+    return ranks[0] if len(ranks) == 1 else func.greatest(*ranks)
+
+
+def search(term, types=None, limit=SEARCH_LIMIT):
+    """
+    Поиск по сущностям одним запросом: не больше limit записей каждого типа,
+    общий список по убыванию релевантности.
+    Возвращает [{"type", "id", "title", "rank"}].
+    """
+    selects = []
+    for entity in types or SEARCH_ENTITIES:
+        model, names = SEARCH_ENTITIES[entity]
+        columns = [_as_text(getattr(model, name)) for name in names]
+        rank = _rank(columns, term)
+        selects.append(
+            select(
+                literal(entity).label("type"),
+                model.id.label("id"),
+                func.concat_ws(" ", *columns).label("title"),
+                rank.label("rank"),
+            )
+            .where(search_filter(entity, term))
+            .order_by(rank.desc(), model.id.desc())
+            .limit(limit)
+            .subquery()
+        )
+    hits = union_all(*(select(subquery) for subquery in selects)).subquery()
+    rows = session.execute(
+        select(hits).order_by(hits.c.rank.desc(), hits.c.type, hits.c.id.desc())
+    )
+    return [row._asdict() for row in rows]
@@ -0,0 +1,63 @@
+import time
+
+import jwt
+from flask import current_app, g, request
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app.base import session, session_factory
+from app.user.models import User
+
+# секунды; изменения пользователя/прав в других процессах видны не позже TTL
+AUTH_CACHE_TTL = 30
+
+# id пользователя -> (истекает, отсоединённый User с загруженными permissions)
+_user_cache = {}
+
+
+def decode_token():
+    """Payload JWT из x-access-token, декодируется один раз за запрос"""
+    if "auth_payload" not in g:
+        token = request.headers.get("x-access-token")
+        g.auth_payload = (
+            jwt.decode(
+                token, current_app.config.get("SECRET_KEY"), algorithms=["HS256"]
+            )
+            if token
+            else None
+        )
+    return g.auth_payload
+
+
+def _load_user(user_id):
+    now = time.monotonic()
+    cached = _user_cache.get(user_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    # отдельная сессия: после закрытия объект отсоединён и годится для кэша
+    with session_factory() as db_session:
+        user = db_session.scalar(
+            select(User).options(joinedload(User.permissions)).filter_by(id=user_id)
+        )
+    if user is not None:
+        _user_cache[user_id] = (now + AUTH_CACHE_TTL, user)
+    return user
+
+
+def get_current_user():
+    """
+    Пользователь запроса (с permissions) или None.
+    Токен и пользователь загружаются один раз за запрос, между запросами
+    пользователь берётся из кэша и добавляется в сессию без запроса к БД.
+    """
+    if "current_user" not in g:
+        payload = decode_token()
+        user = _load_user(payload.get("public_id")) if payload else None
+        g.current_user = (
+            session.merge(user, load=False) if user is not None else None
+        )
+    return g.current_user
+
+
+def invalidate_user(user_id):
+    _user_cache.pop(user_id, None)
@@ -4,7 +4,7 @@ import jwt
 from flask import current_app, jsonify, request
 from flask.views import MethodView
 from flask_smorest import Blueprint
-from sqlalchemy import or_, select
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import joinedload
 
@@ -35,6 +35,7 @@ from app.user.schema import (
     DocumentUpdateListSchema,
     GroupArgsSchema,
     GroupCreateSchema,
+    GroupListSchema,
     GroupSchema,
     GroupUpdateSchema,
     LoginResponseSchema,
@@ -55,6 +56,7 @@ from app.user.schema import (
     WorkScheduleRetrieveSchema,
     WorkScheduleUpdate,
 )
+from app.search.utils import search_filter
 from app.utils.func import (
     accept_to_system_permission,
     hash_image_save,
@@ -62,6 +64,7 @@ from app.utils.func import (
     sql_exception_handler,
     token_required,
 )
+from app.utils.loading import query_budget
 from app.utils.mixins import CustomMethodPaginationView
 from app.utils.schema import ResponseSchema
 
@@ -211,12 +214,7 @@ class UserView(CustomMethodPaginationView):
         status = args.get("status")
         role = args.get("role")
         if search:
-            lst.append(
-                or_(
-                    self.model.last_name.ilike(f"%{search}%"),
-                    self.model.first_name.ilike(f"%{search}%"),
-                ),
-            )
+            lst.append(search_filter("user", search))
         if department:
             lst.append(User.department.has(Department.name == department))
         if status:
@@ -341,12 +339,14 @@ def add_user_to_group(c, user_data, group_id):
 @user.route("/group")
 class GroupView(CustomMethodPaginationView):
     model = Group
+    list_schema = GroupListSchema
 
+    @token_required
+    @query_budget(6)
+    @accept_to_system_permission
     @user.arguments(GroupArgsSchema, location="query")
     @user.response(400, ResponseSchema)
     @user.response(200, PagGroupSchema)
-    @token_required
-    @accept_to_system_permission
     def get(c, self, args):
         """get list group"""
         department_id = args.get("department_id")
@@ -535,12 +535,7 @@ class WorkScheduleView(CustomMethodPaginationView):
                 .options(joinedload(User.work_schedules))
             )
         if search:
-            lst.append(
-                or_(
-                    self.model.last_name.ilike(f"%{search}%"),
-                    self.model.first_name.ilike(f"%{search}%"),
-                ),
-            )
+            lst.append(search_filter("user", search))
         return super(WorkScheduleView, self).get(args, lst, custom_query=custom_query)
 
 
@@ -606,12 +601,7 @@ class SalaryView(CustomMethodPaginationView):
         department = args.get("department")
         role = args.get("role")
         if search:
-            lst.append(
-                or_(
-                    self.model.last_name.ilike(f"%{search}%"),
-                    self.model.first_name.ilike(f"%{search}%"),
-                ),
-            )
+            lst.append(search_filter("user", search))
         if department:
             lst.append(User.department.has(Department.name == department))
         if role:
@@ -9,6 +9,7 @@ from sqlalchemy import (
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
@@ -18,9 +19,10 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from app.base import Base, session
+from app.base import Base, session, trigram_index
 from app.choices import DaysOfWeekShort, SalaryFormat, Statuses, WorkScheduleStatus
 from app.utils.mixins import BalanceMixin, HistoryMixin, TempDataMixin
+from app.utils.references import register_content_type
 
 if TYPE_CHECKING:
     from app.invoice.models import Invoice
@@ -51,6 +53,10 @@ class UserHistory(HistoryMixin, Base):
 
 class User(TempDataMixin, Base):
     __tablename__ = "user"
+    __table_args__ = (
+        trigram_index("ix_user_first_name_trgm", "first_name"),
+        trigram_index("ix_user_last_name_trgm", "last_name"),
+    )
 
     username: Mapped[str] = mapped_column(String(100), unique=True, nullable=True)
     first_name: Mapped[Optional[str]]
@@ -229,6 +235,9 @@ class Document(Base):
 
 class WorkSchedule(Base):
     __tablename__ = "work_schedule"
+    __table_args__ = (
+        Index("uq_work_schedule_user_date", "user_id", "date", unique=True),
+    )
 
     date: Mapped[datetime.date] = mapped_column(Date, nullable=False)
     status: Mapped["WorkScheduleStatus"] = mapped_column(
@@ -250,6 +259,7 @@ class WorkSchedule(Base):
     )
 
 
+@register_content_type
 class Salary(Base, BalanceMixin):
     __tablename__ = "salary"
 
@@ -23,7 +23,11 @@ from app.user.models import (
     WorkingDay,
     WorkSchedule,
 )
-from app.utils.schema import DefaultDumpsSchema, PaginationSchema
+from app.utils.schema import (
+    DefaultDumpsSchema,
+    PaginationQueryArgSchema,
+    PaginationSchema,
+)
 
 
 class SalaryCalculationSchema(DefaultDumpsSchema, SQLAlchemyAutoSchema):
@@ -160,18 +164,14 @@ class LoginResponseSchema(ma.Schema):
     role = ma.fields.Str()
 
 
-class UserQueryArgSchema(ma.Schema):
-    page = ma.fields.Int(default=1)
-    limit = ma.fields.Int(default=1)
+class UserQueryArgSchema(PaginationQueryArgSchema):
     search = ma.fields.Str()
     department = ma.fields.Str()
     status = ma.fields.Enum(enum=Statuses)
     role = ma.fields.Str()
 
 
-class UserSalaryQueryArgSchema(ma.Schema):
-    page = ma.fields.Int(default=1)
-    limit = ma.fields.Int(default=1)
+class UserSalaryQueryArgSchema(PaginationQueryArgSchema):
     search = ma.fields.Str()
     department = ma.fields.Str()
     role = ma.fields.Str()
@@ -254,6 +254,7 @@ class GroupListSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
     class Meta:
         model = Group
         fields = ["id", "name", "users", "payment_group"]
+        eager_load = ["users.salary", "users.permissions"]
 
     def get_payment_group(self, obj):
         if not obj.users:
@@ -319,9 +320,8 @@ class PagDepartmentSchema(ma.Schema):
     pagination = ma.fields.Nested(PaginationSchema)
 
 
-class DepartmentArgsSchema(ma.Schema):
-    page = ma.fields.Int()
-    limit = ma.fields.Int()
+class DepartmentArgsSchema(PaginationQueryArgSchema):
+    pass
 
 
 class GroupArgsSchema(ma.Schema):
@@ -0,0 +1,84 @@
+import datetime
+
+from sqlalchemy import (
+    Date,
+    and_,
+    case,
+    cast,
+    extract,
+    func,
+    literal,
+    select,
+    text,
+    true,
+)
+from sqlalchemy.dialects.postgresql import insert
+
+from app.choices import DaysOfWeekShort, WorkScheduleStatus
+from app.user.models import User, WorkingDay, WorkSchedule
+
+
+def create_work_schedules(db_session, start_date, end_date=None):
+    """
+    Рабочие дни всех сотрудников на даты start_date..end_date (включительно,
+    по умолчанию - только start_date) одним INSERT ... SELECT по графику
+    working_day; уже созданные дни не меняются.
+    Возвращает число созданных строк.
+    """
+    end_date = end_date or start_date
+    days = select(
+        cast(
+            func.generate_series(
+                literal(start_date, Date),
+                literal(end_date, Date),
+                text("interval '1 day'"),
+            ),
+            Date,
+        ).label("date")
+    ).subquery("days")
+    # ISO номер дня недели (1 - понедельник) -> DaysOfWeekShort
+    day_of_week = cast(
+        case(
+            *(
+                (extract("isodow", days.c.date) == number, day.name)
+                for number, day in enumerate(DaysOfWeekShort, 1)
+            )
+        ),
+        WorkingDay.day_of_week.type,
+    )
+    now = datetime.datetime.now()
+    rows = (
+        select(
+            User.id,
+            days.c.date,
+            WorkingDay.id,
+            cast(
+                case(
+                    (
+                        WorkingDay.is_working_day.is_(False),
+                        WorkScheduleStatus.DAY_OFF.name,
+                    )
+                ),
+                WorkSchedule.status.type,
+            ),
+            literal(now),
+            literal(now),
+        )
+        .select_from(User)
+        .join(days, true())
+        .outerjoin(
+            WorkingDay,
+            and_(WorkingDay.user_id == User.id, WorkingDay.day_of_week == day_of_week),
+        )
+        # несколько графиков на день недели - берётся первый
+        .distinct(User.id, days.c.date)
+        .order_by(User.id, days.c.date, WorkingDay.id)
+    )
+    return db_session.execute(
+        insert(WorkSchedule)
+        .from_select(
+            ["user_id", "date", "working_day_id", "status", "created_at", "updated_at"],
+            rows,
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "date"])
+    ).rowcount
@@ -24,3 +24,7 @@ class NotRightStatus(CustomError):
 
 class ValidateError(CustomError):
     pass
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Эндпоинт превысил бюджет SQL-запросов (только в тестах)"""
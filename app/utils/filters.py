@@ -0,0 +1,29 @@
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import String, Text, and_, cast
+
+
+def date_between(column, start_date, end_date=None):
+    """
+    column (DateTime) попадает в дни start_date..end_date включительно,
+    end_date=None - только start_date. Диапазон [начало, конец) вместо
+    func.date(column) == ... - фильтр использует индекс по column.
+    """
+    end_date = end_date or start_date
+    return and_(
+        column >= datetime.combine(start_date, time.min),
+        column < datetime.combine(end_date + timedelta(days=1), time.min),
+    )
+
+
+def like_pattern(value, prefix=False):
+    """Шаблон LIKE (prefix - только начало): % и _ во value - обычные символы"""
+    value = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{value}%" if prefix else f"%{value}%"
+
+
+def contains(column, value):
+    """ilike '%value%', числовые колонки сравниваются как текст"""
+    if not isinstance(column.type, String):
+        column = cast(column, Text)
+    return column.ilike(like_pattern(value), escape="\\")
@@ -4,17 +4,25 @@ import os
 from functools import wraps
 from hashlib import sha256
 
-import jwt
 from flask import current_app, jsonify, request
-from sqlalchemy import select
+from sqlalchemy import func, select, update
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.attributes import set_committed_value
 from werkzeug.utils import secure_filename
 
 from app.base import session
 from app.choices import InvoiceStatuses, InvoiceTypes
 from app.invoice.models import Invoice
-from app.product.models import Container, Part
-from app.user.models import User
+from app.invoice.utils import mark_invoices_dirty
+from app.product.models import (
+    Container,
+    ContainerLot,
+    Part,
+    PartLot,
+    ProductLot,
+    ProductUnit,
+)
+from app.user.auth import get_current_user
 from app.utils.exc import ItemNotFoundError
 
 
@@ -50,13 +58,8 @@ def token_required(f):
         if not token:
             return jsonify({"message": "Token is missing !!"}), 401
         try:
-            data = jwt.decode(
-                token, current_app.config.get("SECRET_KEY"), algorithms=["HS256"]
-            )
             try:
-                current_user = session.execute(
-                    select(User).filter_by(id=data.get("public_id"))
-                ).scalar()
+                current_user = get_current_user()
                 if not current_user:
                     return jsonify({"message": "User not found !!"}), 401
             except SQLAlchemyError as e:
@@ -122,49 +125,106 @@ def hash_image_save(
     return file_path
 
 
+def _return_to_oldest_lots(LotModel, item_column, invoice_id):
+    """
+    Количество лотов накладной по позициям возвращается в самый ранний
+    опубликованный приходный лот позиции - один лот на позицию.
+    """
+    item_id = getattr(LotModel, item_column)
+    quantities = dict(
+        session.execute(
+            select(item_id, func.sum(LotModel.quantity))
+            .where(LotModel.invoice_id == invoice_id)
+            .group_by(item_id)
+            .having(func.sum(LotModel.quantity) > 0)
+        ).all()
+    )
+    if not quantities:
+        return
+    # FOR UPDATE несовместим с DISTINCT - самые ранние лоты выбираются подзапросом
+    oldest = (
+        select(LotModel.id)
+        .join(Invoice, Invoice.id == LotModel.invoice_id)
+        .where(
+            item_id.in_(quantities),
+            Invoice.status == InvoiceStatuses.PUBLISHED,
+            Invoice.type != InvoiceTypes.EXPENSE,
+        )
+        .distinct(item_id)
+        .order_by(item_id, LotModel.created_at.asc())
+    )
+    for lot in session.scalars(
+        select(LotModel).where(LotModel.id.in_(oldest)).with_for_update()
+    ):
+        lot.quantity += quantities[getattr(lot, item_column)]
+
+
+def _take_from_fifo_lots(LotModel, item_column, invoice, decrease):
+    """Количество лотов накладной по позициям списывается по FIFO один раз"""
+    item_id = getattr(LotModel, item_column)
+    for item, quantity in session.execute(
+        select(item_id, func.sum(LotModel.quantity))
+        .where(LotModel.invoice_id == invoice.id)
+        .group_by(item_id)
+        .order_by(item_id)
+    ):
+        decrease(item, quantity, invoice.warehouse_sender_id)
+
+
+def _shift_product_lots(invoice_id, sign):
+    """
+    Количество лотов продукции накладной +/- число их единиц одним UPDATE.
+    Накладная уже отменена - остатки складов это не меняет.
+    """
+    units = (
+        select(
+            ProductUnit.product_lot_id.label("lot_id"),
+            func.count().label("count"),
+        )
+        .join(ProductLot, ProductLot.id == ProductUnit.product_lot_id)
+        .where(ProductLot.invoice_id == invoice_id)
+        .group_by(ProductUnit.product_lot_id)
+        .subquery()
+    )
+    quantity = ProductLot.quantity + sign * units.c.count
+    rows = session.execute(
+        update(ProductLot)
+        .where(ProductLot.id == units.c.lot_id)
+        .values(quantity=quantity, total_sum=quantity * ProductLot.price)
+        .returning(ProductLot.id, ProductLot.quantity, ProductLot.total_sum),
+        execution_options={"synchronize_session": False},
+    ).all()
+    for row in rows:
+        lot = session.identity_map.get(session.identity_key(ProductLot, row.id))
+        if lot is not None:
+            set_committed_value(lot, "quantity", row.quantity)
+            set_committed_value(lot, "total_sum", row.total_sum)
+    if rows:
+        mark_invoices_dirty(session, [invoice_id])
+
+
 def cancel_invoice(invoice_id):
+    """
+    Отмена накладной в одной транзакции: строка накладной блокируется,
+    лоты продукции меняются одним UPDATE по числу единиц, контейнеры
+    и части - один раз на позицию.
+    """
     invoice = Invoice.get_by_id(invoice_id)
+    session.refresh(invoice, with_for_update=True)
 
+    product_sign = 0
     if invoice.status == InvoiceStatuses.PUBLISHED:
         if invoice.type == InvoiceTypes.EXPENSE:
-            # Восстановление количества продуктов
-            for product_lot in invoice.product_lots:
-                for unit in product_lot.units:
-                    old_lot = unit.product_lot
-                    old_lot.quantity += 1
-                    old_lot.calc_total_sum()
-                    unit.product_lot = old_lot
-
-            # Восстановление количества контейнеров
-            for container_lot in invoice.container_lots:
-                Container.increase(container_lot.container_id, container_lot.quantity)
-
-            # Восстановление количества частей
-            for part_lot in invoice.part_lots:
-                Part.increase(part_lot.part_id, part_lot.quantity)
+            # Восстановление количества продуктов, контейнеров и частей
+            product_sign = 1
+            _return_to_oldest_lots(ContainerLot, "container_id", invoice.id)
+            _return_to_oldest_lots(PartLot, "part_id", invoice.id)
         if invoice.type in [InvoiceTypes.INVOICE, InvoiceTypes.PRODUCTION]:
-            for product_lot in invoice.product_lots:
-                for unit in product_lot.units:
-                    old_lot = unit.product_lot
-                    old_lot.quantity -= 1
-                    old_lot.calc_total_sum()
-                    unit.product_lot = old_lot
-
-            # Восстановление количества контейнеров
-            for container_lot in invoice.container_lots:
-                Container.decrease(
-                    container_lot.container_id,
-                    container_lot.quantity,
-                    warehouse_id=invoice.warehouse_sender_id,
-                )
-
-            # Восстановление количества частей
-            for part_lot in invoice.part_lots:
-                Part.decrease(
-                    part_lot.part_id,
-                    part_lot.quantity,
-                    invoice.warehouse_sender_id,
-                )
+            product_sign = -1
+            _take_from_fifo_lots(
+                ContainerLot, "container_id", invoice, Container.decrease
+            )
+            _take_from_fifo_lots(PartLot, "part_id", invoice, Part.decrease)
         if invoice.type == InvoiceTypes.TRANSFER:
             invoice.warehouse_sender_id, invoice.warehouse_receiver_id = (
                 invoice.warehouse_receiver_id,
@@ -173,4 +233,8 @@ def cancel_invoice(invoice_id):
 
     # Изменение статуса инвойса на "отменён"
     invoice.status = InvoiceStatuses.CANCELED
+    # остатки списываются по лотам до изменения их количества
+    session.flush()
+    if product_sign:
+        _shift_product_lots(invoice.id, product_sign)
     session.commit()
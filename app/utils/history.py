@@ -0,0 +1,135 @@
+import json
+import queue
+import threading
+
+from flask import current_app, g, has_app_context
+
+from app.base import engine
+
+# "sync" - история пишется в той же транзакции после flush,
+# "async" - после коммита через очередь в фоновом потоке
+HISTORY_WRITER_MODE = "sync"
+# ограничение очереди async-режима (в коммитах); при заполнении put ждёт
+HISTORY_QUEUE_SIZE = 1000
+HISTORY_BATCH_SIZE = 500
+
+# модель -> (модель истории, extra_fields(target)), заполняет reg_history
+_history_models = {}
+
+_queue = None
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def add_history(db_session, history_model, target, action, extra_fields):
+    """
+    Строка истории для target из его history_data (temp data).
+    Пишется вместе с остальными строками flush одним INSERT.
+    """
+    data = target.get_temp_data("history_data")
+    target.clear_temp_data()
+    if data is None:
+        return
+    _add_history_row(db_session, history_model, action, data, extra_fields)
+
+
+def _add_history_row(db_session, history_model, action, data, extra_fields):
+    user = g.get("user") if has_app_context() else None
+    row = {
+        "user_id": user.id if user else None,
+        "operation_status": action,
+        # несериализуемые значения не должны ронять основную транзакцию
+        "data": json.loads(json.dumps(data, default=str)),
+        "user_full_name": user.full_name if user else None,
+        **extra_fields,
+    }
+    db_session.info.setdefault("history_rows", []).append((history_model, row))
+
+
+def register_history_model(model, history_model, extra_fields):
+    _history_models[model] = (history_model, extra_fields)
+
+
+def has_history(model):
+    return model in _history_models
+
+
+def add_model_history(db_session, target, action):
+    """add_history для изменений в обход flush (например, UPDATE баланса)"""
+    history_model, extra_fields = _history_models[type(target)]
+    add_history(db_session, history_model, target, action, extra_fields(target))
+
+
+def add_row_history(db_session, model, row, action, data):
+    """История по строке таблицы (UPDATE ... RETURNING) без ORM-объекта"""
+    history_model, extra_fields = _history_models[model]
+    _add_history_row(db_session, history_model, action, data, extra_fields(row))
+
+
+def write_history(connection, items):
+    """Один многострочный INSERT на таблицу истории"""
+    rows_by_model = {}
+    for history_model, row in items:
+        rows_by_model.setdefault(history_model, []).append(row)
+    for history_model, rows in rows_by_model.items():
+        connection.execute(history_model.__table__.insert(), rows)
+
+
+def flush_history(db_session):
+    """after_flush_postexec: в sync-режиме - в текущей транзакции"""
+    if _config("HISTORY_WRITER_MODE", HISTORY_WRITER_MODE) != "sync":
+        return
+    items = db_session.info.pop("history_rows", None)
+    if items:
+        write_history(db_session.connection(), items)
+
+
+def enqueue_history(db_session):
+    """after_commit: в async-режиме строки уходят в очередь фонового потока"""
+    if _config("HISTORY_WRITER_MODE", HISTORY_WRITER_MODE) != "async":
+        return
+    items = db_session.info.pop("history_rows", None)
+    if items:
+        _get_queue().put(items)
+
+
+def discard_history(db_session):
+    db_session.info.pop("history_rows", None)
+
+
+def _get_queue():
+    global _queue, _worker
+    with _worker_lock:
+        if _queue is None:
+            _queue = queue.Queue(
+                maxsize=_config("HISTORY_QUEUE_SIZE", HISTORY_QUEUE_SIZE)
+            )
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_history_worker,
+                args=(_queue, current_app.logger if has_app_context() else None),
+                name="history-writer",
+                daemon=True,
+            )
+            _worker.start()
+    return _queue
+
+
+def _history_worker(history_queue, logger):
+    while True:
+        items = list(history_queue.get())
+        while len(items) < HISTORY_BATCH_SIZE:
+            try:
+                items.extend(history_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with engine.begin() as connection:
+                write_history(connection, items)
+        except Exception as e:
+            if logger:
+                logger.error(f"History writer: {e}")
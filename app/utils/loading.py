@@ -0,0 +1,101 @@
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+from marshmallow import fields
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.utils.exc import QueryBudgetExceeded
+
+# класс схемы -> опции загрузки
+_options_cache = {}
+
+
+def _schema_paths(schema, model, prefix=""):
+    """
+    Пути связей, которые прочитает дамп schema: Nested-поля по связям модели
+    (рекурсивно) и Meta.eager_load - связи, которые читают Method-поля.
+    """
+    paths = [prefix + path for path in getattr(schema.Meta, "eager_load", ())]
+    relationships = inspect(model).relationships
+    for name, field in schema.dump_fields.items():
+        if isinstance(field, fields.List):
+            field = field.inner
+        if not isinstance(field, fields.Nested):
+            continue
+        key = field.attribute or name
+        if key not in relationships:
+            continue
+        paths.append(prefix + key)
+        paths.extend(
+            _schema_paths(
+                field.schema, relationships[key].mapper.class_, f"{prefix}{key}."
+            )
+        )
+    return paths
+
+
+def _path_option(model, path):
+    """'a.b' -> selectinload для коллекций, joinedload для many-to-one"""
+    option = None
+    for name in path.split("."):
+        attr = getattr(model, name)
+        if attr.property.uselist:
+            option = selectinload(attr) if option is None else option.selectinload(attr)
+        else:
+            option = joinedload(attr) if option is None else option.joinedload(attr)
+        model = attr.property.mapper.class_
+    return option
+
+
+def eager_load_options(schema):
+    """Опции query.options(...) против ленивых загрузок при дампе schema"""
+    key = schema if isinstance(schema, type) else None
+    if key in _options_cache:
+        return _options_cache[key]
+    instance = schema() if isinstance(schema, type) else schema
+    model = instance.opts.model
+    paths = dict.fromkeys(_schema_paths(instance, model))
+    options = [_path_option(model, path) for path in paths]
+    if key is not None:
+        _options_cache[key] = options
+    return options
+
+
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    """Счётчик запросов для query_budget"""
+    if has_app_context() and "query_count" in g:
+        g.query_count += 1
+
+
+def query_budget(limit):
+    """
+    Предел числа SQL-запросов эндпоинта вместе с дампом ответа.
+    Проверяется только при QUERY_BUDGET_CHECK (в тестах):
+    превышение - QueryBudgetExceeded.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not current_app.config.get("QUERY_BUDGET_CHECK"):
+                return f(*args, **kwargs)
+            outer = g.pop("query_count", None)
+            g.query_count = 0
+            try:
+                res = f(*args, **kwargs)
+                count = g.query_count
+            finally:
+                if outer is None:
+                    g.pop("query_count", None)
+                else:
+                    g.query_count += outer
+            if count > limit:
+                raise QueryBudgetExceeded(
+                    f"{request.endpoint}: {count} queries, budget {limit}"
+                )
+            return res
+
+        return decorated
+
+    return decorator
@@ -3,17 +3,17 @@ from sqlalchemy import JSON, Enum, Float, ForeignKey, String
 from sqlalchemy.orm import Mapped, declared_attr, mapped_column, relationship
 
 from app.choices import CrudOperations
+from app.utils.loading import eager_load_options
+from app.utils.pagination import paginate, pop_pagination
 
 
 class CustomMethodPaginationView(MethodView):
     model = None
+    # схема элементов списка - по ней подгружаются связи для дампа
+    list_schema = None
 
     def get(self, args, query_args=None, custom_query=None, matched_lst=None):
-
-        page = args.pop("page", 1)
-        limit = int(args.pop("limit", 10))
-        if limit <= 0:
-            limit = 10
+        pagination = pop_pagination(args)
 
         name = args.pop("name", None)
         if custom_query:
@@ -22,24 +22,15 @@ class CustomMethodPaginationView(MethodView):
             query = self.model.query.order_by(self.model.created_at.desc())
         default_query_args = []
         if name:
-            default_query_args.append(self.model.name.ilike(f"%{name}%"))
+            from app.search.utils import search_filter
+
+            default_query_args.append(search_filter(self.model, name))
         if query_args:
             default_query_args.extend(query_args)
         query = query.filter(*default_query_args)
-        total_count = query.count()
-        total_pages = (total_count + limit - 1) // limit
-        data = query.limit(limit).offset((page - 1) * limit).all()
-        response = {
-            "data": data,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total_pages": total_pages,
-                "total_count": total_count,
-            },
-        }
-
-        return response
+        if self.list_schema is not None:
+            query = query.options(*eager_load_options(self.list_schema))
+        return paginate(query, pagination, self.model)
 
 
 class HistoryMixin:
@@ -70,11 +61,15 @@ class BalanceMixin:
 
     @declared_attr
     def balance(cls) -> Mapped[float]:
-        return mapped_column(Float, default=0, nullable=True)
+        # старое значение нужно для корректировок в журнале проводок
+        return mapped_column(Float, default=0, nullable=True, active_history=True)
 
 
 class TempDataMixin:
-    _temp_data = {}
+    @property
+    def _temp_data(self):
+        """Временные данные хранятся на экземпляре, а не общие на класс"""
+        return self.__dict__.setdefault("_temp_data_dict", {})
 
     def add_temp_data(self, key, value):
         """Добавляем временные данные в словарь"""
@@ -0,0 +1,90 @@
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from app.utils.exc import ValidateError
+
+DEFAULT_LIMIT = 10
+
+
+def encode_cursor(obj):
+    """Курсор - позиция записи в сортировке (created_at, id)"""
+    raw = f"{obj.created_at.isoformat()}|{obj.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, obj_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(obj_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidateError("Invalid cursor")
+
+
+def pop_pagination(args):
+    """
+    Извлекает параметры пагинации из аргументов запроса,
+    чтобы остальное можно было передать в filter_by.
+    """
+    page = args.pop("page", None) or 1
+    try:
+        limit = int(args.pop("limit", DEFAULT_LIMIT))
+    except (TypeError, ValueError):
+        limit = DEFAULT_LIMIT
+    if limit <= 0:
+        limit = DEFAULT_LIMIT
+    cursor = args.pop("cursor", None)
+    with_count = args.pop("with_count", None)
+    if with_count is None:
+        # в режиме курсора COUNT по всей выборке только по запросу
+        with_count = cursor is None
+    return {"page": page, "limit": limit, "cursor": cursor, "with_count": with_count}
+
+
+def paginate(query, pagination, model=None, asc=False):
+    """
+    Страница query.
+    Если передан cursor (пустая строка - первая страница) и model,
+    выборка идёт по ключу (created_at, id) без OFFSET, время не зависит
+    от глубины страницы. Иначе - LIMIT/OFFSET по page.
+    asc - порядок по возрастанию created_at, по умолчанию новые первыми.
+    """
+    page = pagination["page"]
+    limit = pagination["limit"]
+    cursor = pagination["cursor"]
+    total_count = total_pages = None
+    if pagination["with_count"]:
+        total_count = query.order_by(None).count()
+        total_pages = (total_count + limit - 1) // limit
+
+    next_cursor = None
+    if cursor is not None and model is not None:
+        key = tuple_(model.created_at, model.id)
+        if asc:
+            query = query.order_by(None).order_by(model.created_at, model.id)
+        else:
+            query = query.order_by(None).order_by(
+                model.created_at.desc(), model.id.desc()
+            )
+        if cursor:
+            last = decode_cursor(cursor)
+            query = query.filter(key > last if asc else key < last)
+        data = query.limit(limit + 1).all()
+        if len(data) > limit:
+            data = data[:limit]
+            next_cursor = encode_cursor(data[-1])
+    else:
+        data = query.limit(limit).offset((page - 1) * limit).all()
+
+    return {
+        "data": data,
+        "pagination": {
+            "page": page,
+            "limit": limit,
+            "total_pages": total_pages,
+            "total_count": total_count,
+            "next_cursor": next_cursor,
+        },
+    }
@@ -0,0 +1,151 @@
+import json
+import math
+import time
+from collections import deque
+from functools import wraps
+
+import marshmallow as ma
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event
+
+from app.base import engine
+from app.utils.func import token_required
+
+# последних запросов на маршрут для перцентилей
+PERF_WINDOW = 500
+# самых медленных SQL-запросов в логе запроса
+PERF_SLOW_STATEMENTS = 3
+PERF_STATEMENT_LENGTH = 200
+
+# "GET /invoice/" -> deque[(всего мс, бд мс, запросов)]
+_route_stats = {}
+
+
+def _stats():
+    if has_request_context():
+        return g.get("perf")
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _stats() is not None:
+        conn.info.setdefault("perf_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _stats()
+    if stats is None or not conn.info.get("perf_start"):
+        return
+    duration = (time.perf_counter() - conn.info["perf_start"].pop()) * 1000
+    stats["queries"] += 1
+    stats["db_ms"] += duration
+    slowest = stats["slowest"]
+    slowest.append((duration, statement[:PERF_STATEMENT_LENGTH]))
+    slowest.sort(key=lambda item: item[0], reverse=True)
+    del slowest[PERF_SLOW_STATEMENTS:]
+
+
+def _timed_dump(dump):
+    """Время сериализации; вложенные схемы учитываются во внешнем dump"""
+
+    @wraps(dump)
+    def decorated(self, *args, **kwargs):
+        stats = _stats()
+        if stats is None or stats["dump_depth"]:
+            return dump(self, *args, **kwargs)
+        stats["dump_depth"] += 1
+        start = time.perf_counter()
+        try:
+            return dump(self, *args, **kwargs)
+        finally:
+            stats["dump_depth"] -= 1
+            stats["serialize_ms"] += (time.perf_counter() - start) * 1000
+
+    return decorated
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    # nearest-rank
+    return round(values[max(0, math.ceil(len(values) * p / 100) - 1)], 1)
+
+
+def route_report():
+    report = {}
+    for route, window in list(_route_stats.items()):
+        window = list(window)
+        totals = [item[0] for item in window]
+        report[route] = {
+            "count": len(window),
+            "p50": percentile(totals, 50),
+            "p95": percentile(totals, 95),
+            "p99": percentile(totals, 99),
+            "db_p95": percentile([item[1] for item in window], 95),
+            "queries_max": max(item[2] for item in window),
+        }
+    return report
+
+
+def init_perf(app):
+    """
+    Число SQL-запросов, время БД и сериализации на запрос:
+    заголовок Server-Timing, строка лога "perf {...}" и /internal/perf.
+    """
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    if not hasattr(ma.Schema.dump, "__wrapped__"):
+        ma.Schema.dump = _timed_dump(ma.Schema.dump)
+
+    @app.before_request
+    def start_perf():
+        g.perf = {
+            "start": time.perf_counter(),
+            "queries": 0,
+            "db_ms": 0.0,
+            "serialize_ms": 0.0,
+            "dump_depth": 0,
+            "slowest": [],
+        }
+
+    @app.after_request
+    def finish_perf(response):
+        stats = g.pop("perf", None)
+        if stats is None:
+            return response
+        total = (time.perf_counter() - stats["start"]) * 1000
+        rule = request.url_rule.rule if request.url_rule else "-"
+        route = f"{request.method} {rule}"
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={stats["db_ms"]:.1f};desc="{stats["queries"]} queries", '
+            f'serialize;dur={stats["serialize_ms"]:.1f}, total;dur={total:.1f}',
+        )
+        app.logger.info(
+            "perf %s",
+            json.dumps(
+                {
+                    "route": route,
+                    "status": response.status_code,
+                    "total_ms": round(total, 1),
+                    "db_ms": round(stats["db_ms"], 1),
+                    "queries": stats["queries"],
+                    "serialize_ms": round(stats["serialize_ms"], 1),
+                    "slowest": [
+                        {"ms": round(ms, 1), "sql": sql}
+                        for ms, sql in stats["slowest"]
+                    ],
+                },
+                ensure_ascii=False,
+            ),
+        )
+        _route_stats.setdefault(route, deque(maxlen=PERF_WINDOW)).append(
+            (total, stats["db_ms"], stats["queries"])
+        )
+        return response
+
+    @app.get("/internal/perf")
+    @token_required
+    def perf_report(c):
+        """p50/p95/p99 длительности (мс) по маршрутам за последние запросы"""
+        return jsonify(route_report())
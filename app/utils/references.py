@@ -0,0 +1,57 @@
+from sqlalchemy import select
+
+from app.utils.exc import ValidateError
+
+# content_type ("CashRegister", ...) -> модель, заполняет register_content_type
+CONTENT_TYPES = {}
+
+
+def register_content_type(model):
+    """Декоратор модели, на которую ссылаются пары (content_type, object_id)"""
+    CONTENT_TYPES[model.__name__] = model
+    return model
+
+
+def content_type_model(content_type):
+    try:
+        return CONTENT_TYPES[content_type]
+    except KeyError:
+        raise ValidateError(f"Unknown content type: {content_type}")
+
+
+def _resolved(db_session):
+    """(content_type, object_id) -> объект, до конца транзакции сессии"""
+    return db_session.info.setdefault("resolved_references", {})
+
+
+def resolve(db_session, content_type, object_id):
+    """Объект по ссылке; повторные обращения в транзакции - без запроса"""
+    resolved = _resolved(db_session)
+    key = (content_type, object_id)
+    if key not in resolved:
+        resolved[key] = db_session.get(content_type_model(content_type), object_id)
+    return resolved[key]
+
+
+def resolve_many(db_session, references):
+    """
+    Объекты по ссылкам [(content_type, object_id)]:
+    один запрос на content_type для ещё не загруженных.
+    Возвращает {(content_type, object_id): объект или None}.
+    """
+    resolved = _resolved(db_session)
+    missing = {}
+    for content_type, object_id in references:
+        if (content_type, object_id) not in resolved:
+            missing.setdefault(content_type, set()).add(object_id)
+    for content_type, ids in missing.items():
+        model = content_type_model(content_type)
+        for obj in db_session.scalars(select(model).where(model.id.in_(ids))):
+            resolved[(content_type, obj.id)] = obj
+        for object_id in ids:
+            resolved.setdefault((content_type, object_id), None)
+    return {key: resolved[key] for key in references}
+
+
+def clear_resolved(db_session):
+    db_session.info.pop("resolved_references", None)
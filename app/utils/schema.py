@@ -80,3 +80,13 @@ class PaginationSchema(ma.Schema):
     per_page = ma.fields.Int()
     total_pages = ma.fields.Int()
     total_count = ma.fields.Int()
+    next_cursor = ma.fields.Str()
+
+
+class PaginationQueryArgSchema(ma.Schema):
+    page = ma.fields.Int(required=False)
+    limit = ma.fields.Int(required=False)
+    # постранично по ключу (created_at, id); пустая строка - первая страница
+    cursor = ma.fields.Str(required=False)
+    # считать total_count; по умолчанию только без cursor
+    with_count = ma.fields.Bool(required=False)
@@ -1,7 +1,7 @@
 from sqlalchemy import select
 from app.choices import InvoiceStatuses
 from app.invoice.models import Invoice
-from app.invoice.schema import PagWarehouseHistorySchema
+from app.invoice.schema import InvoiceHistorySchema, PagWarehouseHistorySchema
 from app.user.models import User
 from app.user.schema import UserSchema
 from app.utils.func import msg_response, token_required
@@ -19,9 +19,12 @@ from app.warehouse.schema import (
     WarehouseSchema,
     WarehouseStatsSchema,
 )
+from app.warehouse.utils import get_warehouses_stock
 from app.base import session
 from app.utils.exc import ItemNotFoundError
 from app.utils.schema import ResponseSchema
+from app.utils.loading import eager_load_options, query_budget
+from app.utils.pagination import paginate, pop_pagination
 
 
 warehouse = Blueprint(
@@ -37,38 +40,18 @@ class WarehouseAllView(MethodView):
     def get(c, self, args):
         """List warehouses"""
         user_ids = args.pop("user_ids", None)
-        page = args.pop("page", 1)
-        try:
-            limit = int(args.pop("limit", 10))
-            if limit <= 0:
-                limit = 10
-        except ValueError:
-            limit = 10
-        if limit <= 0:
-            limit = 10
+        pagination = pop_pagination(args)
         try:
             query = Warehouse.query.filter_by(**args).order_by(
                 Warehouse.created_at.asc()
             )
             if user_ids:
                 query = query.join(Warehouse.users).filter(User.id.in_(user_ids))
-            total_count = query.count()
-            total_pages = (total_count + limit - 1) // limit
-            data = query.limit(limit).offset((page - 1) * limit).all()
+            response = paginate(query, pagination, Warehouse, asc=True)
         except SQLAlchemyError as e:
             current_app.logger.error(str(e.args))
             session.rollback()
             return msg_response("Something went wrong", False), 400
-        response = {
-            "data": data,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total_pages": total_pages,
-                "total_count": total_count,
-            },
-        }
-
         return response
 
     @token_required
@@ -136,16 +119,11 @@ def get_responsible_users(c, warehouse_id):
 
 @warehouse.get("/<warehouse_id>/history/")
 @token_required
+@query_budget(5)
 @warehouse.arguments(PaginateQueryArgSchema, location="query")
 @warehouse.response(200, PagWarehouseHistorySchema)
 def get_history(c, args, warehouse_id):
-    page = args.pop("page", 1)
-    try:
-        limit = int(args.pop("limit", 10))
-        if limit <= 0:
-            limit = 10
-    except ValueError:
-        limit = 10
+    pagination = pop_pagination(args)
     try:
         sender_invoices = session.query(Invoice).filter(
             Invoice.warehouse_sender_id == warehouse_id,
@@ -159,25 +137,16 @@ def get_history(c, args, warehouse_id):
         )
 
         # Combine the queries using union_all
-        query = sender_invoices.union_all(receiver_invoices).order_by(
-            Invoice.created_at
+        query = (
+            sender_invoices.union_all(receiver_invoices)
+            .options(*eager_load_options(InvoiceHistorySchema))
+            .order_by(Invoice.created_at)
         )
-        total_count = query.count()
-        total_pages = (total_count + limit - 1) // limit
-        data = query.limit(limit).offset((page - 1) * limit).all()
+        response = paginate(query, pagination, Invoice, asc=True)
     except SQLAlchemyError as e:
         current_app.logger.error(str(e.args))
         session.rollback()
         return msg_response("Something went wrong", False), 400
-    response = {
-        "data": data,
-        "pagination": {
-            "page": page,
-            "limit": limit,
-            "total_pages": total_pages,
-            "total_count": total_count,
-        },
-    }
     return response
 
 
@@ -186,11 +155,9 @@ def get_history(c, args, warehouse_id):
 @warehouse.response(200, WarehouseStatsSchema)
 def get_stats(c):
     warehouses = session.execute(select(Warehouse)).scalars().all()
-    total_capacity = 0
-    total_price = 0
-    for warehouse in warehouses:
-        total_capacity += warehouse.calc_capacity()
-        total_price += warehouse.calc_total_price()
+    stock = get_warehouses_stock([warehouse.id for warehouse in warehouses])
+    total_capacity = sum(item["capacity"] for item in stock.values())
+    total_price = sum(item["total_price"] for item in stock.values())
     res = {
         "total_capacity": total_capacity,
         "total_price": total_price,
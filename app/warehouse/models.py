@@ -1,9 +1,10 @@
-from sqlalchemy import String
+from sqlalchemy import Enum, Float, ForeignKey, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from typing import List, TYPE_CHECKING
+import enum
 from app.base import Base
-from app.choices import InvoiceStatuses
+from app.choices import InvoiceStatuses, StockItemTypes
 
 if TYPE_CHECKING:
     from app.user.models import User
@@ -27,91 +28,34 @@ class Warehouse(Base):
         foreign_keys="[Invoice.warehouse_receiver_id]",
     )
 
+    def get_stock(self):
+        from app.warehouse.utils import get_warehouse_stock
+
+        return get_warehouse_stock(self.id)
+
     def calc_capacity(self):
-        receive = 0
-        if self.invoice_receivers:
-            receive = sum(
-                [
-                    inv.quantity
-                    for inv in self.invoice_receivers
-                    if inv.status == InvoiceStatuses.PUBLISHED
-                ]
-            )
-        return receive
+        return self.get_stock()["capacity"]
 
     def calc_total_price(self):
-        res = (
-            self.calc_container_invoices_price()
-            + self.calc_part_invoices_price()
-            + self.calc_product_invoices_price()
-        )
-        return res
+        return self.get_stock()["total_price"]
 
     def calc_container_invoices_price(self):
-        if self.invoice_receivers:
-            return sum(
-                [
-                    inv.calc_container_lots_price()
-                    for inv in self.invoice_receivers
-                    if inv.status == InvoiceStatuses.PUBLISHED
-                ]
-            )
-        return 0
+        return self.get_stock()["container_price"]
 
     def calc_part_invoices_price(self):
-        if self.invoice_receivers:
-            return sum(
-                [
-                    inv.calc_part_lots_price()
-                    for inv in self.invoice_receivers
-                    if inv.status == InvoiceStatuses.PUBLISHED
-                ]
-            )
-        return 0
+        return self.get_stock()["part_price"]
 
     def calc_product_invoices_price(self):
-        if self.invoice_receivers:
-            return sum(
-                [
-                    inv.calc_product_lots_price()
-                    for inv in self.invoice_receivers
-                    if inv.status == InvoiceStatuses.PUBLISHED
-                ]
-            )
-        return 0
+        return self.get_stock()["product_price"]
 
     def calc_container_invoices_quantity(self):
-        if self.invoice_receivers:
-            return sum(
-                [
-                    inv.calc_container_lots_quantity()
-                    for inv in self.invoice_receivers
-                    if inv.status == InvoiceStatuses.PUBLISHED
-                ]
-            )
-        return 0
+        return self.get_stock()["container_quantity"]
 
     def calc_part_invoices_quantity(self):
-        if self.invoice_receivers:
-            return sum(
-                [
-                    inv.calc_part_lots_quantity()
-                    for inv in self.invoice_receivers
-                    if inv.status == InvoiceStatuses.PUBLISHED
-                ]
-            )
-        return 0
+        return self.get_stock()["part_quantity"]
 
     def calc_product_invoices_quantity(self):
-        if self.invoice_receivers:
-            return sum(
-                [
-                    inv.calc_product_lots_quantity()
-                    for inv in self.invoice_receivers
-                    if inv.status == InvoiceStatuses.PUBLISHED
-                ]
-            )
-        return 0
+        return self.get_stock()["product_quantity"]
 
     def get_products(self):
         arr = []
@@ -136,3 +80,25 @@ class Warehouse(Base):
                 if invoice.status == InvoiceStatuses.PUBLISHED:
                     arr.extend(invoice.get_parts())
         return list(set(arr))
+
+
+class StockBalance(Base):
+    """
+    Остаток позиции на складе по лотам опубликованных входящих накладных
+    (кроме расходных): количество, сумма total_sum лотов (статистика
+    продукции по складам) и сумма price * quantity (стоимость склада).
+    Обновляется событиями сессии (см. reg_stock_events), пересчитывается
+    командой `flask rebuild-stock`.
+    """
+
+    __tablename__ = "stock_balance"
+    __table_args__ = (UniqueConstraint("warehouse_id", "item_type", "item_id"),)
+
+    warehouse_id: Mapped[int] = mapped_column(
+        ForeignKey("warehouse.id", ondelete="CASCADE")
+    )
+    item_type: Mapped[enum.Enum] = mapped_column(Enum(StockItemTypes))
+    item_id: Mapped[int] = mapped_column(index=True)
+    quantity: Mapped[int] = mapped_column(default=0)
+    total_sum: Mapped[float] = mapped_column(Float(decimal_return_scale=2), default=0)
+    price_sum: Mapped[float] = mapped_column(Float(decimal_return_scale=2), default=0)
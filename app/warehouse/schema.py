@@ -1,24 +1,60 @@
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema, SQLAlchemySchema, auto_field
 import marshmallow as ma
-from sqlalchemy import func
 
 from app.base import session
-from app.choices import InvoiceStatuses
-from app.invoice.models import Invoice
-from app.product.models import (
-    Container,
-    ContainerLot,
-    Part,
-    PartLot,
-    Product,
-    ProductLot,
-)
+from app.choices import StockItemTypes
+from app.product.models import Container, Part, Product
 from app.user.models import User
-from app.utils.schema import DefaultDumpsSchema, PaginationSchema
-from app.warehouse.models import Warehouse
+from app.utils.schema import (
+    DefaultDumpsSchema,
+    PaginationQueryArgSchema,
+    PaginationSchema,
+)
+from app.warehouse.models import StockBalance, Warehouse
+from app.warehouse.utils import get_warehouses_stock
+
+
+class WarehouseStockMixin:
+    """Остатки считаются сразу для всех складов выдачи, а не по строке"""
+
+    @ma.pre_dump(pass_many=True)
+    def prefetch_stock(self, data, many, **kwargs):
+        items = [i for i in (data if many else [data]) if isinstance(i, Warehouse)]
+        self.stock = get_warehouses_stock([item.id for item in items])
+        return data
+
+    def get_stock(self, obj):
+        stock = getattr(self, "stock", {})
+        if obj.id not in stock:
+            return obj.get_stock()
+        return stock[obj.id]
+
+    def get_capacity(self, obj):
+        return self.get_stock(obj)["capacity"]
+
+    def get_calc_total_price(self, obj):
+        return self.get_stock(obj)["total_price"]
+
+    def get_calc_container_invoices_price(self, obj):
+        return self.get_stock(obj)["container_price"]
 
+    def get_calc_part_invoices_price(self, obj):
+        return self.get_stock(obj)["part_price"]
 
-class WarehouseSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
+    def get_calc_product_invoices_price(self, obj):
+        return self.get_stock(obj)["product_price"]
+
+    def get_calc_container_invoices_quantity(self, obj):
+        return self.get_stock(obj)["container_quantity"]
+
+    def get_calc_part_invoices_quantity(self, obj):
+        return self.get_stock(obj)["part_quantity"]
+
+    def get_calc_product_invoices_quantity(self, obj):
+        return self.get_stock(obj)["product_quantity"]
+
+
+class WarehouseSchema(WarehouseStockMixin, SQLAlchemyAutoSchema, DefaultDumpsSchema):
     class Meta:
         model = Warehouse
         include_fk = True
@@ -32,29 +68,15 @@ class WarehouseSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
     part_total_quantity = ma.fields.Method("get_calc_part_invoices_quantity")
     product_total_quantity = ma.fields.Method("get_calc_product_invoices_quantity")
 
-    @staticmethod
-    def get_calc_container_invoices_quantity(obj):
-        return obj.calc_container_invoices_quantity()
-
-    @staticmethod
-    def get_calc_part_invoices_quantity(obj):
-        return obj.calc_part_invoices_quantity()
-
-    @staticmethod
-    def get_calc_product_invoices_quantity(obj):
-        return obj.calc_product_invoices_quantity()
-
     @ma.post_load
     def append_users(self, data, **kwargs):
         data["users"] = User.query.filter(User.id.in_(data.pop("user_ids", []))).all()
         return data
 
-    @staticmethod
-    def get_capacity(obj):
-        return obj.calc_capacity()
-
 
-class WarehouseDetailSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
+class WarehouseDetailSchema(
+    WarehouseStockMixin, SQLAlchemyAutoSchema, DefaultDumpsSchema
+):
     class Meta:
         model = Warehouse
         include_fk = True
@@ -81,58 +103,24 @@ class WarehouseDetailSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
         return data
 
     @staticmethod
-    def get_capacity(obj):
-        return obj.calc_capacity()
-
-    @staticmethod
-    def get_calc_total_price(obj):
-        return obj.calc_total_price()
-
-    @staticmethod
-    def get_calc_container_invoices_price(obj):
-        return obj.calc_container_invoices_price()
-
-    @staticmethod
-    def get_calc_part_invoices_price(obj):
-        return obj.calc_part_invoices_price()
-
-    @staticmethod
-    def get_calc_product_invoices_price(obj):
-        return obj.calc_product_invoices_price()
-
-    @staticmethod
-    def get_calc_container_invoices_quantity(obj):
-        return obj.calc_container_invoices_quantity()
-
-    @staticmethod
-    def get_calc_part_invoices_quantity(obj):
-        return obj.calc_part_invoices_quantity()
-
-    @staticmethod
-    def get_calc_product_invoices_quantity(obj):
-        return obj.calc_product_invoices_quantity()
-
-    @staticmethod
-    def get_get_products(obj):
+    def get_stock_items(obj, Model, item_type):
         res = []
-        product_info = (
+        stock_info = (
             session.query(
-                Product.id,
-                Product.name,
-                func.sum(ProductLot.quantity),
-                func.max(ProductLot.updated_at),
+                Model.id,
+                Model.name,
+                StockBalance.quantity,
+                StockBalance.updated_at,
             )
-            .join(ProductLot, ProductLot.product_id == Product.id)
-            .join(Invoice, Invoice.warehouse_receiver_id == obj.id)
+            .join(StockBalance, StockBalance.item_id == Model.id)
             .filter(
-                ProductLot.quantity != 0,
-                Invoice.status == InvoiceStatuses.PUBLISHED,
-                ProductLot.invoice_id == Invoice.id,
+                StockBalance.warehouse_id == obj.id,
+                StockBalance.item_type == item_type,
+                StockBalance.quantity != 0,
             )
-            .group_by(Product.id, Product.name)
             .all()
         )
-        for id, name, quantity, updated_at in product_info:
+        for id, name, quantity, updated_at in stock_info:
             res.append(
                 {
                     "id": id,
@@ -144,80 +132,21 @@ class WarehouseDetailSchema(SQLAlchemyAutoSchema, DefaultDumpsSchema):
             )
         return res
 
-    @staticmethod
-    def get_get_containers(obj):
-        res = []
-        container_info = (
-            session.query(
-                Container.id,
-                Container.name,
-                func.sum(ContainerLot.quantity),
-                func.max(ContainerLot.updated_at),
-            )
-            .join(ContainerLot)
-            .join(Invoice)
-            .filter(
-                Invoice.warehouse_receiver_id == obj.id,
-                Invoice.status == InvoiceStatuses.PUBLISHED,
-                ContainerLot.quantity != 0,
-                ContainerLot.invoice_id == Invoice.id,
-            )
-            .group_by(Container.id, Container.name)
-            .all()
-        )
-        for id, name, quantity, updated_at in container_info:
-            res.append(
-                {
-                    "id": id,
-                    "name": name,
-                    "quantity": quantity,
-                    "count": quantity,
-                    "updated_at": updated_at.strftime("%Y-%m-%dT%H:%M:%S.%f"),
-                }
-            )
-        return res
+    def get_get_products(self, obj):
+        return self.get_stock_items(obj, Product, StockItemTypes.PRODUCT)
 
-    @staticmethod
-    def get_get_parts(obj):
-        res = []
-        part_info = (
-            session.query(
-                Part.id,
-                Part.name,
-                func.sum(PartLot.quantity),
-                func.max(PartLot.updated_at),
-            )
-            .join(PartLot, PartLot.part_id == Part.id)
-            .join(Invoice, Invoice.warehouse_receiver_id == obj.id)
-            .filter(
-                PartLot.quantity != 0,
-                Invoice.status == InvoiceStatuses.PUBLISHED,
-                PartLot.invoice_id == Invoice.id,
-            )
-            .group_by(Part.id, Part.name)
-            .all()
-        )
-        for id, name, quantity, updated_at in part_info:
-            res.append(
-                {
-                    "id": id,
-                    "name": name,
-                    "quantity": quantity,
-                    "count": quantity,
-                    "updated_at": updated_at.strftime("%Y-%m-%dT%H:%M:%S.%f"),
-                }
-            )
-        return res
+    def get_get_containers(self, obj):
+        return self.get_stock_items(obj, Container, StockItemTypes.CONTAINER)
 
+    def get_get_parts(self, obj):
+        return self.get_stock_items(obj, Part, StockItemTypes.PART)
 
-class PaginateQueryArgSchema(ma.Schema):
-    page = ma.fields.Int(default=1)
-    limit = ma.fields.Int(default=1)
 
+class PaginateQueryArgSchema(PaginationQueryArgSchema):
+    pass
 
-class WarehouseQueryArgSchema(ma.Schema):
-    page = ma.fields.Int(default=1)
-    limit = ma.fields.Int(default=1)
+
+class WarehouseQueryArgSchema(PaginationQueryArgSchema):
     name = ma.fields.Str(required=False)
     user_ids = ma.fields.List(ma.fields.Int(), required=False)
 
@@ -231,7 +160,7 @@ class WarehouseQueryArgIDSchema(ma.Schema):
     warehouse_id = ma.fields.Int()
 
 
-class WarehouseOneStatsSchema(SQLAlchemySchema):
+class WarehouseOneStatsSchema(WarehouseStockMixin, SQLAlchemySchema):
     class Meta:
         model = Warehouse
 
@@ -240,14 +169,6 @@ class WarehouseOneStatsSchema(SQLAlchemySchema):
     capacity = ma.fields.Method("get_capacity")
     total_price = ma.fields.Method("get_calc_total_price")
 
-    @staticmethod
-    def get_calc_total_price(obj):
-        return obj.calc_total_price()
-
-    @staticmethod
-    def get_capacity(obj):
-        return obj.calc_capacity()
-
 
 class WarehouseStatsSchema(ma.Schema):
     total_capacity = ma.fields.Int()
@@ -0,0 +1,324 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import cast, delete, func, inspect, literal, select, union_all
+from sqlalchemy.dialects.postgresql import insert
+
+from app.base import session
+from app.choices import InvoiceStatuses, InvoiceTypes, StockItemTypes
+from app.invoice.models import Invoice
+from app.product.models import ContainerLot, PartLot, ProductLot
+from app.warehouse.models import StockBalance
+
+STOCK_KINDS = {
+    "product": ProductLot,
+    "container": ContainerLot,
+    "part": PartLot,
+}
+
+# модель лота -> (тип позиции, колонка позиции)
+LOT_ITEMS = {
+    ProductLot: (StockItemTypes.PRODUCT, "product_id"),
+    ContainerLot: (StockItemTypes.CONTAINER, "container_id"),
+    PartLot: (StockItemTypes.PART, "part_id"),
+}
+
+
+def empty_stock():
+    res = {"capacity": 0, "total_price": 0}
+    for kind in STOCK_KINDS:
+        res[f"{kind}_quantity"] = 0
+        res[f"{kind}_price"] = 0
+    return res
+
+
+def get_warehouses_stock(warehouse_ids=None):
+    """
+    Остатки по складам: capacity (по опубликованным входящим накладным),
+    общая стоимость и количество/стоимость по каждому виду позиций
+    из stock_balance.
+    warehouse_ids=None - по всем складам.
+    Возвращает {warehouse_id: {...}}, склады без остатков получают нули.
+    """
+    if warehouse_ids is not None:
+        warehouse_ids = list(set(warehouse_ids))
+        if not warehouse_ids:
+            return {}
+    res = {}
+
+    def row(warehouse_id):
+        if warehouse_id not in res:
+            res[warehouse_id] = empty_stock()
+        return res[warehouse_id]
+
+    capacity_stmt = (
+        select(Invoice.warehouse_receiver_id, func.sum(Invoice.quantity))
+        .where(Invoice.status == InvoiceStatuses.PUBLISHED)
+        .group_by(Invoice.warehouse_receiver_id)
+    )
+    if warehouse_ids is not None:
+        capacity_stmt = capacity_stmt.where(
+            Invoice.warehouse_receiver_id.in_(warehouse_ids)
+        )
+    for warehouse_id, capacity in session.execute(capacity_stmt):
+        row(warehouse_id)["capacity"] = capacity or 0
+
+    stmt = select(
+        StockBalance.warehouse_id,
+        StockBalance.item_type,
+        func.sum(StockBalance.quantity),
+        func.sum(StockBalance.price_sum),
+    ).group_by(StockBalance.warehouse_id, StockBalance.item_type)
+    if warehouse_ids is not None:
+        stmt = stmt.where(StockBalance.warehouse_id.in_(warehouse_ids))
+    for warehouse_id, item_type, quantity, price in session.execute(stmt):
+        stock = row(warehouse_id)
+        stock[f"{item_type.value}_quantity"] = quantity or 0
+        stock[f"{item_type.value}_price"] = price or 0
+        stock["total_price"] += price or 0
+
+    if warehouse_ids is not None:
+        for warehouse_id in warehouse_ids:
+            row(warehouse_id)
+    return res
+
+
+def get_warehouse_stock(warehouse_id):
+    return get_warehouses_stock([warehouse_id]).get(warehouse_id, empty_stock())
+
+
+def get_item_stock(item_type, item_id, warehouse_id):
+    return (
+        session.query(StockBalance.quantity)
+        .filter_by(warehouse_id=warehouse_id, item_type=item_type, item_id=item_id)
+        .scalar()
+        or 0
+    )
+
+
+def _upsert_stock(stmt):
+    return stmt.on_conflict_do_update(
+        index_elements=["warehouse_id", "item_type", "item_id"],
+        set_={
+            "quantity": StockBalance.quantity + stmt.excluded.quantity,
+            "total_sum": StockBalance.total_sum + stmt.excluded.total_sum,
+            "price_sum": StockBalance.price_sum + stmt.excluded.price_sum,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+def apply_stock_deltas(connection, deltas):
+    """
+    deltas: {(warehouse_id, item_type, item_id): [quantity, total_sum, price_sum]}
+    """
+    now = datetime.now()
+    rows = [
+        {
+            "warehouse_id": warehouse_id,
+            "item_type": item_type,
+            "item_id": item_id,
+            "quantity": quantity,
+            "total_sum": total_sum,
+            "price_sum": price_sum,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for (
+            (warehouse_id, item_type, item_id),
+            (quantity, total_sum, price_sum),
+        ) in deltas.items()
+        if warehouse_id is not None and (quantity or total_sum or price_sum)
+    ]
+    if rows:
+        connection.execute(_upsert_stock(insert(StockBalance).values(rows)))
+
+
+def _lots_select(invoice_filter, item_type=None, item_ids=None):
+    selects = []
+    for LotModel, (lot_type, item_column) in LOT_ITEMS.items():
+        if item_type is not None and lot_type != item_type:
+            continue
+        item_id = getattr(LotModel, item_column)
+        stmt = (
+            select(
+                Invoice.warehouse_receiver_id.label("warehouse_id"),
+                cast(
+                    literal(lot_type, StockBalance.item_type.type),
+                    StockBalance.item_type.type,
+                ).label("item_type"),
+                item_id.label("item_id"),
+                LotModel.quantity.label("quantity"),
+                LotModel.total_sum.label("total_sum"),
+                (LotModel.price * LotModel.quantity).label("price_sum"),
+            )
+            .join(Invoice, LotModel.invoice_id == Invoice.id)
+            .where(
+                Invoice.warehouse_receiver_id.isnot(None),
+                # расход - списание со склада-отправителя, не остаток
+                Invoice.type != InvoiceTypes.EXPENSE,
+                *invoice_filter,
+            )
+        )
+        if item_ids is not None:
+            stmt = stmt.where(item_id.in_(item_ids))
+        selects.append(stmt)
+    return union_all(*selects).subquery()
+
+
+def _grouped_lots(lots, sign=1):
+    now = literal(datetime.now())
+    return select(
+        lots.c.warehouse_id,
+        lots.c.item_type,
+        lots.c.item_id,
+        sign * func.coalesce(func.sum(lots.c.quantity), 0),
+        sign * func.coalesce(func.sum(lots.c.total_sum), 0),
+        sign * func.coalesce(func.sum(lots.c.price_sum), 0),
+        now,
+        now,
+    ).group_by(lots.c.warehouse_id, lots.c.item_type, lots.c.item_id)
+
+
+STOCK_COLUMNS = [
+    "warehouse_id",
+    "item_type",
+    "item_id",
+    "quantity",
+    "total_sum",
+    "price_sum",
+    "created_at",
+    "updated_at",
+]
+
+
+def apply_invoices_to_stock(db_session, invoice_ids, sign=1):
+    """
+    Прибавить (sign=1) или вычесть (sign=-1) лоты накладных из остатков.
+    Для изменений статуса в обход ORM (массовые UPDATE).
+    """
+    if not invoice_ids:
+        return
+    lots = _lots_select([Invoice.id.in_(list(invoice_ids))])
+    stmt = insert(StockBalance).from_select(STOCK_COLUMNS, _grouped_lots(lots, sign))
+    db_session.execute(_upsert_stock(stmt))
+
+
+def refresh_stock_balance(db_session, item_type=None, item_ids=None):
+    """
+    Пересчитать остатки по лотам: всех позиций или только item_ids вида item_type.
+    """
+    if item_ids is not None:
+        item_ids = list(set(item_ids))
+        if not item_ids:
+            return
+    stmt = delete(StockBalance)
+    if item_type is not None:
+        stmt = stmt.where(StockBalance.item_type == item_type)
+    if item_ids is not None:
+        stmt = stmt.where(StockBalance.item_id.in_(item_ids))
+    db_session.execute(stmt)
+
+    lots = _lots_select(
+        [Invoice.status == InvoiceStatuses.PUBLISHED], item_type, item_ids
+    )
+    db_session.execute(
+        insert(StockBalance).from_select(STOCK_COLUMNS, _grouped_lots(lots))
+    )
+
+
+def create_stock_balance(db_session):
+    if db_session.query(StockBalance.id).first():
+        return
+    refresh_stock_balance(db_session)
+    db_session.commit()
+
+
+def _committed(obj, key):
+    hist = inspect(obj).attrs[key].load_history()
+    if hist.deleted:
+        return hist.deleted[0]
+    if hist.unchanged:
+        return hist.unchanged[0]
+    return None
+
+
+def _lot_contribution(lot, invoice, value):
+    """Ключ остатка и вклад лота, value(obj, key) - старое или текущее значение"""
+    if invoice is None:
+        return None
+    if value(invoice, "status") != InvoiceStatuses.PUBLISHED:
+        return None
+    if value(invoice, "type") == InvoiceTypes.EXPENSE:
+        return None
+    warehouse_id = value(invoice, "warehouse_receiver_id")
+    if warehouse_id is None:
+        return None
+    item_type, item_column = LOT_ITEMS[type(lot)]
+    quantity = value(lot, "quantity") or 0
+    total_sum = value(lot, "total_sum") or 0
+    price_sum = (value(lot, "price") or 0) * quantity
+    key = (warehouse_id, item_type, value(lot, item_column))
+    return key, [quantity, total_sum, price_sum]
+
+
+def collect_stock_changes(db_session):
+    """
+    before_flush: запомнить вклад изменяемых лотов до flush.
+    Лоты накладных, у которых меняется статус, тип или склад-получатель,
+    тоже пересчитываются.
+    """
+    lots = {}
+    deleted_invoices = set()
+
+    def add(lot):
+        if type(lot) in LOT_ITEMS and lot not in lots:
+            invoice_id = _committed(lot, "invoice_id")
+            invoice = db_session.get(Invoice, invoice_id) if invoice_id else None
+            lots[lot] = _lot_contribution(lot, invoice, _committed)
+
+    with db_session.no_autoflush:
+        for obj in db_session.new:
+            if type(obj) in LOT_ITEMS:
+                lots[obj] = None
+        for obj in list(db_session.dirty) + list(db_session.deleted):
+            if type(obj) in LOT_ITEMS:
+                add(obj)
+            elif isinstance(obj, Invoice) and obj not in db_session.new:
+                state = inspect(obj)
+                if not (
+                    obj in db_session.deleted
+                    or state.attrs.status.history.has_changes()
+                    or state.attrs.type.history.has_changes()
+                    or state.attrs.warehouse_receiver_id.history.has_changes()
+                ):
+                    continue
+                if obj in db_session.deleted:
+                    deleted_invoices.add(obj)
+                for lot in obj.product_lots + obj.container_lots + obj.part_lots:
+                    add(lot)
+    db_session.info["stock_lots"] = lots
+    db_session.info["stock_deleted_invoices"] = deleted_invoices
+
+
+def flush_stock_changes(db_session):
+    """after_flush: разница вкладов лотов до и после flush -> stock_balance"""
+    lots = db_session.info.pop("stock_lots", None)
+    deleted_invoices = db_session.info.pop("stock_deleted_invoices", set())
+    if not lots:
+        return
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for lot, old in lots.items():
+        if old:
+            key, values = old
+            deltas[key] = [delta - value for delta, value in zip(deltas[key], values)]
+        if lot in db_session.deleted:
+            continue
+        invoice = db_session.get(Invoice, lot.invoice_id) if lot.invoice_id else None
+        if invoice in deleted_invoices:
+            continue
+        new = _lot_contribution(lot, invoice, getattr)
+        if new:
+            key, values = new
+            deltas[key] = [delta + value for delta, value in zip(deltas[key], values)]
+    apply_stock_deltas(db_session.connection(), deltas)
@@ -0,0 +1,96 @@
+"""hot path indexes
+
+Revision ID: 0001_hot_path_indexes
+Revises:
+Create Date: 2026-10-17 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_hot_path_indexes"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя, таблица, колонки) - совпадают с объявлениями в моделях
+INDEXES = [
+    ("ix_invoice_type_status_created_at", "invoice", ["type", "status", "created_at"]),
+    ("ix_invoice_receiver_status", "invoice", ["warehouse_receiver_id", "status"]),
+    ("ix_invoice_sender_status", "invoice", ["warehouse_sender_id", "status"]),
+    ("ix_product_lot_product_created_at", "product_lot", ["product_id", "created_at"]),
+    ("ix_product_lot_invoice_id", "product_lot", ["invoice_id"]),
+    (
+        "ix_container_lot_container_created_at",
+        "container_lot",
+        ["container_id", "created_at"],
+    ),
+    ("ix_container_lot_invoice_id", "container_lot", ["invoice_id"]),
+    ("ix_part_lot_part_created_at", "part_lot", ["part_id", "created_at"]),
+    ("ix_part_lot_invoice_id", "part_lot", ["invoice_id"]),
+    ("ix_product_unit_product_lot_id", "product_unit", ["product_lot_id"]),
+    (
+        "ix_transaction_debit",
+        "transaction",
+        ["debit_content_type", "debit_object_id", "status"],
+    ),
+    (
+        "ix_transaction_credit",
+        "transaction",
+        ["credit_content_type", "credit_object_id", "status"],
+    ),
+    ("ix_transaction_created_at", "transaction", ["created_at"]),
+    ("ix_work_schedule_user_date", "work_schedule", ["user_id", "date"]),
+]
+
+# (имя, таблица, выражение) - GIN pg_trgm для ilike '%...%'
+TRIGRAM_INDEXES = [
+    ("ix_invoice_number_trgm", "invoice", "number::text"),
+    ("ix_product_name_trgm", "product", "name"),
+    ("ix_container_name_trgm", "container", "name"),
+    ("ix_part_name_trgm", "part", "name"),
+    ("ix_counterparty_name_trgm", "counterparty", "name"),
+    ("ix_user_first_name_trgm", "user", "first_name"),
+    ("ix_user_last_name_trgm", "user", "last_name"),
+    ("ix_transaction_debit_name_trgm", "transaction", "debit_name"),
+    ("ix_transaction_credit_name_trgm", "transaction", "credit_name"),
+]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    has_trgm = bind.scalar(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    )
+    if has_trgm:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CONCURRENTLY - без блокировки записи в таблицы на время построения
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+        if has_trgm:
+            for name, table, expression in TRIGRAM_INDEXES:
+                op.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "{table}" '
+                    f"USING gin (({expression}) gin_trgm_ops)"
+                )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in TRIGRAM_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        for name, table, _ in INDEXES:
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True, if_exists=True
+            )
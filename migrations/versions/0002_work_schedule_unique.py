@@ -0,0 +1,72 @@
+"""work schedule unique user/date
+
+Revision ID: 0002_work_schedule_unique
+Revises: 0001_hot_path_indexes
+Create Date: 2026-10-17 13:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_work_schedule_unique"
+down_revision: Union[str, None] = "0001_hot_path_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# дубли (user_id, date): остаётся строка с отмеченным статусом, иначе первая
+DUPLICATES = """
+    SELECT id, first_value(id) OVER w AS keep_id, row_number() OVER w AS n
+    FROM work_schedule
+    WINDOW w AS (PARTITION BY user_id, date ORDER BY status IS NULL, id)
+"""
+
+
+def upgrade() -> None:
+    op.execute(
+        f"""
+        UPDATE work_schedule_partner p SET work_schedule_id = d.keep_id
+        FROM ({DUPLICATES}) d
+        WHERE d.n > 1 AND p.work_schedule_id = d.id
+        """
+    )
+    op.execute(
+        f"""
+        DELETE FROM work_schedule w USING ({DUPLICATES}) d
+        WHERE d.n > 1 AND w.id = d.id
+        """
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "uq_work_schedule_user_date",
+            "work_schedule",
+            ["user_id", "date"],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_work_schedule_user_date",
+            table_name="work_schedule",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_work_schedule_user_date",
+            "work_schedule",
+            ["user_id", "date"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "uq_work_schedule_user_date",
+            table_name="work_schedule",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,44 @@
+"""transaction idempotency key
+
+Revision ID: 0003_transaction_idempotency_key
+Revises: 0002_work_schedule_unique
+Create Date: 2026-10-17 14:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_transaction_idempotency_key"
+down_revision: Union[str, None] = "0002_work_schedule_unique"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        'ALTER TABLE "transaction" '
+        "ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(100)"
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_transaction_idempotency_key",
+            "transaction",
+            ["idempotency_key"],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_transaction_idempotency_key",
+            table_name="transaction",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column("transaction", "idempotency_key")
@@ -0,0 +1,32 @@
+"""job heartbeat
+
+Revision ID: 0004_job_heartbeat
+Revises: 0003_transaction_idempotency_key
+Create Date: 2026-10-17 18:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_job_heartbeat"
+down_revision: Union[str, None] = "0003_transaction_idempotency_key"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE job "
+        "ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITHOUT TIME ZONE"
+    )
+    op.execute(
+        "UPDATE job SET heartbeat_at = started_at "
+        "WHERE heartbeat_at IS NULL AND status = 'RUNNING'"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("job", "heartbeat_at")
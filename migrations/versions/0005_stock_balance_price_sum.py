@@ -0,0 +1,33 @@
+"""stock balance price sum
+
+Revision ID: 0005_stock_balance_price_sum
+Revises: 0004_job_heartbeat
+Create Date: 2026-10-17 19:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy.orm import Session
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_stock_balance_price_sum"
+down_revision: Union[str, None] = "0004_job_heartbeat"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE stock_balance "
+        "ADD COLUMN IF NOT EXISTS price_sum DOUBLE PRECISION DEFAULT 0"
+    )
+    # остатки без лотов расходных накладных, total_sum - сумма total_sum лотов
+    from app.warehouse.utils import refresh_stock_balance
+
+    refresh_stock_balance(Session(bind=op.get_bind()))
+
+
+def downgrade() -> None:
+    op.drop_column("stock_balance", "price_sum")
@@ -0,0 +1,38 @@
+import time
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app.base import engine
+
+
+@pytest.fixture
+def measure():
+    """
+    with measure("name"): ... - время и число SQL-запросов блока;
+    результаты печатаются после теста (pytest -m benchmark -s).
+    """
+    results = {}
+
+    def count(*args):
+        results[current]["queries"] += 1
+
+    @contextmanager
+    def run(name):
+        nonlocal current
+        current = name
+        results[name] = {"queries": 0}
+        event.listen(engine, "before_cursor_execute", count)
+        start = time.perf_counter()
+        try:
+            yield results[name]
+        finally:
+            results[name]["seconds"] = time.perf_counter() - start
+            event.remove(engine, "before_cursor_execute", count)
+
+    current = None
+    yield run
+    print()
+    for name, result in results.items():
+        print(f"{name}: {result['seconds']:.3f}s, {result['queries']} queries")
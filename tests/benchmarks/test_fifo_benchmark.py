@@ -0,0 +1,144 @@
+"""
+Списание по FIFO: consume_fifo против прежнего calculate_fifo_cost - все
+лоты позиции через .all() и пересчёт накладной на каждый списанный лот.
+Производственный акт: 20 строк продукции, в составе 10 частей.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+
+from app.base import session
+from app.choices import InvoiceStatuses, InvoiceTypes, MeasumentTypes
+from app.invoice.models import Invoice
+from app.product.fifo import consume_fifo
+from app.product.models import Part, PartLot
+from app.warehouse.models import Warehouse
+
+pytestmark = pytest.mark.benchmark
+
+PARTS = 10
+# приходов, в каждом лот каждой части по LOT_QUANTITY
+RECEIPTS = 500
+LOT_QUANTITY = 10
+LINES = 20
+LINE_QUANTITY = 25
+
+
+def _available_quantity(invoice):
+    """Прежний Invoice.available_quantity - обход всех лотов накладной"""
+    return sum(
+        lot.quantity or 0
+        for lots in (invoice.product_lots, invoice.container_lots, invoice.part_lots)
+        for lot in lots
+    )
+
+
+def consume_all_lots(LotModel, filters, quantity):
+    remaining = quantity
+    lots = (
+        session.query(LotModel)
+        .join(Invoice, Invoice.id == LotModel.invoice_id)
+        .filter(*filters, LotModel.quantity > 0)
+        .order_by(LotModel.created_at)
+        .all()
+    )
+    for lot in lots:
+        taken = min(lot.quantity, remaining)
+        lot.quantity -= taken
+        lot.calc_total_sum()
+        lot.invoice.quantity = _available_quantity(lot.invoice)
+        remaining -= taken
+        if remaining == 0:
+            break
+    return remaining
+
+
+def seed(db_session, user_id):
+    warehouse = Warehouse(name="W1", address="A1")
+    db_session.add(warehouse)
+    db_session.flush()
+    parts = db_session.scalars(
+        insert(Part).returning(Part.id),
+        [
+            {
+                "name": f"P{n}",
+                "description": "d",
+                "measurement": MeasumentTypes.QUANTITY,
+            }
+            for n in range(PARTS)
+        ],
+    ).all()
+    start = datetime.now() - timedelta(days=RECEIPTS)
+    invoices = db_session.scalars(
+        insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True),
+        [
+            {
+                "number": n,
+                "type": InvoiceTypes.INVOICE,
+                "status": InvoiceStatuses.PUBLISHED,
+                "warehouse_receiver_id": warehouse.id,
+                "user_id": user_id,
+                "quantity": PARTS * LOT_QUANTITY,
+                "created_at": start + timedelta(days=n),
+            }
+            for n in range(RECEIPTS)
+        ],
+    ).all()
+    db_session.execute(
+        insert(PartLot),
+        [
+            {
+                "part_id": part,
+                "invoice_id": invoice,
+                "quantity": LOT_QUANTITY,
+                "const_quantity": LOT_QUANTITY,
+                "price": 1 + n % 5,
+                "total_sum": LOT_QUANTITY * (1 + n % 5),
+                "created_at": start + timedelta(days=n),
+            }
+            for n, invoice in enumerate(invoices)
+            for part in parts
+        ],
+    )
+    db_session.commit()
+    return warehouse.id, parts
+
+
+def produce(db_session, consume, warehouse, parts):
+    for _ in range(LINES):
+        for part in parts:
+            consume(
+                PartLot,
+                [PartLot.part_id == part, Invoice.warehouse_receiver_id == warehouse],
+                LINE_QUANTITY,
+            )
+    db_session.commit()
+
+
+def state(db_session):
+    db_session.expire_all()
+    return {
+        "lots": db_session.execute(
+            select(PartLot.id, PartLot.quantity, PartLot.total_sum).order_by(PartLot.id)
+        ).all(),
+        "invoices": db_session.execute(
+            select(Invoice.id, Invoice.quantity).order_by(Invoice.id)
+        ).all(),
+    }
+
+
+def test_fifo_consumption(db_session, user, reset_db, measure):
+    user_id = user.id
+    stock = seed(db_session, user_id)
+    with measure("before: all lots per call") as before:
+        produce(db_session, consume_all_lots, *stock)
+    expected = state(db_session)
+
+    reset_db()
+    stock = seed(db_session, user_id)
+    with measure("consume_fifo") as after:
+        produce(db_session, lambda *args: consume_fifo(*args)[1], *stock)
+    assert state(db_session) == expected
+    assert after["queries"] < before["queries"]
@@ -0,0 +1,215 @@
+"""
+Единицы продукции: take_units и save_pending_units против прежней записи
+по объекту на маркировку. 100 000 единиц в производстве, перемещение
+половины и расход четверти.
+"""
+
+from collections import defaultdict
+
+import pytest
+from sqlalchemy import func, select
+
+from app.choices import InvoiceStatuses, InvoiceTypes, MeasumentTypes
+from app.invoice.models import Invoice
+from app.product.models import Product, ProductLot, ProductUnit
+from app.product.units import take_units
+from app.warehouse.models import StockBalance, Warehouse
+
+pytestmark = pytest.mark.benchmark
+
+UNITS = 100_000
+MARKUPS = [f"u{n:07d}" for n in range(UNITS)]
+TRANSFERRED = MARKUPS[: UNITS // 2]
+EXPENDED = TRANSFERRED[: UNITS // 4]
+PRICE = 1.5
+
+
+def produce_per_unit(db_session, invoice_id, product_id, markups):
+    """Прежнее производство: ProductUnit на каждую маркировку"""
+    lot = ProductLot(
+        invoice_id=invoice_id,
+        product_id=product_id,
+        quantity=len(markups),
+        price=PRICE,
+        units=[ProductUnit(id=markup) for markup in markups],
+    )
+    lot.calc_total_sum()
+    db_session.add(lot)
+    db_session.commit()
+
+
+def produce(db_session, invoice_id, product_id, markups):
+    lot = ProductLot(
+        invoice_id=invoice_id,
+        product_id=product_id,
+        quantity=len(markups),
+        price=PRICE,
+        pending_markups=markups,
+    )
+    lot.calc_total_sum()
+    db_session.add(lot)
+    db_session.commit()
+
+
+def transfer_per_unit(db_session, invoice_id, markups):
+    """
+    Прежнее перемещение: все единицы через IN, перенос по одной с уменьшением
+    прежнего лота на каждую (количество нового лота - число единиц, без
+    исправленной ошибки с суммой количеств прежних лотов).
+    """
+    with db_session.no_autoflush:
+        units = db_session.scalars(
+            select(ProductUnit).where(ProductUnit.id.in_(markups))
+        ).all()
+        grouped_units = defaultdict(list)
+        for unit in units:
+            key = (unit.product_lot.product_id, unit.product_lot.price)
+            grouped_units[key].append(unit)
+        for (product_id, price), units in grouped_units.items():
+            new_lot = ProductLot(
+                invoice_id=invoice_id,
+                quantity=len(units),
+                price=price,
+                product_id=product_id,
+            )
+            new_lot.calc_total_sum()
+            db_session.add(new_lot)
+            for unit in units:
+                old_lot = unit.product_lot
+                old_lot.quantity -= 1
+                old_lot.calc_total_sum()
+                unit.product_lot = new_lot
+    db_session.commit()
+
+
+def expense_per_unit(db_session, invoice_id, markups):
+    """Прежний расход: запрос единицы на каждую маркировку"""
+    expended = defaultdict(list)
+    with db_session.no_autoflush:
+        for markup in markups:
+            unit = db_session.get(ProductUnit, markup)
+            if unit:
+                old_lot = unit.product_lot
+                old_lot.quantity -= 1
+                old_lot.calc_total_sum()
+                expended[(old_lot.product_id, old_lot.price)].append(unit)
+    for (product_id, price), units in expended.items():
+        lot = ProductLot(
+            invoice_id=invoice_id,
+            product_id=product_id,
+            quantity=len(units),
+            price=price,
+            units=units,
+        )
+        lot.calc_total_sum()
+        db_session.add(lot)
+    db_session.commit()
+
+
+def move_units(db_session, invoice_id, markups):
+    """Перемещение и расход: take_units и перенос единиц одним UPDATE"""
+    grouped_units = defaultdict(list)
+    for old_lot, unit_ids in take_units(db_session, markups).items():
+        grouped_units[(old_lot.product_id, old_lot.price)].extend(unit_ids)
+    for (product_id, price), unit_ids in grouped_units.items():
+        new_lot = ProductLot(
+            invoice_id=invoice_id,
+            quantity=len(unit_ids),
+            price=price,
+            product_id=product_id,
+            moved_units=unit_ids,
+        )
+        new_lot.calc_total_sum()
+        db_session.add(new_lot)
+    db_session.commit()
+
+
+def seed(db_session, user_id):
+    """Склады, продукт и накладные производства, перемещения и расхода"""
+    w1, w2 = Warehouse(name="W1", address="A1"), Warehouse(name="W2", address="A2")
+    product = Product(name="PR1", description="d", measurement=MeasumentTypes.QUANTITY)
+    db_session.add_all([w1, w2, product])
+    db_session.flush()
+    invoices = {
+        invoice_type: Invoice(
+            number=number,
+            type=invoice_type,
+            status=InvoiceStatuses.PUBLISHED,
+            user_id=user_id,
+            warehouse_sender_id=sender,
+            warehouse_receiver_id=receiver,
+        )
+        for number, (invoice_type, sender, receiver) in enumerate(
+            [
+                (InvoiceTypes.PRODUCTION, None, w1.id),
+                (InvoiceTypes.TRANSFER, w1.id, w2.id),
+                (InvoiceTypes.EXPENSE, w2.id, None),
+            ]
+        )
+    }
+    db_session.add_all(invoices.values())
+    db_session.commit()
+    return product.id, {key: invoice.id for key, invoice in invoices.items()}
+
+
+def state(db_session):
+    db_session.expire_all()
+    return {
+        "lots": db_session.execute(
+            select(
+                ProductLot.id,
+                ProductLot.invoice_id,
+                ProductLot.quantity,
+                ProductLot.total_sum,
+            ).order_by(ProductLot.id)
+        ).all(),
+        "units": db_session.execute(
+            select(ProductUnit.product_lot_id, func.count())
+            .group_by(ProductUnit.product_lot_id)
+            .order_by(ProductUnit.product_lot_id)
+        ).all(),
+        "stock_balance": db_session.execute(
+            select(
+                StockBalance.warehouse_id,
+                StockBalance.quantity,
+                StockBalance.total_sum,
+            ).order_by(StockBalance.warehouse_id)
+        ).all(),
+    }
+
+
+def run(db_session, measure, label, produce, transfer, expense, user_id):
+    product_id, invoices = seed(db_session, user_id)
+    results = []
+    for step, invoice_type, call, args in (
+        ("production", InvoiceTypes.PRODUCTION, produce, (product_id, MARKUPS)),
+        ("transfer", InvoiceTypes.TRANSFER, transfer, (TRANSFERRED,)),
+        ("expense", InvoiceTypes.EXPENSE, expense, (EXPENDED,)),
+    ):
+        with measure(f"{label}: {step} of {len(args[-1])}") as result:
+            call(db_session, invoices[invoice_type], *args)
+        results.append(result)
+    return results
+
+
+def test_product_units(db_session, user, reset_db, measure):
+    user_id = user.id
+    before = run(
+        db_session,
+        measure,
+        "before: per unit",
+        produce_per_unit,
+        transfer_per_unit,
+        expense_per_unit,
+        user_id,
+    )
+    expected = state(db_session)
+    assert expected["units"] == [(1, UNITS // 2), (2, UNITS // 4), (3, UNITS // 4)]
+
+    reset_db()
+    after = run(db_session, measure, "bulk", produce, move_units, move_units, user_id)
+    assert state(db_session) == expected
+    # единицы производства в обоих случаях пишутся пачками INSERT
+    assert after[0]["seconds"] < before[0]["seconds"]
+    for old, new in zip(before[1:], after[1:]):
+        assert new["queries"] < old["queries"]
@@ -0,0 +1,123 @@
+"""
+Рабочие дни всех сотрудников на дату: create_work_schedules (один
+INSERT ... SELECT) против прежнего цикла задачи working_schedule -
+график и проверка существующего дня отдельными запросами на сотрудника.
+10 000 сотрудников; у части нет графика, у части день уже создан.
+"""
+
+from datetime import date, time
+
+import pytest
+from sqlalchemy import insert, select
+
+from app.choices import DaysOfWeekShort, WorkScheduleStatus
+from app.user.models import User, WorkingDay, WorkSchedule
+from app.user.utils import create_work_schedules
+
+pytestmark = pytest.mark.benchmark
+
+STAFF = 10_000
+# суббота: у части сотрудников выходной по графику
+RUN_DATE = date(2024, 9, 7)
+
+
+def create_working_days_per_user(db_session, run_date):
+    """Прежняя create_working_days_for_all_staff_task"""
+    all_staff = db_session.query(User).all()
+    day_enum = DaysOfWeekShort[run_date.strftime("%a").upper()]
+
+    created = 0
+    for user in all_staff:
+        working_day = (
+            db_session.query(WorkingDay)
+            .filter(WorkingDay.user == user, WorkingDay.day_of_week == day_enum)
+            .first()
+        )
+        existing_schedule = (
+            db_session.query(WorkSchedule)
+            .filter(WorkSchedule.user == user, WorkSchedule.date == run_date)
+            .first()
+        )
+        data = {}
+        if not existing_schedule:
+            if working_day:
+                data["working_day_id"] = working_day.id
+                data["status"] = (
+                    WorkScheduleStatus.DAY_OFF
+                    if not working_day.is_working_day
+                    else None
+                )
+            db_session.add(
+                WorkSchedule(
+                    user=user,
+                    date=run_date,
+                    working_day_id=data.get("working_day_id"),
+                    status=data.get("status"),
+                )
+            )
+            created += 1
+    return created
+
+
+def seed(db_session):
+    users = db_session.scalars(
+        insert(User).returning(User.id, sort_by_parameter_order=True),
+        [
+            {"username": f"staff{n}", "first_name": "F", "last_name": f"L{n}"}
+            for n in range(STAFF)
+        ],
+    ).all()
+    # у каждого пятого нет графика, у остальных суббота - выходной у половины
+    db_session.execute(
+        insert(WorkingDay),
+        [
+            {
+                "user_id": user_id,
+                "day_of_week": day,
+                "is_working_day": day != DaysOfWeekShort.SAT or n % 2 == 0,
+                "start_time": time(9),
+                "end_time": time(18),
+            }
+            for n, user_id in enumerate(users)
+            if n % 5
+            for day in DaysOfWeekShort
+        ],
+    )
+    # день уже создан у каждого десятого
+    db_session.execute(
+        insert(WorkSchedule),
+        [{"user_id": user_id, "date": RUN_DATE} for user_id in users[::10]],
+    )
+    db_session.commit()
+
+
+def state(db_session):
+    db_session.expire_all()
+    return db_session.execute(
+        select(
+            WorkSchedule.user_id,
+            WorkSchedule.date,
+            WorkSchedule.working_day_id,
+            WorkSchedule.status,
+        ).order_by(WorkSchedule.user_id, WorkSchedule.date)
+    ).all()
+
+
+def test_create_work_schedules(db_session, user, reset_db, measure):
+    seed(db_session)
+    with measure("before: per-user queries") as before:
+        created = create_working_days_per_user(db_session, RUN_DATE)
+        db_session.commit()
+    expected = state(db_session)
+
+    reset_db()
+    seed(db_session)
+    with measure("create_work_schedules") as after:
+        assert create_work_schedules(db_session, RUN_DATE) == created
+        db_session.commit()
+    assert state(db_session) == expected
+    assert after["queries"] < before["queries"]
+
+    with measure("create_work_schedules, repeat run"):
+        assert create_work_schedules(db_session, RUN_DATE) == 0
+        db_session.commit()
@@ -0,0 +1,236 @@
+"""
+Отмена накладных (cancel_invoice) против прежнего алгоритма - по единице
+продукции и по лоту контейнеров и частей: остатки должны совпасть.
+"""
+
+import pytest
+from sqlalchemy import text
+
+from app.base import session
+from app.choices import InvoiceStatuses, InvoiceTypes
+from app.invoice.models import Invoice
+from app.product.models import Container, Part
+
+MARKUPS = [f"k{n:05d}" for n in range(300)]
+
+
+def cancel_invoice_per_unit(invoice_id):
+    """Прежняя cancel_invoice - эталон"""
+    invoice = Invoice.get_by_id(invoice_id)
+
+    if invoice.status == InvoiceStatuses.PUBLISHED:
+        if invoice.type == InvoiceTypes.EXPENSE:
+            for product_lot in invoice.product_lots:
+                for unit in product_lot.units:
+                    old_lot = unit.product_lot
+                    old_lot.quantity += 1
+                    old_lot.calc_total_sum()
+                    unit.product_lot = old_lot
+            for container_lot in invoice.container_lots:
+                Container.increase(container_lot.container_id, container_lot.quantity)
+            for part_lot in invoice.part_lots:
+                Part.increase(part_lot.part_id, part_lot.quantity)
+        if invoice.type in [InvoiceTypes.INVOICE, InvoiceTypes.PRODUCTION]:
+            for product_lot in invoice.product_lots:
+                for unit in product_lot.units:
+                    old_lot = unit.product_lot
+                    old_lot.quantity -= 1
+                    old_lot.calc_total_sum()
+                    unit.product_lot = old_lot
+            for container_lot in invoice.container_lots:
+                Container.decrease(
+                    container_lot.container_id,
+                    container_lot.quantity,
+                    warehouse_id=invoice.warehouse_sender_id,
+                )
+            for part_lot in invoice.part_lots:
+                Part.decrease(
+                    part_lot.part_id,
+                    part_lot.quantity,
+                    invoice.warehouse_sender_id,
+                )
+        if invoice.type == InvoiceTypes.TRANSFER:
+            invoice.warehouse_sender_id, invoice.warehouse_receiver_id = (
+                invoice.warehouse_receiver_id,
+                invoice.warehouse_sender_id,
+            )
+
+    invoice.status = InvoiceStatuses.CANCELED
+    session.commit()
+
+
+def _post(client, url, json):
+    response = client.post(url, json=json)
+    assert response.status_code in (200, 201), response.json
+    return response.json
+
+
+def create_invoices(client):
+    """Приход, производство, перемещение и расход с единицами, контейнерами и частями"""
+    w1 = _post(client, "/warehouse/", {"name": "W1", "address": "A1", "user_ids": []})
+    w2 = _post(client, "/warehouse/", {"name": "W2", "address": "A2", "user_ids": []})
+    w1, w2 = w1["id"], w2["id"]
+    part = _post(
+        client, "/part/", {"name": "P1", "description": "d", "measurement": "q"}
+    )["id"]
+    container = _post(
+        client,
+        "/container/",
+        {"name": "C1", "description": "d", "measurement": "q", "parts_r": []},
+    )["id"]
+    product = _post(
+        client,
+        "/product/",
+        {
+            "name": "PR1",
+            "description": "d",
+            "measurement": "q",
+            "containers_r": [{"container_id": container, "quantity": 1}],
+            "parts_r": [{"part_id": part, "quantity": 2}],
+        },
+    )["id"]
+    _post(
+        client,
+        "/invoice/",
+        {
+            "number": 1,
+            "warehouse_receiver_id": w1,
+            "container_lots": [{"container_id": container, "quantity": 10, "price": 5}],
+            "part_lots": [{"part_id": part, "quantity": 30, "price": 2}],
+        },
+    )
+    receipt = _post(
+        client,
+        "/invoice/",
+        {
+            "number": 2,
+            "warehouse_receiver_id": w1,
+            "container_lots": [
+                {"container_id": container, "quantity": 400, "price": 4}
+            ],
+            "part_lots": [{"part_id": part, "quantity": 900, "price": 1}],
+        },
+    )["id"]
+    production = _post(
+        client,
+        "/production/",
+        {
+            "number": 3,
+            "warehouse_receiver_id": w1,
+            "product_lots": [
+                {"product_id": product, "quantity": 200, "markups": MARKUPS[:200]},
+                {"product_id": product, "quantity": 100, "markups": MARKUPS[200:]},
+            ],
+            "container_lots": [{"container_id": container, "quantity": 7}],
+        },
+    )["id"]
+    transfer = _post(
+        client,
+        "/transfer/",
+        {
+            "number": 4,
+            "warehouse_sender_id": w1,
+            "warehouse_receiver_id": w2,
+            "product_unit_markups": MARKUPS[:120],
+            "part_ids": [{"part_id": part, "quantity": 15}],
+        },
+    )["id"]
+    expense = _post(
+        client,
+        "/expense/",
+        {
+            "number": 5,
+            "warehouse_sender_id": w1,
+            "product_unit_markups": [
+                {"markup": markup, "with_container": True}
+                for markup in MARKUPS[150:260]
+            ],
+            "container_ids": [{"container_id": container, "quantity": 30}],
+            "part_ids": [{"part_id": part, "quantity": 40}],
+        },
+    )["id"]
+    return [
+        ("expense", expense),
+        ("transfer", transfer),
+        ("production", production),
+        ("invoice", receipt),
+    ]
+
+
+def _rows(db_session, sql):
+    return [
+        tuple(round(value, 4) if isinstance(value, float) else value for value in row)
+        for row in db_session.execute(text(sql))
+    ]
+
+
+def snapshot(db_session):
+    db_session.expire_all()
+    return {
+        "product_lot": _rows(
+            db_session,
+            "SELECT id, invoice_id, quantity, total_sum FROM product_lot ORDER BY id",
+        ),
+        "container_lot": _rows(
+            db_session,
+            "SELECT id, invoice_id, quantity, total_sum FROM container_lot ORDER BY id",
+        ),
+        "part_lot": _rows(
+            db_session,
+            "SELECT id, invoice_id, quantity, total_sum FROM part_lot ORDER BY id",
+        ),
+        "units": _rows(
+            db_session,
+            "SELECT product_lot_id, count(*) FROM product_unit GROUP BY 1 ORDER BY 1",
+        ),
+        "stock_balance": _rows(
+            db_session,
+            "SELECT warehouse_id, item_type, item_id, quantity, total_sum "
+            "FROM stock_balance ORDER BY 1, 2, 3",
+        ),
+        # прежний алгоритм создавал долг на каждый лот, новый - на позицию
+        "debt": _rows(
+            db_session,
+            "SELECT type, type_id, sum(quantity) FROM debt GROUP BY 1, 2 ORDER BY 1, 2",
+        ),
+        "invoice": _rows(
+            db_session,
+            "SELECT id, status, warehouse_sender_id, warehouse_receiver_id, "
+            "quantity, price FROM invoice ORDER BY id",
+        ),
+    }
+
+
+def cancel_all(client, db_session):
+    """Отмена накладных по очереди, снимок остатков после каждой"""
+    snapshots = {}
+    for kind, invoice_id in create_invoices(client):
+        response = client.post(f"/{kind}/{invoice_id}/cancel/")
+        assert response.status_code == 200, response.json
+        snapshots[kind] = snapshot(db_session)
+    return snapshots
+
+
+@pytest.fixture
+def expected(client, db_session, monkeypatch, reset_db):
+    """Снимки прежнего алгоритма; база после них очищается"""
+    with monkeypatch.context() as patch:
+        patch.setattr("app.invoice.cancel_invoice", cancel_invoice_per_unit)
+        snapshots = cancel_all(client, db_session)
+    reset_db()
+    return snapshots
+
+
+def test_cancel_matches_per_unit_algorithm(expected, client, db_session):
+    actual = cancel_all(client, db_session)
+    for kind, state in expected.items():
+        assert actual[kind] == state, kind
+
+
+def test_cancel_changes_stock(expected):
+    """Сценарий не вырожден: отмены двигают лоты, единицы, остатки и долги"""
+    states = list(expected.values())
+    assert states[-1]["units"]
+    assert states[-1]["debt"]
+    for before, after in zip(states, states[1:]):
+        assert before["stock_balance"] != after["stock_balance"]
@@ -0,0 +1,219 @@
+"""
+Планы горячих запросов (EXPLAIN) используют индексы миграции
+0001_hot_path_indexes. Seq scan выключен: индекс должен быть применим
+независимо от объёма данных в тестовой базе.
+"""
+
+import importlib.util
+from datetime import date
+from pathlib import Path
+
+import pytest
+from sqlalchemy import select, text
+
+from app.choices import InvoiceStatuses, InvoiceTypes, TransactionStatuses
+from app.finance.models import Transaction
+from app.invoice.models import Invoice
+from app.product.models import ContainerLot, PartLot, Product, ProductLot, ProductUnit
+from app.user.models import User, WorkSchedule
+from app.utils.filters import contains, date_between
+
+VERSIONS = Path(__file__).parents[1] / "migrations" / "versions"
+
+
+def _load_migration(name):
+    spec = importlib.util.spec_from_file_location(name, VERSIONS / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+HOT_PATH_INDEXES = _load_migration("0001_hot_path_indexes")
+# 0002_work_schedule_unique заменила индекс уникальным
+REPLACED = {"ix_work_schedule_user_date": "uq_work_schedule_user_date"}
+INDEXES = {REPLACED.get(name, name) for name, _, _ in HOT_PATH_INDEXES.INDEXES}
+TRIGRAM_INDEXES = {name for name, _, _ in HOT_PATH_INDEXES.TRIGRAM_INDEXES}
+
+TODAY = date.today()
+
+# (название, запрос, индекс, который запрос должен использовать)
+HOT_QUERIES = [
+    (
+        "invoice list",
+        select(Invoice.id)
+        .where(
+            Invoice.type == InvoiceTypes.INVOICE,
+            Invoice.status == InvoiceStatuses.PUBLISHED,
+            date_between(Invoice.created_at, TODAY),
+        )
+        .order_by(Invoice.created_at.desc()),
+        "ix_invoice_type_status_created_at",
+    ),
+    (
+        "warehouse incoming",
+        select(Invoice.id).where(
+            Invoice.warehouse_receiver_id == 1,
+            Invoice.status == InvoiceStatuses.PUBLISHED,
+        ),
+        "ix_invoice_receiver_status",
+    ),
+    (
+        "warehouse outgoing",
+        select(Invoice.id).where(
+            Invoice.warehouse_sender_id == 1,
+            Invoice.status == InvoiceStatuses.PUBLISHED,
+        ),
+        "ix_invoice_sender_status",
+    ),
+    (
+        "product fifo",
+        select(ProductLot.id)
+        .where(ProductLot.product_id == 1)
+        .order_by(ProductLot.created_at),
+        "ix_product_lot_product_created_at",
+    ),
+    (
+        "container fifo",
+        select(ContainerLot.id)
+        .where(ContainerLot.container_id == 1)
+        .order_by(ContainerLot.created_at),
+        "ix_container_lot_container_created_at",
+    ),
+    (
+        "part fifo",
+        select(PartLot.id).where(PartLot.part_id == 1).order_by(PartLot.created_at),
+        "ix_part_lot_part_created_at",
+    ),
+    (
+        "invoice product lots",
+        select(ProductLot.id).where(ProductLot.invoice_id == 1),
+        "ix_product_lot_invoice_id",
+    ),
+    (
+        "invoice container lots",
+        select(ContainerLot.id).where(ContainerLot.invoice_id == 1),
+        "ix_container_lot_invoice_id",
+    ),
+    (
+        "invoice part lots",
+        select(PartLot.id).where(PartLot.invoice_id == 1),
+        "ix_part_lot_invoice_id",
+    ),
+    (
+        "lot units",
+        select(ProductUnit.id).where(ProductUnit.product_lot_id == 1),
+        "ix_product_unit_product_lot_id",
+    ),
+    (
+        "account incomes",
+        select(Transaction.id).where(
+            Transaction.debit_content_type == "CashRegister",
+            Transaction.debit_object_id == 1,
+            Transaction.status == TransactionStatuses.PUBLISHED,
+        ),
+        "ix_transaction_debit",
+    ),
+    (
+        "account expenses",
+        select(Transaction.id).where(
+            Transaction.credit_content_type == "CashRegister",
+            Transaction.credit_object_id == 1,
+            Transaction.status == TransactionStatuses.PUBLISHED,
+        ),
+        "ix_transaction_credit",
+    ),
+    (
+        "transactions by date",
+        select(Transaction.id).where(date_between(Transaction.created_at, TODAY)),
+        "ix_transaction_created_at",
+    ),
+    (
+        "work schedule",
+        select(WorkSchedule.id).where(
+            WorkSchedule.user_id == 1, WorkSchedule.date == TODAY
+        ),
+        "uq_work_schedule_user_date",
+    ),
+]
+
+# поиск ilike '%...%' - только при установленном pg_trgm
+TRIGRAM_QUERIES = [
+    (
+        "invoice number search",
+        select(Invoice.id).where(contains(Invoice.number, "12")),
+        "ix_invoice_number_trgm",
+    ),
+    (
+        "product name search",
+        select(Product.id).where(contains(Product.name, "abc")),
+        "ix_product_name_trgm",
+    ),
+    (
+        "user name search",
+        select(User.id).where(contains(User.last_name, "abc")),
+        "ix_user_last_name_trgm",
+    ),
+    (
+        "transaction search",
+        select(Transaction.id).where(contains(Transaction.debit_name, "abc")),
+        "ix_transaction_debit_name_trgm",
+    ),
+]
+
+
+def explain(connection, stmt):
+    compiled = stmt.compile(
+        dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+    )
+    rows = connection.exec_driver_sql(f"EXPLAIN {compiled}")
+    return "\n".join(row[0] for row in rows)
+
+
+@pytest.fixture
+def connection(db_session):
+    connection = db_session.connection()
+    connection.execute(text("SET LOCAL enable_seqscan = off"))
+    return connection
+
+
+def _has_trgm(connection):
+    return bool(
+        connection.scalar(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+    )
+
+
+def test_hot_queries_cover_migration_indexes():
+    assert {index for _, _, index in HOT_QUERIES} == INDEXES
+    assert {index for _, _, index in TRIGRAM_QUERIES} <= TRIGRAM_INDEXES
+
+
+def test_models_declare_migration_indexes(connection):
+    """Тестовая база создаётся по моделям - в ней должны быть индексы миграции"""
+    indexes = set(
+        connection.scalars(
+            text("SELECT indexname FROM pg_indexes WHERE schemaname = 'public'")
+        )
+    )
+    assert INDEXES <= indexes
+    if _has_trgm(connection):
+        assert TRIGRAM_INDEXES <= indexes
+
+
+@pytest.mark.parametrize(
+    "stmt, index", [query[1:] for query in HOT_QUERIES], ids=[q[0] for q in HOT_QUERIES]
+)
+def test_hot_query_uses_index(connection, stmt, index):
+    plan = explain(connection, stmt)
+    assert index in plan, plan
+
+
+@pytest.mark.parametrize(
+    "stmt, index",
+    [query[1:] for query in TRIGRAM_QUERIES],
+    ids=[q[0] for q in TRIGRAM_QUERIES],
+)
+def test_search_query_uses_trigram_index(connection, stmt, index):
+    if not _has_trgm(connection):
+        pytest.skip("pg_trgm is not installed")
+    plan = explain(connection, stmt)
+    assert index in plan, plan
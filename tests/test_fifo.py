@@ -0,0 +1,75 @@
+"""Списание по FIFO (consume_fifo) при параллельных списаниях"""
+
+import threading
+
+import pytest
+from sqlalchemy import select
+
+from app.base import session
+from app.product.models import Debt, Part, PartLot
+
+
+@pytest.fixture
+def part_lots(client, db_session):
+    """Два прихода части на склад: 10 шт. по 1 и 10 шт. по 2"""
+    warehouse = client.post(
+        "/warehouse/", json={"name": "W1", "address": "A1", "user_ids": []}
+    ).json["id"]
+    part = client.post(
+        "/part/", json={"name": "P1", "description": "d", "measurement": "q"}
+    ).json["id"]
+    for number, price in ((1, 1), (2, 2)):
+        response = client.post(
+            "/invoice/",
+            json={
+                "number": number,
+                "warehouse_receiver_id": warehouse,
+                "part_lots": [{"part_id": part, "quantity": 10, "price": price}],
+            },
+        )
+        assert response.status_code == 201, response.json
+    return part, warehouse
+
+
+def _decrease_in_thread(part, warehouse, quantity, done):
+    def run():
+        try:
+            Part.decrease(part, quantity, warehouse)
+            session.commit()
+        finally:
+            session.remove()
+            done.set()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+@pytest.mark.parametrize(
+    "first, second, expected",
+    [
+        # второе списание ждёт первое и берёт остаток самого раннего лота
+        (6, 6, [0, 8]),
+        # все лоты заняты первым списанием - это не недостача
+        (15, 5, [0, 0]),
+    ],
+)
+def test_concurrent_consumers_keep_fifo_order(
+    part_lots, db_session, first, second, expected
+):
+    part, warehouse = part_lots
+    Part.decrease(part, first, warehouse)
+
+    done = threading.Event()
+    thread = _decrease_in_thread(part, warehouse, second, done)
+    # лоты заблокированы этой транзакцией - второй воркер ждёт
+    assert not done.wait(0.5)
+    db_session.commit()
+    thread.join(10)
+    assert done.is_set()
+
+    db_session.expire_all()
+    assert db_session.scalars(
+        select(PartLot.quantity).order_by(PartLot.created_at, PartLot.id)
+    ).all() == expected
+    assert db_session.scalars(select(Debt)).all() == []
@@ -0,0 +1,98 @@
+"""Журнал проводок, открытый по данным, которые были до него (open_ledger)"""
+
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app.finance.ledger import account_balance, open_ledger, reconcile_balances
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def accounts(client, db_session):
+    """
+    Контрагент с начальным остатком 100 и транзакция на 40 в кассу,
+    созданные до журнала: контрагент - 10 дней назад, транзакция - 5.
+    """
+    response = client.post(
+        "/finance/payment_type",
+        json={"name": "Cash", "has_commissioner": False, "fiscal": "OFF"},
+    )
+    assert response.status_code < 300, response.json
+    cash_register = client.post(
+        "/finance/cash_register",
+        json={"name": "CR1", "payment_types_ids": [response.json["id"]]},
+    ).json["id"]
+    counterparty = client.post(
+        "/finance/counterparty",
+        json={"name": "CP1", "code": "1234", "status": "ON", "balance": 100},
+    ).json["id"]
+    response = client.post(
+        "/finance/transaction",
+        json={
+            "number_transaction": "1",
+            "credit_category": "Counterparty",
+            "credit_object_id": counterparty,
+            "debit_category": "CashRegister",
+            "debit_object_id": cash_register,
+            "amount": 40,
+            "status": "PUBLISHED",
+        },
+    )
+    assert response.status_code < 300, response.json
+
+    opened = datetime.combine(TODAY - timedelta(days=10), time(12))
+    posted = datetime.combine(TODAY - timedelta(days=5), time(12))
+    db_session.execute(text("TRUNCATE ledger_entry, balance_snapshot"))
+    db_session.execute(
+        text("UPDATE counterparty SET created_at = :at"), {"at": opened}
+    )
+    db_session.execute(
+        text("UPDATE cash_register SET created_at = :at"), {"at": opened}
+    )
+    db_session.execute(
+        text('UPDATE "transaction" SET created_at = :at, published_date = :at'),
+        {"at": posted},
+    )
+    db_session.commit()
+    open_ledger(db_session)
+    db_session.commit()
+    return {"Counterparty": counterparty, "CashRegister": cash_register}
+
+
+def _at(days_ago):
+    return datetime.combine(TODAY - timedelta(days=days_ago), time())
+
+
+def test_historical_balance_includes_opening_balance(accounts, db_session):
+    counterparty = accounts["Counterparty"]
+    assert reconcile_balances(db_session) == []
+    assert account_balance(db_session, "Counterparty", counterparty, _at(20)) == 0
+    assert account_balance(db_session, "Counterparty", counterparty, _at(7)) == 100
+    assert account_balance(db_session, "Counterparty", counterparty, _at(3)) == 60
+    assert account_balance(db_session, "Counterparty", counterparty) == 60
+    cash_register = accounts["CashRegister"]
+    assert account_balance(db_session, "CashRegister", cash_register, _at(7)) == 0
+    assert account_balance(db_session, "CashRegister", cash_register, _at(3)) == 40
+
+
+def test_turnover_balances_before_ledger_opened(accounts, client):
+    def turnover(start, end):
+        response = client.get(
+            "/finance/turnover",
+            query_string={
+                "account_type": "Counterparty",
+                "account_id": accounts["Counterparty"],
+                "start_date": (TODAY - timedelta(days=start)).isoformat(),
+                "end_date": (TODAY - timedelta(days=end)).isoformat(),
+            },
+        )
+        assert response.status_code == 200, response.json
+        return response.json
+
+    before = turnover(8, 7)
+    assert (before["opening_balance"], before["closing_balance"]) == (100, 100)
+    period = turnover(6, 4)
+    assert (period["opening_balance"], period["closing_balance"]) == (100, 60)
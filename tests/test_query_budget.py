@@ -0,0 +1,197 @@
+"""
+Эндпоинты с query_budget при QUERY_BUDGET_CHECK: списки и карточки
+на нескольких строках укладываются в бюджет SQL-запросов.
+"""
+
+import pytest
+
+from app.user.models import User
+
+
+def _post(client, url, json):
+    response = client.post(url, json=json)
+    assert response.status_code in (200, 201), response.json
+    return response.json
+
+
+def create_invoices(client):
+    """По несколько накладных каждого вида с лотами, единицами и частями"""
+    w1, w2 = (
+        _post(client, "/warehouse/", {"name": n, "address": n, "user_ids": []})["id"]
+        for n in ("W1", "W2")
+    )
+    parts = [
+        _post(
+            client, "/part/", {"name": f"P{n}", "description": "d", "measurement": "q"}
+        )["id"]
+        for n in range(2)
+    ]
+    container = _post(
+        client,
+        "/container/",
+        {"name": "C1", "description": "d", "measurement": "q", "parts_r": []},
+    )["id"]
+    product = _post(
+        client,
+        "/product/",
+        {
+            "name": "PR1",
+            "description": "d",
+            "measurement": "q",
+            "containers_r": [{"container_id": container, "quantity": 1}],
+            "parts_r": [{"part_id": part, "quantity": 1} for part in parts],
+        },
+    )["id"]
+    for number in range(3):
+        invoice = _post(
+            client,
+            "/invoice/",
+            {
+                "number": number,
+                "warehouse_receiver_id": w1,
+                "container_lots": [
+                    {"container_id": container, "quantity": 20, "price": 5}
+                ],
+                "part_lots": [
+                    {"part_id": part, "quantity": 20, "price": 2} for part in parts
+                ],
+            },
+        )["id"]
+    markups = [f"q{n}" for n in range(12)]
+    for number, lot_markups in ((10, markups[:6]), (11, markups[6:])):
+        production = _post(
+            client,
+            "/production/",
+            {
+                "number": number,
+                "warehouse_receiver_id": w1,
+                "product_lots": [
+                    {"product_id": product, "quantity": 3, "markups": lot_markups[:3]},
+                    {"product_id": product, "quantity": 3, "markups": lot_markups[3:]},
+                ],
+            },
+        )["id"]
+    for number, unit_markups in ((20, markups[:2]), (21, markups[2:4])):
+        transfer = _post(
+            client,
+            "/transfer/",
+            {
+                "number": number,
+                "warehouse_sender_id": w1,
+                "warehouse_receiver_id": w2,
+                "product_unit_markups": unit_markups,
+                "part_ids": [{"part_id": part, "quantity": 2} for part in parts],
+            },
+        )["id"]
+    for number, unit_markups in ((30, markups[6:8]), (31, markups[8:10])):
+        expense = _post(
+            client,
+            "/expense/",
+            {
+                "number": number,
+                "warehouse_sender_id": w1,
+                "product_unit_markups": [
+                    {"markup": markup, "with_container": True}
+                    for markup in unit_markups
+                ],
+                "part_ids": [{"part_id": part, "quantity": 1} for part in parts],
+            },
+        )["id"]
+    return {
+        "warehouse": w1,
+        "invoice": invoice,
+        "production": production,
+        "transfer": transfer,
+        "expense": expense,
+    }
+
+
+def create_groups(client, db_session):
+    """Группы отдела, в каждой по два сотрудника с зарплатой"""
+    department = _post(client, "/user/department", {"name": "D1"})["id"]
+    for n in range(3):
+        users = []
+        for m in range(2):
+            user = User(username=f"u{n}{m}", first_name="F", last_name="L")
+            user.set_password("test")
+            db_session.add(user)
+            db_session.flush()
+            user.create_salary_abd_permission_obj()
+            users.append(user.id)
+        db_session.commit()
+        _post(
+            client,
+            "/user/group",
+            {"name": f"G{n}", "department_id": department, "user_ids": users},
+        )
+    return {"department": department}
+
+
+def create_transaction(client):
+    payment_type = _post(
+        client,
+        "/finance/payment_type",
+        {"name": "Cash", "has_commissioner": False, "fiscal": "OFF"},
+    )["id"]
+    cash_register = _post(
+        client,
+        "/finance/cash_register",
+        {"name": "CR1", "payment_types_ids": [payment_type]},
+    )["id"]
+    counterparty = _post(
+        client,
+        "/finance/counterparty",
+        {"name": "CP1", "code": "1234", "status": "ON", "balance": 100},
+    )["id"]
+    transaction = _post(
+        client,
+        "/finance/transaction",
+        {
+            "number_transaction": "1",
+            "credit_category": "Counterparty",
+            "credit_object_id": counterparty,
+            "debit_category": "CashRegister",
+            "debit_object_id": cash_register,
+            "amount": 40,
+            "status": "PUBLISHED",
+        },
+    )["id"]
+    return {"transaction": transaction}
+
+
+@pytest.fixture
+def objects(client, db_session):
+    return {
+        **create_invoices(client),
+        **create_groups(client, db_session),
+        **create_transaction(client),
+    }
+
+
+@pytest.fixture
+def budget_check(app, monkeypatch):
+    monkeypatch.setitem(app.config, "QUERY_BUDGET_CHECK", True)
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/invoice/",
+        "/invoice/{invoice}/",
+        "/production/",
+        "/production/{production}/",
+        "/transfer/",
+        "/transfer/{transfer}/",
+        "/expense/",
+        "/expense/{expense}/",
+        "/warehouse/{warehouse}/history/",
+        "/user/group",
+        "/user/group?department_id={department}",
+        "/finance/transaction/{transaction}",
+    ],
+)
+def test_endpoint_within_query_budget(objects, budget_check, client, url):
+    response = client.get(url.format(**objects))
+    assert response.status_code == 200, response.json
+    data = response.json.get("data", response.json)
+    assert data
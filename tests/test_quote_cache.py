@@ -0,0 +1,47 @@
+"""Кэш стоимостей FIFO (quote_fifo_costs): размер и просроченные записи"""
+
+from collections import OrderedDict
+
+import pytest
+
+from app.product import fifo
+
+TTL = fifo.QUOTE_CACHE_TTL
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = OrderedDict()
+    monkeypatch.setattr(fifo, "_quote_cache", cache)
+    monkeypatch.setattr(fifo, "QUOTE_CACHE_SIZE", 2)
+    monkeypatch.setattr(fifo, "QUOTE_CACHE_QUANTITIES", 2)
+    return cache
+
+
+def test_least_recently_read_item_is_evicted(cache):
+    fifo._cache_quote(("part_lot", 1), 5, 10.0, 0)
+    fifo._cache_quote(("part_lot", 2), 5, 20.0, 0)
+    assert fifo._cached_quote(("part_lot", 1), 5, 1) == 10.0
+    fifo._cache_quote(("part_lot", 3), 5, 30.0, 1)
+    assert list(cache) == [("part_lot", 1), ("part_lot", 3)]
+    assert fifo._cached_quote(("part_lot", 2), 5, 1) is None
+
+
+def test_quantities_per_item_are_capped(cache):
+    for quantity in range(1, 4):
+        fifo._cache_quote(("part_lot", 1), quantity, 0.0, 0)
+    assert list(cache[("part_lot", 1)]) == [2, 3]
+    # нулевая стоимость - тоже попадание в кэш
+    assert fifo._cached_quote(("part_lot", 1), 3, 1) == 0.0
+
+
+def test_expired_quote_is_removed_on_read(cache):
+    fifo._cache_quote(("part_lot", 1), 5, 10.0, 0)
+    assert fifo._cached_quote(("part_lot", 1), 5, TTL) is None
+    assert cache == {}
+
+
+def test_expired_quotes_are_removed_on_write(cache):
+    fifo._cache_quote(("part_lot", 1), 5, 10.0, 0)
+    fifo._cache_quote(("part_lot", 1), 6, 12.0, TTL)
+    assert list(cache[("part_lot", 1)]) == [6]
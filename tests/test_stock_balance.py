@@ -0,0 +1,167 @@
+"""Остатки stock_balance против пересчёта по лотам"""
+
+import pytest
+from sqlalchemy import func, select
+
+from app.choices import InvoiceStatuses, InvoiceTypes
+from app.invoice.models import Invoice
+from app.product.models import ProductLot, ProductUnit
+from app.warehouse.models import StockBalance, Warehouse
+from app.warehouse.utils import refresh_stock_balance
+
+
+def product_warehouse_stats(db_session, product_id):
+    """Прежний /product/<id>/warehouse-stats/ - сумма лотов по складам"""
+    published = [
+        Invoice.warehouse_receiver_id.isnot(None),
+        Invoice.status == InvoiceStatuses.PUBLISHED,
+        Invoice.type != InvoiceTypes.EXPENSE,
+        ProductLot.quantity != 0,
+        ProductLot.product_id == product_id,
+    ]
+    total_quantity, total_sum = db_session.execute(
+        select(func.sum(ProductLot.quantity), func.sum(ProductLot.total_sum))
+        .join(Invoice, ProductLot.invoice_id == Invoice.id)
+        .where(*published)
+    ).one()
+    warehouse_data = db_session.execute(
+        select(
+            Warehouse.id,
+            Warehouse.name,
+            func.sum(ProductLot.quantity),
+            func.sum(ProductLot.total_sum),
+        )
+        .join(Invoice, ProductLot.invoice_id == Invoice.id)
+        .join(Warehouse, Invoice.warehouse_receiver_id == Warehouse.id)
+        .where(*published)
+        .group_by(Warehouse.id, Warehouse.name)
+        .order_by(Warehouse.id)
+    ).all()
+    return {
+        "total_quantity": total_quantity,
+        "total_sum": total_sum,
+        "warehouse_data": [
+            {
+                "warehouse_id": warehouse_id,
+                "warehouse_name": name,
+                "total_quantity": quantity,
+                "total_sum": total,
+            }
+            for warehouse_id, name, quantity, total in warehouse_data
+        ],
+    }
+
+
+@pytest.fixture
+def stock(client, db_session):
+    """
+    Производство продукции, её перемещение и расход. Расходная накладная
+    с указанным складом-получателем и лот с total_sum, не равной
+    price * quantity.
+    """
+    warehouses = [
+        client.post(
+            "/warehouse/", json={"name": name, "address": name, "user_ids": []}
+        ).json["id"]
+        for name in ("W1", "W2")
+    ]
+    product = client.post(
+        "/product/",
+        json={
+            "name": "PR1",
+            "description": "d",
+            "measurement": "q",
+            "containers_r": [],
+            "parts_r": [],
+        },
+    ).json["id"]
+    markups = [f"m{n}" for n in range(6)]
+    response = client.post(
+        "/production/",
+        json={
+            "number": 1,
+            "warehouse_receiver_id": warehouses[0],
+            "product_lots": [
+                {"product_id": product, "quantity": 6, "markups": markups}
+            ],
+        },
+    )
+    assert response.status_code == 201, response.json
+    response = client.post(
+        "/transfer/",
+        json={
+            "number": 2,
+            "warehouse_sender_id": warehouses[0],
+            "warehouse_receiver_id": warehouses[1],
+            "product_unit_markups": markups[:2],
+        },
+    )
+    assert response.status_code == 201, response.json
+    response = client.post(
+        "/expense/",
+        json={
+            "number": 3,
+            "warehouse_sender_id": warehouses[0],
+            "product_unit_markups": [{"markup": markups[2], "with_container": False}],
+        },
+    )
+    assert response.status_code == 201, response.json
+    expense = db_session.get(Invoice, response.json["id"])
+    expense.warehouse_receiver_id = warehouses[1]
+    lot = db_session.scalars(
+        select(ProductLot)
+        .join(ProductUnit, ProductUnit.product_lot_id == ProductLot.id)
+        .where(ProductUnit.id == markups[3])
+    ).one()
+    lot.price = 3.0
+    lot.total_sum = 10.0
+    db_session.commit()
+    return {"product": product, "warehouses": warehouses}
+
+
+def test_product_warehouse_stats_match_lots(stock, client, db_session):
+    product = stock["product"]
+    response = client.get(f"/product/{product}/warehouse-stats/")
+    assert response.status_code == 200, response.json
+    assert response.json == product_warehouse_stats(db_session, product)
+
+
+def test_warehouse_price_is_price_times_quantity(stock, client, db_session):
+    """Стоимость склада, как и прежде, - price * quantity лотов"""
+    for warehouse in stock["warehouses"]:
+        response = client.get(f"/warehouse/{warehouse}/")
+        assert response.status_code == 200, response.json
+        price = db_session.execute(
+            select(func.sum(ProductLot.price * ProductLot.quantity))
+            .join(Invoice, ProductLot.invoice_id == Invoice.id)
+            .where(
+                Invoice.warehouse_receiver_id == warehouse,
+                Invoice.status == InvoiceStatuses.PUBLISHED,
+                Invoice.type != InvoiceTypes.EXPENSE,
+            )
+        ).scalar()
+        assert response.json["product_total_price"] == price
+
+
+def test_incremental_stock_matches_rebuild(stock, db_session):
+    def balances():
+        return [
+            (*key, quantity, round(total_sum, 6), round(price_sum, 6))
+            for *key, quantity, total_sum, price_sum in db_session.execute(
+                select(
+                    StockBalance.warehouse_id,
+                    StockBalance.item_type,
+                    StockBalance.item_id,
+                    StockBalance.quantity,
+                    StockBalance.total_sum,
+                    StockBalance.price_sum,
+                )
+                .where(StockBalance.quantity != 0)
+                .order_by(StockBalance.warehouse_id, StockBalance.item_id)
+            )
+        ]
+
+    incremental = balances()
+    assert incremental
+    refresh_stock_balance(db_session)
+    assert balances() == incremental
@@ -0,0 +1,16 @@
+import argparse
+
+from app import create_app
+from app.job.utils import run_worker
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воркер очереди фоновых задач")
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=2, help="задач одновременно"
+    )
+    args = parser.parse_args()
+    run_worker(app, concurrency=args.concurrency)